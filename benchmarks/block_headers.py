@@ -0,0 +1,89 @@
+"""Compare the memory used by and the pickled size of the branch of a backward sync
+kept as web3.py blocks and as block headers.
+
+Run with `python benchmarks/block_headers.py [number_of_blocks]`.
+"""
+import pickle
+import sys
+import tracemalloc
+
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+from monitor.block_fetcher import BlockFetcherStateV1, BlockFetcherStateV2
+from monitor.blocks import get_block_headers
+
+FIRST_STEP = 320_000_000
+SIGNATURE = (
+    "0x1c7ee7a7f1a2d9f8d8d8c5f05bfbb56c3bd1be8b5b05c8e5e5c1a8b0f7fa7a5"
+    "b3b1b9a7b6c1b1d2e0ea3c4f0d4b6a3e0b0d1d2e5e6f7a8b9c0d1e2f3a4b5c6d700"
+)
+
+
+def make_block(number):
+    """make a block with the fields returned by web3.py for an empty block"""
+    return AttributeDict(
+        {
+            "number": number,
+            "hash": HexBytes(number.to_bytes(32, "big")),
+            "parentHash": HexBytes((number - 1).to_bytes(32, "big")),
+            "sha3Uncles": HexBytes(b"\x11" * 32),
+            "logsBloom": HexBytes(b"\x00" * 256),
+            "transactionsRoot": HexBytes(b"\x22" * 32),
+            "stateRoot": HexBytes(b"\x33" * 32),
+            "receiptsRoot": HexBytes(b"\x44" * 32),
+            "miner": "0x" + "55" * 20,
+            "author": "0x" + "55" * 20,
+            "difficulty": 2 ** 128 - 2,
+            "totalDifficulty": number * (2 ** 128 - 2),
+            "extraData": HexBytes(b"\xde\x83\x02\x05\x0e\x8fOpenEthereum"),
+            "size": 580,
+            "gasLimit": 8_000_000,
+            "gasUsed": 0,
+            "timestamp": (FIRST_STEP + number) * 5,
+            "transactions": [],
+            "uncles": [],
+            "step": str(FIRST_STEP + number),
+            "sealFields": [
+                HexBytes(b"\x84" + (FIRST_STEP + number).to_bytes(4, "big")),
+                HexBytes(b"\xb8\x41" + bytes.fromhex(SIGNATURE[2:])),
+            ],
+            "signature": SIGNATURE,
+        }
+    )
+
+
+def measure(name, state):
+    pickled_state = pickle.dumps(state)
+    # unpickling creates a copy of the state that shares no objects with others
+    tracemalloc.start()
+    state_copy = pickle.loads(pickled_state)  # noqa: F841
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name}: {memory / 1024:.0f} KiB in memory, "
+        f"{len(pickled_state) / 1024:.0f} KiB pickled"
+    )
+
+
+def main(number_of_blocks=1000):
+    # the branch of a backward sync is ordered from the newest to the oldest block
+    head, *branch = [make_block(1)] + [
+        make_block(number) for number in range(number_of_blocks + 1, 1, -1)
+    ]
+    measure(
+        f"{number_of_blocks} blocks",
+        BlockFetcherStateV1(head=head, current_branch=branch, initial_blocknr=1),
+    )
+    measure(
+        f"{number_of_blocks} block headers",
+        BlockFetcherStateV2(
+            head=get_block_headers([head])[0],
+            current_branch=get_block_headers(branch),
+            initial_blocknr=1,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,53 @@
+"""Measure how many validator set lookups per second the primary oracle answers for
+a given number of epochs, both for heights within the same epoch and for random heights.
+
+Run with `python benchmarks/primary_oracle_lookup.py [number_of_epochs]`.
+"""
+import random
+import sys
+import timeit
+
+from monitor.validators import Epoch, PrimaryOracle
+
+EPOCH_LENGTH = 100
+NUMBER_OF_LOOKUPS = 100000
+
+
+def make_primary_oracle(number_of_epochs):
+    primary_oracle = PrimaryOracle()
+    for index in range(number_of_epochs):
+        validators = [index.to_bytes(20, "big")]
+        primary_oracle.add_epoch(Epoch(index * EPOCH_LENGTH, validators, 0))
+    primary_oracle.max_height = number_of_epochs * EPOCH_LENGTH - 1
+    return primary_oracle
+
+
+def main(number_of_epochs=5000):
+    primary_oracle = make_primary_oracle(number_of_epochs)
+    max_height = primary_oracle.max_height
+
+    # heights of consecutive missed steps are mostly within the same epoch
+    consecutive_heights = [
+        max_height - index // 20 for index in range(NUMBER_OF_LOOKUPS)
+    ]
+    random_heights = [random.randint(0, max_height) for _ in range(NUMBER_OF_LOOKUPS)]
+
+    for name, heights in [
+        ("consecutive", consecutive_heights),
+        ("random", random_heights),
+    ]:
+        duration = min(
+            timeit.repeat(
+                lambda: [primary_oracle.get_validators(height) for height in heights],
+                number=1,
+                repeat=3,
+            )
+        )
+        print(
+            f"{name} heights, {number_of_epochs} epochs: "
+            f"{NUMBER_OF_LOOKUPS / duration:.0f} lookups per second"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,64 @@
+"""Measure how many block proposers can be recovered per second with each
+available secp256k1 backend.
+
+Run with `python benchmarks/recover_proposers.py [number_of_blocks]`.
+"""
+import sys
+import timeit
+
+from eth_keys import keys
+from eth_utils.toolz import merge
+from web3.datastructures import AttributeDict
+
+from monitor.blocks import (
+    calculate_block_signature,
+    get_available_ecc_backends,
+    get_proposer,
+    set_ecc_backend,
+)
+
+TEMPLATE_BLOCK = AttributeDict(
+    {
+        "parentHash": b"\x11" * 32,
+        "sha3Uncles": b"\x22" * 32,
+        "author": b"\x33" * 20,
+        "stateRoot": b"\x44" * 32,
+        "transactionsRoot": b"\x55" * 32,
+        "receiptsRoot": b"\x66" * 32,
+        "logsBloom": b"\x00" * 256,
+        "difficulty": 1,
+        "number": 1,
+        "gasLimit": 8000000,
+        "gasUsed": 0,
+        "timestamp": 1000,
+        "step": 200,
+        "extraData": b"",
+        "sealFields": [b"", b""],
+    }
+)
+
+
+def make_blocks(number_of_blocks):
+    blocks = []
+    for number in range(1, number_of_blocks + 1):
+        block = AttributeDict(merge(TEMPLATE_BLOCK, {"number": number}))
+        private_key = keys.PrivateKey(number.to_bytes(32, "big"))
+        signature = calculate_block_signature(block, private_key)
+        blocks.append(AttributeDict(merge(block, {"signature": signature.to_bytes()})))
+    return blocks
+
+
+def main(number_of_blocks=200):
+    blocks = make_blocks(number_of_blocks)
+    for backend in get_available_ecc_backends():
+        set_ecc_backend(backend)
+        duration = min(
+            timeit.repeat(
+                lambda: [get_proposer(block) for block in blocks], number=1, repeat=3
+            )
+        )
+        print(f"{backend}: {number_of_blocks / duration:.0f} recoveries per second")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""Measure the latency of committing a cycle to the database for several SQLite
+profiles.
+
+Each cycle inserts a branch of blocks and stores a pickled state, like the monitor
+does. Run with `python benchmarks/sqlite_commit_latency.py [cycles] [blocks_per_cycle]`.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from web3.datastructures import AttributeDict
+
+from monitor.db import BlockDB, SQLiteProfile, apply_sqlite_profile
+
+PROFILES = {
+    "default SQLite": None,
+    "wal, full": SQLiteProfile(synchronous="full"),
+    "wal, normal": SQLiteProfile(synchronous="normal"),
+    "wal, off": SQLiteProfile(synchronous="off"),
+}
+
+
+def make_branch(start, length):
+    # enriched blocks, so that no proposers have to be recovered
+    return [
+        AttributeDict(
+            {
+                "hash": number.to_bytes(32, "big"),
+                "parentHash": (number - 1).to_bytes(32, "big"),
+                "number": number,
+                "step": number,
+                "canonicalizedBlock": None,
+                "bareHash": None,
+                "proposer": (number % 20).to_bytes(20, "big"),
+            }
+        )
+        for number in range(start, start + length)
+    ]
+
+
+def measure_commit_latencies(profile, cycles, blocks_per_cycle):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            "sqlite:////{}".format(os.path.join(directory, "benchmark.db"))
+        )
+        if profile is not None:
+            apply_sqlite_profile(engine, profile)
+        db = BlockDB(engine)
+
+        latencies = []
+        for cycle in range(cycles):
+            with db.persistent_session() as session:
+                db.insert_branch(
+                    make_branch(1 + cycle * blocks_per_cycle, blocks_per_cycle)
+                )
+                db.store_pickled("state", list(range(1000)))
+                start = time.perf_counter()
+                session.commit()
+                latencies.append(time.perf_counter() - start)
+        engine.dispose()
+        return latencies
+
+
+def main(cycles=200, blocks_per_cycle=10):
+    for name, profile in PROFILES.items():
+        latencies = measure_commit_latencies(profile, cycles, blocks_per_cycle)
+        print(
+            f"{name}: median commit latency "
+            f"{statistics.median(latencies) * 1000:.2f} ms, "
+            f"max {max(latencies) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
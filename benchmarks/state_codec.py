@@ -0,0 +1,82 @@
+"""Compare the size and the time to store and load states with pickle and with the
+binary state codecs.
+
+Run with `python benchmarks/state_codec.py [number_of_skip_ranges]`.
+"""
+import pickle
+import sys
+import timeit
+
+from monitor.block_fetcher import BlockFetcherStateV3
+from monitor.blocks import BlockHeader
+from monitor.codec import decode_block_header, encode_block_header
+from monitor.skip_reporter import SkippedStepRange, SkipReporterStateV3
+from monitor.state_codec import BLOCK_FETCHER_STATE_CODEC, SKIP_REPORTER_STATE_CODEC
+
+FIRST_STEP = 320_000_000
+
+
+def make_block_header(number):
+    return BlockHeader(
+        number=number,
+        hash=number.to_bytes(32, "big"),
+        parentHash=(number - 1).to_bytes(32, "big"),
+        step=FIRST_STEP + number,
+        timestamp=(FIRST_STEP + number) * 5,
+        proposer=b"\x55" * 20,
+    )
+
+
+def make_skip_reporter_state(number_of_skip_ranges):
+    return SkipReporterStateV3(
+        latest_step=FIRST_STEP + 3 * number_of_skip_ranges,
+        open_skipped_step_ranges=[
+            SkippedStepRange(FIRST_STEP + 3 * index, FIRST_STEP + 3 * index + 1, index)
+            for index in range(number_of_skip_ranges)
+        ],
+    )
+
+
+def measure(name, state, encode, decode):
+    formats = [
+        ("pickle", pickle.dumps, pickle.loads),
+        ("codec", encode, decode),
+    ]
+    for format_name, encode_format, decode_format in formats:
+        data = encode_format(state)
+        store_duration = min(
+            timeit.repeat(lambda: encode_format(state), number=1, repeat=5)
+        )
+        load_duration = min(
+            timeit.repeat(lambda: decode_format(data), number=1, repeat=5)
+        )
+        print(
+            f"{name}, {format_name}: {len(data)} bytes, "
+            f"store {store_duration * 1000:.2f} ms, load {load_duration * 1000:.2f} ms"
+        )
+
+
+def main(number_of_skip_ranges=1000):
+    measure(
+        "block fetcher state",
+        BlockFetcherStateV3(head=make_block_header(1), initial_blocknr=1),
+        BLOCK_FETCHER_STATE_CODEC.encode,
+        BLOCK_FETCHER_STATE_CODEC.decode,
+    )
+    # each block of the branch synced backwards is staged in its own row
+    measure(
+        "staged block header",
+        make_block_header(1),
+        encode_block_header,
+        decode_block_header,
+    )
+    measure(
+        f"skip reporter state with {number_of_skip_ranges} open ranges",
+        make_skip_reporter_state(number_of_skip_ranges),
+        SKIP_REPORTER_STATE_CODEC.encode,
+        SKIP_REPORTER_STATE_CODEC.decode,
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
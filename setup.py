@@ -15,11 +15,16 @@ setup(
         "sqlalchemy",
         "contract-deploy-tools",
         "attrs",
+        "websockets",
     ],
-    extras_require={"test": ["eth-tester[py-evm]", "pytest"]},
+    extras_require={
+        "test": ["eth-tester[py-evm]", "pytest"],
+        "fast-ecc": ["coincurve"],
+    },
     entry_points={
         "console_scripts": [
             "tlbc-monitor=monitor.main:main",
+            "tlbc-monitor-skips=monitor.main:query_skips",
             "report-validator=report_validator.cli:main",
         ]
     },
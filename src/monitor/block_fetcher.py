@@ -1,20 +1,58 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import functools
 import itertools
-from typing import NamedTuple, List
+from typing import NamedTuple, List, Optional
 
 import structlog
+from eth_utils.toolz import partition_all
 from web3.datastructures import AttributeDict
 
 from monitor.db import AlreadyExists
 from monitor import blocksel
+from monitor.blocks import BlockHeader, get_block_header, get_block_headers
+from monitor.chain_head import ChainHead, fetch_chain_head
+from monitor.rpc_batch import get_blocks
 
 
 class BlockFetcherStateV1(NamedTuple):
-    head: AttributeDict
+    head: Optional[AttributeDict]
     current_branch: List[AttributeDict]
     initial_blocknr: int
 
 
+class BlockFetcherStateV2(NamedTuple):
+    head: Optional[BlockHeader]
+    current_branch: List[BlockHeader]
+    initial_blocknr: int
+
+
+def upgrade_v1_to_v2(v1: BlockFetcherStateV1):
+    return BlockFetcherStateV2(
+        head=None if v1.head is None else get_block_header(v1.head),
+        current_branch=get_block_headers(v1.current_branch),
+        initial_blocknr=v1.initial_blocknr,
+    )
+
+
+class BlockFetcherStateV3(NamedTuple):
+    """The branch that is synced backwards is staged in the db instead of the state"""
+
+    head: Optional[BlockHeader]
+    initial_blocknr: int
+
+
+def upgrade_v2_to_v3(v2: BlockFetcherStateV2):
+    """drop the branch of the state, it has to be staged in the db before"""
+    return BlockFetcherStateV3(head=v2.head, initial_blocknr=v2.initial_blocknr)
+
+
+# maximum number of blocks of a completely fetched branch that are inserted per call of
+# `fetch_and_insert_new_blocks`, the rest stays staged for the following calls
+BRANCH_INSERT_CHUNK_SIZE = 1000
+
+
 class FetchingForkWithUnkownBaseError(Exception):
     pass
 
@@ -26,20 +64,61 @@ def format_block(block):
     return f"Block({block.number}, {dt.isoformat()})"
 
 
+def prefetch(function, arguments, *, concurrency):
+    """yield `function(argument)` for each of the arguments in order
+
+    Up to `concurrency` calls are kept in progress in worker threads ahead of the
+    result that is yielded next.
+    """
+    if concurrency <= 1:
+        yield from map(function, arguments)
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures: deque = deque()
+        for argument in arguments:
+            futures.append(executor.submit(function, argument))
+            if len(futures) >= concurrency:
+                yield futures.popleft().result()
+
+        while futures:
+            yield futures.popleft().result()
+
+
 class BlockFetcher:
-    """Fetches new blocks via a web3 interface and passes them on to a set of callbacks."""
+    """Fetches new blocks via a web3 interface and passes them on to a set of callbacks.
+
+    Fetched blocks are converted to headers, so that only the fields needed after the
+    recovery of their proposer are kept in memory and in the state.
+    """
 
     logger = structlog.get_logger("monitor.block_fetcher")
 
     def __init__(
-        self, state, w3, db, max_reorg_depth=1000, initial_block_resolver=None
+        self,
+        state,
+        w3,
+        db,
+        max_reorg_depth=1000,
+        initial_block_resolver=None,
+        rpc_batch_size=1,
+        max_concurrent_requests=1,
+        executor=None,
     ):
         self.w3 = w3
         self.db = db
         self.max_reorg_depth = max_reorg_depth
+        self.rpc_batch_size = rpc_batch_size
+        self.max_concurrent_requests = max_concurrent_requests
+        self.executor = executor
 
         self.head = state.head
-        self.current_branch = state.current_branch
+        # the branch that is synced backwards is staged in the db, only its length and
+        # its oldest block are kept to continue fetching it
+        self.branch_length = db.get_branch_length()
+        self._branch_tail: Optional[BlockHeader] = (
+            db.get_branch_block(self.branch_length - 1) if self.branch_length else None
+        )
 
         self.report_callbacks = []
         self.initial_block_resolver = initial_block_resolver
@@ -54,19 +133,15 @@ class BlockFetcher:
 
     @classmethod
     def get_fresh_state(cls):
-        return BlockFetcherStateV1(head=None, current_branch=[], initial_blocknr=0)
+        return BlockFetcherStateV3(head=None, initial_blocknr=0)
 
     @property
     def state(self):
-        return BlockFetcherStateV1(
-            head=self.head,
-            current_branch=self.current_branch,
-            initial_blocknr=self.initial_blocknr,
-        )
+        return BlockFetcherStateV3(head=self.head, initial_blocknr=self.initial_blocknr)
 
     @property
     def _backwards_sync_in_progress(self) -> bool:
-        return len(self.current_branch) > 0
+        return self.branch_length > 0
 
     def register_report_callback(self, callback):
         self.report_callbacks.append(callback)
@@ -87,10 +162,12 @@ class BlockFetcher:
                 "Tried to insert branch from a fork with unknown parent block."
             )
 
+        # recover the proposers only once, the db and the callbacks share the result
+        blocks = get_block_headers(blocks, self.executor)
+
         try:
             self.db.insert_branch(blocks)
             self.head = blocks[-1]
-            self.current_branch.clear()
         except AlreadyExists:
             raise ValueError("Tried to insert already known block")
 
@@ -119,34 +196,40 @@ class BlockFetcher:
         self._insert_branch([block])
 
     def fetch_and_insert_new_blocks(
-        self, *, max_number_of_blocks=5000, max_block_height: int = None
+        self,
+        *,
+        max_number_of_blocks=5000,
+        max_block_height: int = None,
+        chain_head: Optional[ChainHead] = None,
     ):
         """Fetches up to `max_number_of_blocks` blocks and only up to blocknumber `max_block_height` (inclusive)
         and updates the internal state
             If a full branch is fetched it also inserts the new blocks
             Returns the number of fetched blocks
+            `chain_head` is the snapshot of the chain head to sync to, it is fetched if not given
         """
         if max_number_of_blocks < 1:
             return 0
 
+        if chain_head is None:
+            chain_head = fetch_chain_head(self.w3)
+        if max_block_height is None:
+            max_block_height = chain_head.number
+
         number_of_synced_blocks = 0
 
         if self.db.is_empty():
             self._insert_first_block()
             number_of_synced_blocks += 1
 
-        self._save_sync_start()
+        self._save_sync_start(chain_head)
 
         if not self._backwards_sync_in_progress:
-            forward_sync_target = self.fetch_forward_sync_target()
+            forward_sync_target = self.fetch_forward_sync_target(chain_head)
 
             # sync forwards at most up until the forward sync target, but no more than
             # max_number_of_blocks
-            max_forward_block_height = (
-                forward_sync_target
-                if max_block_height is None
-                else min(forward_sync_target, max_block_height)
-            )
+            max_forward_block_height = min(forward_sync_target, max_block_height)
             max_forward_sync_blocks = max(
                 0, max_number_of_blocks - number_of_synced_blocks
             )
@@ -167,8 +250,8 @@ class BlockFetcher:
 
         return number_of_synced_blocks
 
-    def fetch_forward_sync_target(self):
-        return max(self.w3.eth.blockNumber - self.max_reorg_depth, 0)
+    def fetch_forward_sync_target(self, chain_head: ChainHead):
+        return max(chain_head.number - self.max_reorg_depth, 0)
 
     def _sync_forwards(
         self, *, max_number_of_blocks: int, max_block_height: int
@@ -181,30 +264,67 @@ class BlockFetcher:
         blocks = list(
             itertools.takewhile(
                 lambda block: block is not None,
-                (
-                    self.w3.eth.getBlock(block_number)
-                    for block_number in block_numbers_to_fetch
-                ),
+                self._get_blocks_by_number(block_numbers_to_fetch),
             )
         )
 
         self._insert_branch(blocks)
         return len(blocks)
 
+    def _get_blocks_by_number(self, block_numbers):
+        """yield the blocks with the given numbers in order
+
+        If `rpc_batch_size` is greater than one, the blocks are requested in batches of
+        that size. Up to `max_concurrent_requests` requests are kept in flight ahead of
+        the block that is yielded next.
+        """
+        if self.rpc_batch_size <= 1:
+            yield from prefetch(
+                self.w3.eth.getBlock,
+                block_numbers,
+                concurrency=self.max_concurrent_requests,
+            )
+        else:
+            for blocks in prefetch(
+                functools.partial(get_blocks, self.w3),
+                partition_all(self.rpc_batch_size, block_numbers),
+                concurrency=self.max_concurrent_requests,
+            ):
+                yield from blocks
+
     def _sync_backwards(
         self, *, max_number_of_blocks: int, max_block_height: int = None
     ) -> int:
-        branch_length_before = len(self.current_branch)
+        branch_length_before = self.branch_length
         complete = self._fetch_branch(
             max_number_of_blocks, head_block_id=max_block_height
         )
-        number_of_fetched_blocks = len(self.current_branch) - branch_length_before
+        number_of_fetched_blocks = self.branch_length - branch_length_before
 
-        if complete and len(self.current_branch) > 0:
-            self._insert_branch(list(reversed(self.current_branch)))
+        if complete and self.branch_length > 0:
+            number_of_inserted_blocks = self._insert_staged_branch_chunk()
+            # the remaining chunks of a branch fetched before are counted when they are
+            # inserted, so that callers do not wait for a new block in between
+            if number_of_fetched_blocks == 0:
+                return number_of_inserted_blocks
 
         return number_of_fetched_blocks
 
+    def _insert_staged_branch_chunk(self) -> int:
+        """insert the oldest blocks of the completely fetched branch
+
+        The inserted blocks are removed from the staged branch, so that the rest of it
+        stays connected to the known blocks and is inserted by the following calls.
+        Returns the number of inserted blocks.
+        """
+        start = max(self.branch_length - BRANCH_INSERT_CHUNK_SIZE, 0)
+        blocks = self.db.get_branch_blocks(start, self.branch_length)
+        self._insert_branch(list(reversed(blocks)))
+        self.db.truncate_branch(start)
+        self.branch_length = start
+        self._branch_tail = self.db.get_branch_block(start - 1) if start else None
+        return len(blocks)
+
     def _get_block(self, block_id):
         """call self.w3.eth.getBlock, but make sure we don't fetch a block
         before the initial block"""
@@ -234,8 +354,11 @@ class BlockFetcher:
         elif max_blocks_to_fetch == 0:
             return False
 
-        number_of_fetched_blocks = 0
-        if len(self.current_branch) == 0:
+        # the blocks fetched in this call are appended to the staged branch at once, so
+        # that their proposers are recovered together
+        fetched_blocks = []
+        tail = self._branch_tail
+        if tail is None:
             if head_block_id is None:
                 head_block_id = "latest"
 
@@ -248,40 +371,46 @@ class BlockFetcher:
                 )
                 return True
 
-            self.current_branch = [head]
-            number_of_fetched_blocks += 1
+            fetched_blocks.append(head)
+            tail = head
 
-        while (
-            not number_of_fetched_blocks >= max_blocks_to_fetch
-            and not self.db.contains(self.current_branch[-1].parentHash)
+        while len(fetched_blocks) < max_blocks_to_fetch and not self.db.contains(
+            tail.parentHash
         ):
-            parent = self._get_block(self.current_branch[-1].parentHash)
-            self.current_branch.append(parent)
-            number_of_fetched_blocks += 1
+            tail = self._get_block(tail.parentHash)
+            fetched_blocks.append(tail)
+
+        if fetched_blocks:
+            fetched_headers = get_block_headers(fetched_blocks, self.executor)
+            self.db.append_to_branch(self.branch_length, fetched_headers)
+            self.branch_length += len(fetched_headers)
+            self._branch_tail = fetched_headers[-1]
 
-        complete = self.db.contains(self.current_branch[-1].parentHash)
+        complete = self.db.contains(tail.parentHash)
         return complete
 
-    def get_sync_status(self):
-        last_block_number = self.w3.eth.blockNumber
+    def get_sync_status(self, chain_head: Optional[ChainHead] = None):
+        if chain_head is None:
+            chain_head = fetch_chain_head(self.w3)
+        last_block_number = chain_head.number
         head_block_number = self.head_block_number
         if last_block_number <= self._start_sync_number:
             return 0
         # limit it to not go over 100 %
         branch_correction = min(
-            len(self.current_branch), last_block_number - head_block_number
+            self.branch_length, last_block_number - head_block_number
         )
         return (head_block_number - self._start_sync_number + branch_correction) / (
             last_block_number - self._start_sync_number
         )
 
-    def _save_sync_start(self):
+    def _save_sync_start(self, chain_head: ChainHead):
         # To show sync status, remember start sync block
-        if not self.syncing and self.head.number < self.w3.eth.blockNumber - 5:
+        if not self.syncing and self.head.number < chain_head.number - 5:
             self._start_sync_number = self.head.number
             self.syncing = True
 
-        if self.syncing and self.head.number >= self.w3.eth.blockNumber - 1:
+        if self.syncing and self.head.number >= chain_head.number - 1:
             self.syncing = False
 
     @property
@@ -1,15 +1,81 @@
+from typing import List, NamedTuple
+
 import rlp
 
 from web3.datastructures import AttributeDict
 
 from eth_utils import decode_hex, keccak
+from eth_utils.toolz import merge
 
-from eth_keys import keys
+from eth_keys import keys, KeyAPI
+from eth_keys.backends import (
+    CoinCurveECCBackend,
+    NativeECCBackend,
+    is_coincurve_available,
+)
 
 
 EMPTY_SIGNATURE = b"\x00" * 65
 EMPTY_ADDRESS = b"\x00" * 20
 
+# secp256k1 backends used to recover the proposers, from fastest to slowest
+ECC_BACKENDS = {"coincurve": CoinCurveECCBackend, "native": NativeECCBackend}
+AUTO_ECC_BACKEND = "auto"
+
+# recovering proposers in worker processes only pays off if there is enough work to
+# outweigh the cost of sending the blocks to the workers
+MIN_PARALLEL_RECOVERY_BATCH_SIZE = 64
+# number of blocks sent to a worker at once
+RECOVERY_CHUNK_SIZE = 16
+
+
+def get_available_ecc_backends():
+    """Return the names of the secp256k1 backends that can be used, fastest first."""
+    return [
+        name for name in ECC_BACKENDS if name != "coincurve" or is_coincurve_available()
+    ]
+
+
+def _make_key_api(backend_name):
+    if backend_name == AUTO_ECC_BACKEND:
+        backend_name = get_available_ecc_backends()[0]
+    if backend_name not in get_available_ecc_backends():
+        raise ValueError(f"secp256k1 backend {backend_name} is not available")
+    return backend_name, KeyAPI(backend=ECC_BACKENDS[backend_name]())
+
+
+_ecc_backend_name, _key_api = _make_key_api(AUTO_ECC_BACKEND)
+
+
+def set_ecc_backend(backend_name=AUTO_ECC_BACKEND):
+    """Select the secp256k1 backend used to recover proposers.
+
+    `auto` selects the fastest available backend. Raises ValueError if the
+    given backend is not available.
+    """
+    global _ecc_backend_name, _key_api
+    _ecc_backend_name, _key_api = _make_key_api(backend_name)
+
+
+def get_ecc_backend():
+    """Return the name of the secp256k1 backend used to recover proposers."""
+    return _ecc_backend_name
+
+
+class BlockHeader(NamedTuple):
+    """The fields of a block that are needed once its proposer has been recovered
+
+    The fields are named like the ones of the blocks returned by web3.py, so that
+    headers can be used in their place.
+    """
+
+    number: int
+    hash: bytes
+    parentHash: bytes
+    step: int
+    timestamp: int
+    proposer: bytes
+
 
 def get_canonicalized_block(block_dict):
     return AttributeDict(
@@ -36,13 +102,113 @@ def get_canonicalized_block(block_dict):
 
 def get_proposer(canonicalized_block):
     """Extract the signer from a block as retrieved from client via its JSON RPC interface."""
+    _, proposer = get_bare_hash_and_proposer(canonicalized_block)
+    return proposer
+
+
+def get_bare_hash_and_proposer(canonicalized_block):
+    """Return the bare hash and the signer of a block.
+
+    The bare hash of unsigned blocks is not needed and returned as `None`.
+    """
     if canonicalized_block.signature == EMPTY_SIGNATURE:
-        return EMPTY_ADDRESS
+        return None, EMPTY_ADDRESS
 
     message = bare_hash(canonicalized_block)
     signature = keys.Signature(canonicalized_block.signature)
-    recovered_public_key = keys.ecdsa_recover(message, signature)
-    return recovered_public_key.to_canonical_address()
+    recovered_public_key = _key_api.ecdsa_recover(message, signature)
+    return message, recovered_public_key.to_canonical_address()
+
+
+def _map_blocks(function, canonicalized_blocks, executor):
+    if executor is None or len(canonicalized_blocks) < MIN_PARALLEL_RECOVERY_BATCH_SIZE:
+        return [
+            function(canonicalized_block)
+            for canonicalized_block in canonicalized_blocks
+        ]
+
+    return list(
+        executor.map(function, canonicalized_blocks, chunksize=RECOVERY_CHUNK_SIZE)
+    )
+
+
+def get_proposers(canonicalized_blocks, executor=None):
+    """Extract the signers from a sequence of blocks, keeping the order.
+
+    If an executor is given, large batches are spread over its workers. Small
+    batches are always processed serially in the calling process.
+    """
+    return _map_blocks(get_proposer, canonicalized_blocks, executor)
+
+
+def is_enriched_block(block_dict):
+    # headers already contain the recovered proposer
+    return isinstance(block_dict, BlockHeader) or "canonicalizedBlock" in block_dict
+
+
+def enrich_blocks(block_dicts, executor=None):
+    """Add the canonicalized block, its bare hash and its proposer to each block.
+
+    The fields are added as `canonicalizedBlock`, `bareHash` and `proposer`, so that
+    the expensive signature recovery has to be done only once per block. Blocks that
+    have been enriched already are returned unchanged. The proposers are recovered
+    like in `get_proposers`.
+    """
+    blocks_to_enrich = [
+        block_dict for block_dict in block_dicts if not is_enriched_block(block_dict)
+    ]
+    canonicalized_blocks = [
+        get_canonicalized_block(block_dict) for block_dict in blocks_to_enrich
+    ]
+    bare_hashes_and_proposers = _map_blocks(
+        get_bare_hash_and_proposer, canonicalized_blocks, executor
+    )
+    enriched_blocks = iter(
+        AttributeDict(
+            merge(
+                block_dict,
+                {
+                    "canonicalizedBlock": canonicalized_block,
+                    "bareHash": block_bare_hash,
+                    "proposer": proposer,
+                },
+            )
+        )
+        for block_dict, canonicalized_block, (block_bare_hash, proposer) in zip(
+            blocks_to_enrich, canonicalized_blocks, bare_hashes_and_proposers
+        )
+    )
+    return [
+        block_dict if is_enriched_block(block_dict) else next(enriched_blocks)
+        for block_dict in block_dicts
+    ]
+
+
+def enrich_block(block_dict):
+    (enriched_block,) = enrich_blocks([block_dict])
+    return enriched_block
+
+
+def get_block_headers(block_dicts, executor=None) -> List[BlockHeader]:
+    """Return the headers of the blocks, recovering the proposers like `enrich_blocks`"""
+    return [
+        block_dict
+        if isinstance(block_dict, BlockHeader)
+        else BlockHeader(
+            number=block_dict.number,
+            hash=bytes(block_dict.hash),
+            parentHash=bytes(block_dict.parentHash),
+            step=get_step(block_dict),
+            timestamp=block_dict.timestamp,
+            proposer=block_dict.proposer,
+        )
+        for block_dict in enrich_blocks(block_dicts, executor)
+    ]
+
+
+def get_block_header(block_dict) -> BlockHeader:
+    (block_header,) = get_block_headers([block_dict])
+    return block_header
 
 
 def bare_hash(canonicalized_block):
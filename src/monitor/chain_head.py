@@ -0,0 +1,15 @@
+from typing import NamedTuple
+
+
+class ChainHead(NamedTuple):
+    """Snapshot of the chain head of the node
+
+    It is taken once per cycle and handed to all components, so that they all work
+    on the same view of the chain and do not have to query the block number again.
+    """
+
+    number: int
+
+
+def fetch_chain_head(w3) -> ChainHead:
+    return ChainHead(number=w3.eth.blockNumber)
@@ -0,0 +1,209 @@
+"""Compact binary encoding of the persisted state
+
+Integers are encoded as unsigned LEB128 varints, hashes and addresses as fixed-width
+bytes and other byte strings prefixed with their length.
+"""
+from typing import Callable, Dict, Generic, List, Optional, Tuple, Type, TypeVar
+
+import structlog
+
+from monitor.blocks import BlockHeader
+
+HASH_LENGTH = 32
+ADDRESS_LENGTH = 20
+
+
+class DecodingError(Exception):
+    pass
+
+
+class Writer:
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def write_varint(self, value: int) -> None:
+        if value < 0:
+            raise ValueError(f"Can not encode negative integer {value} as varint")
+        while value >= 0x80:
+            self.buffer.append(value & 0x7F | 0x80)
+            value >>= 7
+        self.buffer.append(value)
+
+    def write_fixed_bytes(self, value: bytes, length: int) -> None:
+        if len(value) != length:
+            raise ValueError(f"Expected {length} bytes, got {len(value)}")
+        self.buffer += value
+
+    def write_bytes(self, value: bytes) -> None:
+        self.write_varint(len(value))
+        self.buffer += value
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buffer)
+
+
+class Reader:
+    def __init__(self, data: bytes) -> None:
+        self.data = bytes(data)
+        self.position = 0
+
+    def read_varint(self) -> int:
+        data = self.data
+        position = self.position
+        value = 0
+        shift = 0
+        try:
+            while True:
+                byte = data[position]
+                position += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    self.position = position
+                    return value
+                shift += 7
+        except IndexError:
+            raise DecodingError("Unexpected end of data in varint")
+
+    def read_fixed_bytes(self, length: int) -> bytes:
+        start = self.position
+        end = start + length
+        if end > len(self.data):
+            raise DecodingError("Unexpected end of data")
+        self.position = end
+        return bytes(self.data[start:end])
+
+    def read_bytes(self) -> bytes:
+        return self.read_fixed_bytes(self.read_varint())
+
+    def at_end(self) -> bool:
+        return self.position == len(self.data)
+
+
+def write_block_header(writer: Writer, block_header: BlockHeader) -> None:
+    writer.write_varint(block_header.number)
+    writer.write_fixed_bytes(block_header.hash, HASH_LENGTH)
+    writer.write_fixed_bytes(block_header.parentHash, HASH_LENGTH)
+    writer.write_varint(block_header.step)
+    writer.write_varint(block_header.timestamp)
+    writer.write_fixed_bytes(block_header.proposer, ADDRESS_LENGTH)
+
+
+def read_block_header(reader: Reader) -> BlockHeader:
+    return BlockHeader(
+        number=reader.read_varint(),
+        hash=reader.read_fixed_bytes(HASH_LENGTH),
+        parentHash=reader.read_fixed_bytes(HASH_LENGTH),
+        step=reader.read_varint(),
+        timestamp=reader.read_varint(),
+        proposer=reader.read_fixed_bytes(ADDRESS_LENGTH),
+    )
+
+
+def encode_block_header(block_header: BlockHeader) -> bytes:
+    writer = Writer()
+    write_block_header(writer, block_header)
+    return writer.getvalue()
+
+
+def decode_block_header(data: bytes) -> BlockHeader:
+    reader = Reader(data)
+    block_header = read_block_header(reader)
+    if not reader.at_end():
+        raise DecodingError("Unexpected data after block header")
+    return block_header
+
+
+T = TypeVar("T")
+
+
+class VersionedCodec(Generic[T]):
+    """Encode objects prefixed with the version of their format
+
+    Each version of the format is registered with the type it decodes to, so that
+    objects stored by older versions can still be decoded and upgraded afterwards.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._encoders: Dict[type, Tuple[int, Callable[[Writer, T], None]]] = {}
+        self._decoders: Dict[int, Callable[[Reader], T]] = {}
+
+    def register(
+        self,
+        version: int,
+        type_: Type[T],
+        write: Callable[[Writer, T], None],
+        read: Callable[[Reader], T],
+    ) -> None:
+        if version in self._decoders:
+            raise ValueError(f"Version {version} of {self.name} is registered already")
+        self._encoders[type_] = (version, write)
+        self._decoders[version] = read
+
+    def encode(self, obj: T) -> bytes:
+        try:
+            version, write = self._encoders[type(obj)]
+        except KeyError:
+            raise ValueError(f"Can not encode {type(obj).__name__} as {self.name}")
+        writer = Writer()
+        writer.write_varint(version)
+        write(writer, obj)
+        return writer.getvalue()
+
+    def decode(self, data: bytes) -> T:
+        reader = Reader(data)
+        version = reader.read_varint()
+        try:
+            read = self._decoders[version]
+        except KeyError:
+            raise DecodingError(f"Unknown version {version} of {self.name}")
+        obj = read(reader)
+        if not reader.at_end():
+            raise DecodingError(f"Unexpected data after {self.name}")
+        return obj
+
+
+class Migrations:
+    """Upgrades between consecutive versions of a state
+
+    Upgrades are registered from one state type to the next one. Options some upgrades
+    need, like the size of the offline window older states have been created with, are
+    passed to `upgrade` and forwarded to the upgrades requiring them.
+    """
+
+    logger = structlog.get_logger("monitor.codec")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._upgrades: Dict[type, Tuple[type, Callable, List[str]]] = {}
+
+    def register(
+        self,
+        old_type: type,
+        new_type: type,
+        upgrade: Callable,
+        required_options: Optional[List[str]] = None,
+    ) -> None:
+        if old_type in self._upgrades:
+            raise ValueError(f"Upgrade from {old_type.__name__} is registered already")
+        self._upgrades[old_type] = (new_type, upgrade, required_options or [])
+
+    def upgrade(self, state, target_type: type, **options):
+        """upgrade the state step by step until it is of the target type
+
+        Raises ValueError if there is no path of upgrades to the target type.
+        """
+        while not isinstance(state, target_type):
+            if type(state) not in self._upgrades:
+                raise ValueError(
+                    f"Can not upgrade {type(state).__name__} to {target_type.__name__}"
+                )
+            new_type, upgrade, required_options = self._upgrades[type(state)]
+            self.logger.info(
+                f"Upgrade {self.name} from {type(state).__name__} to {new_type.__name__}"
+            )
+            state = upgrade(
+                state, **{option: options[option] for option in required_options}
+            )
+            assert isinstance(state, new_type)
+        return state
@@ -1,20 +1,42 @@
-from typing import Any
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set
+from collections import OrderedDict, defaultdict
 import pickle
 import contextlib
+from pathlib import Path
+import sqlite3
 from web3.datastructures import AttributeDict
 
 from eth_utils.toolz import sliding_window
 
-from sqlalchemy import Column, Integer, String, LargeBinary
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    LargeBinary,
+    bindparam,
+    create_engine,
+    event,
+    inspect,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.sql import exists
+from sqlalchemy.sql import exists, func
 from sqlalchemy.exc import IntegrityError, DatabaseError
 
-from monitor.blocks import get_canonicalized_block, get_proposer, get_step
+from monitor.blocks import enrich_blocks, get_step
+from monitor.blocks import BlockHeader
+from monitor.codec import DecodingError, decode_block_header, encode_block_header
+from monitor.offline_reporter import (
+    OfflineInterval,
+    OfflineReporterStateChanges,
+    OfflineReporterStateV3,
+)
+from monitor.validators import Epoch, FetchedContractEpochs
 
 Base: Any = declarative_base()
 
+ADDRESS_LENGTH = 20
+
 
 class DBError(Exception):
     pass
@@ -34,12 +56,148 @@ class InvalidDataError(DBError):
     pass
 
 
+SQLITE_JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+SQLITE_SYNCHRONOUS_LEVELS = ("off", "normal", "full", "extra")
+
+
+class SQLiteProfile(NamedTuple):
+    """Pragmas applied to every connection of a SQLite engine
+
+    With the write-ahead log, commits only have to append to the log. Together with
+    the `normal` synchronous level, a commit does not need to wait for fsync, at the
+    risk of losing the latest commits, but not the consistency of the db, on power loss.
+    """
+
+    journal_mode: str = "wal"
+    synchronous: str = "normal"
+    cache_size: int = 64 * 1024  # KiB
+    mmap_size: int = 256 * 1024 * 1024  # bytes
+    busy_timeout: int = 5000  # milliseconds
+
+
+def apply_sqlite_profile(engine, profile: SQLiteProfile) -> None:
+    """apply the given profile to all future connections of the engine"""
+    if profile.journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Unknown SQLite journal mode: {profile.journal_mode}")
+    if profile.synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Unknown SQLite synchronous level: {profile.synchronous}")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode = {profile.journal_mode}")
+            cursor.execute(f"PRAGMA synchronous = {profile.synchronous}")
+            # negative values are interpreted as KiB instead of pages by SQLite
+            cursor.execute(f"PRAGMA cache_size = {-int(profile.cache_size)}")
+            cursor.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+            cursor.execute(f"PRAGMA busy_timeout = {int(profile.busy_timeout)}")
+        finally:
+            cursor.close()
+
+
+def _disable_implicit_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+def _begin_transaction(connection):
+    connection.execute("BEGIN")
+
+
+def enable_savepoints(engine) -> None:
+    """let SQLAlchemy instead of pysqlite begin the transactions of the engine
+
+    pysqlite only begins a transaction before statements that modify the db, so that a
+    savepoint would begin and release a transaction of its own instead of being nested.
+    """
+    if not event.contains(engine, "connect", _disable_implicit_transactions):
+        event.listen(engine, "connect", _disable_implicit_transactions)
+        event.listen(engine, "begin", _begin_transaction)
+
+
+RETENTION_UNITS = ("blocks", "steps")
+# maximum number of blocks deleted at once, so that pruning never stalls a cycle, it
+# has to stay below the maximum number of variables of a SQLite statement
+PRUNE_BATCH_SIZE = 500
+
+
+class RetentionPolicy(NamedTuple):
+    """Keep the blocks within `size` blocks or steps (depending on `unit`) of the head"""
+
+    unit: str
+    size: int
+
+
 class Block(Base):
     __tablename__ = "blocks"
 
     hash = Column(String(length=32), primary_key=True)
     proposer = Column(String(length=20), index=True)
     step = Column(Integer, index=True)
+    # not known for blocks inserted by older versions
+    number = Column(Integer, index=True)
+
+
+class Skip(Base):
+    """A step at which a validator did not propose a block although it was its turn"""
+
+    __tablename__ = "skips"
+
+    validator = Column(String(length=20), primary_key=True)
+    step = Column(Integer, primary_key=True, index=True)
+
+
+class ValidatorContract(Base):
+    """The validator contract of a validator definition range and the height up to which
+    its epochs have been fetched"""
+
+    __tablename__ = "validator_contracts"
+
+    validator_definition_index = Column(Integer, primary_key=True)
+    contract_address = Column(String(length=20))
+    enter_height = Column(Integer)
+    last_fetch_height = Column(Integer)
+
+
+class ContractEpoch(Base):
+    """An epoch fetched from a validator contract"""
+
+    __tablename__ = "contract_epochs"
+
+    validator_definition_index = Column(Integer, primary_key=True)
+    start_height = Column(Integer, primary_key=True)
+    # concatenated addresses of the validators
+    validators = Column(LargeBinary())
+
+
+class OfflineIntervalRow(Base):
+    """An offline interval of the offline reporter"""
+
+    __tablename__ = "offline_intervals"
+
+    validator = Column(String(length=20), primary_key=True)
+    step = Column(Integer, primary_key=True)
+    length = Column(Integer)
+
+
+class ReportedOfflineValidator(Base):
+    """A validator that has been reported as offline within the offline window of the
+    given size"""
+
+    __tablename__ = "reported_offline_validators"
+
+    window_size = Column(Integer, primary_key=True)
+    validator = Column(String(length=20), primary_key=True)
+
+
+class BranchBlock(Base):
+    """A block of the branch the block fetcher is currently syncing backwards"""
+
+    __tablename__ = "branch_blocks"
+
+    # position within the branch, starting at its head
+    position = Column(Integer, primary_key=True)
+    blob = Column(LargeBinary())
 
 
 class NamedBlob(Base):
@@ -48,14 +206,27 @@ class NamedBlob(Base):
     blob = Column(LargeBinary())
 
 
-def blocks_from_block_dicts(block_dicts):
+def block_rows_from_block_dicts(block_dicts, executor=None):
+    """create the rows of the blocks table, the proposers can be recovered in parallel by executor"""
+    return [
+        {
+            "hash": block_dict.hash,
+            "proposer": block_dict.proposer,
+            "step": get_step(block_dict),
+            "number": block_dict.number,
+        }
+        for block_dict in enrich_blocks(block_dicts, executor)
+    ]
+
+
+def split_addresses(concatenated_addresses: bytes) -> List[bytes]:
+    """split concatenated addresses into the individual addresses"""
     return [
-        Block(
-            hash=block_dict.hash,
-            proposer=get_proposer(get_canonicalized_block(block_dict)),
-            step=get_step(block_dict),
+        concatenated_addresses[start:end]
+        for start, end in zip(
+            range(0, len(concatenated_addresses), ADDRESS_LENGTH),
+            range(ADDRESS_LENGTH, len(concatenated_addresses) + 1, ADDRESS_LENGTH),
         )
-        for block_dict in block_dicts
     ]
 
 
@@ -70,89 +241,553 @@ def ensure_branch(block_dicts):
             raise ValueError("Given branch is not connected")
 
 
-def load_pickled(session, name):
-    """load the pickled NamedBlob object with the given name"""
+def load_blob(session, name):
+    """load the NamedBlob with the given name"""
     named_blob = session.query(NamedBlob).get(name)
     if named_blob is None:
         return None
     else:
-        return pickle.loads(named_blob.blob)
+        return named_blob.blob
 
 
-def store_pickled(session, name, obj):
-    """store the given python obj as pickled NamedBlob object under the given name"""
-    pickled_state = pickle.dumps(obj)
+def store_blob(session, name, blob):
+    """store the given bytes as NamedBlob under the given name"""
     named_blob = session.query(NamedBlob).get(name)
     if named_blob is None:
-        named_blob = NamedBlob(name=name, blob=pickled_state)
+        named_blob = NamedBlob(name=name, blob=blob)
     else:
-        named_blob.blob = pickled_state
+        named_blob.blob = blob
     session.add(named_blob)
 
 
+def load_pickled(session, name):
+    """load the pickled NamedBlob object with the given name"""
+    blob = load_blob(session, name)
+    if blob is None:
+        return None
+    else:
+        return pickle.loads(blob)
+
+
+def store_pickled(session, name, obj):
+    """store the given python obj as pickled NamedBlob object under the given name"""
+    store_blob(session, name, pickle.dumps(obj))
+
+
+def create_read_only_engine(db_path, busy_timeout: int = SQLiteProfile().busy_timeout):
+    """create an engine that opens the db at `db_path` in read-only mode
+
+    It is meant to query the db of a running monitor, so it neither creates nor
+    upgrades the schema like `BlockDB` does. `busy_timeout` is given in milliseconds.
+    """
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    return create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(uri, uri=True, timeout=busy_timeout / 1000),
+    )
+
+
+def get_skips(
+    session,
+    validator: Optional[bytes] = None,
+    min_step: Optional[int] = None,
+    max_step: Optional[int] = None,
+) -> List[Skip]:
+    """get the skips ordered by step, optionally filtered by validator and step range (inclusive)"""
+    query = session.query(Skip)
+    if validator is not None:
+        query = query.filter(Skip.validator == validator)
+    if min_step is not None:
+        query = query.filter(Skip.step >= min_step)
+    if max_step is not None:
+        query = query.filter(Skip.step <= max_step)
+    return query.order_by(Skip.step, Skip.validator).all()
+
+
+def _append_to_branch(session, first_position, block_headers):
+    if block_headers:
+        session.execute(
+            BranchBlock.__table__.insert(),
+            [
+                {"position": position, "blob": encode_block_header(block_header)}
+                for position, block_header in enumerate(
+                    block_headers, start=first_position
+                )
+            ],
+        )
+
+
+def _store_offline_reporter_state_changes(
+    session, state_changes: OfflineReporterStateChanges
+) -> None:
+    # the added intervals are inserted first, so that intervals which have been added
+    # and removed again since the last changes have been stored are deleted
+    if state_changes.added_offline_intervals:
+        session.execute(
+            OfflineIntervalRow.__table__.insert().prefix_with("OR REPLACE"),
+            [
+                {
+                    "validator": validator,
+                    "step": offline_interval.step,
+                    "length": offline_interval.length,
+                }
+                for validator, offline_interval in (
+                    state_changes.added_offline_intervals
+                )
+            ],
+        )
+    if state_changes.removed_offline_intervals:
+        table = OfflineIntervalRow.__table__
+        session.execute(
+            table.delete().where(
+                (table.c.validator == bindparam("removed_validator"))
+                & (table.c.step == bindparam("removed_step"))
+            ),
+            [
+                {"removed_validator": validator, "removed_step": step}
+                for validator, step in state_changes.removed_offline_intervals
+            ],
+        )
+    if state_changes.reported_validators:
+        session.execute(
+            ReportedOfflineValidator.__table__.insert().prefix_with("OR IGNORE"),
+            [
+                {"window_size": window_size, "validator": validator}
+                for window_size, validator in state_changes.reported_validators
+            ],
+        )
+
+
+INSERTED_HASHES_KEY = "inserted_block_hashes"
+
+
+class HashIndex:
+    """Bounded set of block hashes, forgetting the ones added first when full"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._hashes: OrderedDict = OrderedDict()
+
+    def discard_all(self, block_hashes) -> None:
+        for block_hash in block_hashes:
+            self._hashes.pop(block_hash, None)
+
+    def add_all(self, block_hashes) -> None:
+        for block_hash in block_hashes:
+            self._hashes[block_hash] = None
+            self._hashes.move_to_end(block_hash)
+        while len(self._hashes) > self.size:
+            self._hashes.popitem(last=False)
+
+    def __contains__(self, block_hash) -> bool:
+        return block_hash in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
 class BlockDB:
-    def __init__(self, engine):
+    def __init__(self, engine, executor=None, hash_index_size=0):
+        """
+        :param engine: the SQLAlchemy engine of the database
+        :param executor: optional `concurrent.futures.Executor` used to recover the
+            proposers of large branches in parallel
+        :param hash_index_size: number of the most recent block hashes kept in memory to
+            answer `contains` without querying the database, 0 disables the index
+        """
         self.engine = engine
+        self.executor = executor
 
+        enable_savepoints(self.engine)
         self.session_class = sessionmaker(bind=self.engine)
         try:
             Base.metadata.create_all(self.engine)
+            self._add_missing_columns()
         except DatabaseError as e:
             raise InvalidDataError(f"Corrupt db state: {e}") from e
         self.current_session = None
 
-    def _get_session(self):
-        return self.current_session or self.session_class()
+        self.hash_index = HashIndex(hash_index_size)
+        # only committed blocks may be added to the index, the hashes inserted in a
+        # session are collected in its info dict until it is committed
+        event.listen(self.session_class, "after_commit", self._index_inserted_hashes)
+        event.listen(
+            self.session_class, "after_transaction_end", self._discard_inserted_hashes
+        )
+        self._rebuild_hash_index()
+
+    def _add_missing_columns(self) -> None:
+        """add the columns that did not exist in the blocks table of older versions"""
+        column_names = {
+            column["name"] for column in inspect(self.engine).get_columns("blocks")
+        }
+        if "number" not in column_names:
+            with self.engine.begin() as connection:
+                connection.execute("ALTER TABLE blocks ADD COLUMN number INTEGER")
+                connection.execute("CREATE INDEX ix_blocks_number ON blocks (number)")
+
+    def _rebuild_hash_index(self) -> None:
+        if self.hash_index.size == 0:
+            return
+        with self._session() as session:
+            rows = (
+                session.query(Block.hash)
+                .order_by(Block.step.desc())
+                .limit(self.hash_index.size)
+                .all()
+            )
+        self.hash_index.add_all(block_hash for (block_hash,) in reversed(rows))
+
+    def _index_inserted_hashes(self, session) -> None:
+        self.hash_index.add_all(session.info.pop(INSERTED_HASHES_KEY, []))
+
+    def _discard_inserted_hashes(self, session, transaction) -> None:
+        if transaction.parent is None:
+            session.info.pop(INSERTED_HASHES_KEY, None)
+
+    @contextlib.contextmanager
+    def _session(self):
+        """yield the current persistent session or a temporary one that is closed afterwards"""
+        if self.current_session is not None:
+            yield self.current_session
+        else:
+            session = self.session_class()
+            try:
+                yield session
+            finally:
+                session.close()
 
     @contextlib.contextmanager
     def persistent_session(self):
         assert self.current_session is None
         self.current_session = self.session_class()
-        yield self.current_session
-        self.current_session = None
+        try:
+            yield self.current_session
+        finally:
+            self.current_session.close()
+            self.current_session = None
 
     def insert(self, block_dict: AttributeDict) -> None:
         self.insert_branch([block_dict])
 
     def insert_branch(self, block_dicts):
         ensure_branch(block_dicts)
-        blocks = blocks_from_block_dicts(block_dicts)
-        session = self._get_session()
-        session.add_all(blocks)
-
-        try:
-            session.flush()
+        block_rows = block_rows_from_block_dicts(block_dicts, self.executor)
+        if not block_rows:
+            return
+
+        with self._session() as session:
+            try:
+                # within a savepoint, so that a conflict only discards the rows of the
+                # branch and not the other changes of a persistent session
+                with session.begin_nested():
+                    # a single executemany statement bypassing the unit of work of the ORM
+                    session.execute(Block.__table__.insert(), block_rows)
+            except IntegrityError:
+                raise AlreadyExists(
+                    "At least one block from the given branch already exists"
+                )
+            if self.hash_index.size > 0:
+                session.info.setdefault(INSERTED_HASHES_KEY, []).extend(
+                    block_row["hash"] for block_row in block_rows
+                )
             if self.current_session is None:
                 session.commit()
-        except IntegrityError:
-            raise AlreadyExists(
-                "At least one block from the given branch already exists"
-            )
 
     def is_empty(self):
-        session = self._get_session()
-        return not session.query(session.query(Block).exists()).scalar()
+        with self._session() as session:
+            return not session.query(session.query(Block).exists()).scalar()
 
     def contains(self, block_hash: bytes) -> bool:
-        session = self._get_session()
-        return session.query(exists().where(Block.hash == block_hash)).scalar()
+        if block_hash in self.hash_index:
+            return True
+        with self._session() as session:
+            return session.query(exists().where(Block.hash == block_hash)).scalar()
+
+    def prune(
+        self,
+        head,
+        retention_policy: RetentionPolicy,
+        max_number_of_blocks: int = PRUNE_BATCH_SIZE,
+        min_retained_blocks: int = 0,
+    ) -> int:
+        """Delete up to `max_number_of_blocks` blocks that are not retained by the policy
+
+        The `min_retained_blocks` newest blocks are always retained, whatever the unit
+        of the policy, as steps without a block do not count towards a number of blocks.
+        Returns the number of deleted blocks. Blocks without a number, inserted by older
+        versions, are deleted if their step is before the step of the oldest block
+        retained by number.
+        """
+        if retention_policy.unit not in RETENTION_UNITS:
+            raise ValueError(f"Unknown retention unit: {retention_policy.unit}")
+
+        with self._session() as session:
+            oldest_retained_number = head.number - min_retained_blocks
+            if retention_policy.unit == "blocks":
+                oldest_retained_number = min(
+                    oldest_retained_number, head.number - retention_policy.size
+                )
+            oldest_retained_step = (
+                session.query(func.min(Block.step))
+                .filter(Block.number == oldest_retained_number)
+                .scalar()
+            )
+            is_outdated = Block.number < oldest_retained_number
+            if oldest_retained_step is not None:
+                is_outdated |= Block.number.is_(None) & (
+                    Block.step < oldest_retained_step
+                )
+            if retention_policy.unit == "steps":
+                is_outdated &= Block.step < get_step(head) - retention_policy.size
+
+            outdated_hashes = [
+                block_hash
+                for (block_hash,) in session.query(Block.hash)
+                .filter(is_outdated)
+                .limit(max_number_of_blocks)
+            ]
+            if not outdated_hashes:
+                return 0
+
+            session.query(Block).filter(Block.hash.in_(outdated_hashes)).delete(
+                synchronize_session=False
+            )
+            # evicting too many hashes is fine, as the db is queried on a miss
+            self.hash_index.discard_all(outdated_hashes)
+            if self.current_session is None:
+                session.commit()
+            return len(outdated_hashes)
 
     def get_blocks_by_proposer_and_step(self, proposer: bytes, step: int):
-        session = self._get_session()
-        query = session.query(Block).filter(
-            Block.proposer == proposer, Block.step == step
-        )
-        return query.all()
+        with self._session() as session:
+            query = session.query(Block).filter(
+                Block.proposer == proposer, Block.step == step
+            )
+            return query.all()
+
+    def insert_skip(self, validator: bytes, step: int) -> None:
+        """store a skip, storing the same skip again has no effect"""
+        with self._session() as session:
+            session.execute(
+                Skip.__table__.insert().prefix_with("OR IGNORE"),
+                {"validator": validator, "step": step},
+            )
+            if self.current_session is None:
+                session.commit()
+
+    def get_skips(
+        self,
+        validator: Optional[bytes] = None,
+        min_step: Optional[int] = None,
+        max_step: Optional[int] = None,
+    ) -> List[Skip]:
+        """get the skips ordered by step, optionally filtered by validator and step range (inclusive)"""
+        with self._session() as session:
+            return get_skips(session, validator, min_step, max_step)
+
+    def store_fetched_contract_epochs(
+        self, fetched_contract_epochs: Sequence[FetchedContractEpochs]
+    ) -> None:
+        """store epochs fetched from validator contracts, replacing the epochs of other
+        contracts stored for the same validator definition range"""
+        with self._session() as session:
+            for fetched in fetched_contract_epochs:
+                validator_contract = session.query(ValidatorContract).get(
+                    fetched.validator_definition_index
+                )
+                if validator_contract is None:
+                    validator_contract = ValidatorContract(
+                        validator_definition_index=fetched.validator_definition_index
+                    )
+                elif (
+                    validator_contract.contract_address != fetched.contract_address
+                    or validator_contract.enter_height != fetched.enter_height
+                ):
+                    session.query(ContractEpoch).filter(
+                        ContractEpoch.validator_definition_index
+                        == fetched.validator_definition_index
+                    ).delete()
+
+                validator_contract.contract_address = fetched.contract_address
+                validator_contract.enter_height = fetched.enter_height
+                validator_contract.last_fetch_height = fetched.last_fetch_height
+                session.add(validator_contract)
+
+                for epoch in fetched.epochs:
+                    session.merge(
+                        ContractEpoch(
+                            validator_definition_index=epoch.validator_definition_index,
+                            start_height=epoch.start_height,
+                            validators=b"".join(epoch.validators),
+                        )
+                    )
+            if self.current_session is None:
+                session.commit()
+
+    def load_fetched_contract_epochs(self) -> List[FetchedContractEpochs]:
+        """load all stored epochs fetched from validator contracts ordered by start height"""
+        with self._session() as session:
+            epochs_by_index: Dict[int, List[Epoch]] = defaultdict(list)
+            for contract_epoch in session.query(ContractEpoch).order_by(
+                ContractEpoch.validator_definition_index, ContractEpoch.start_height
+            ):
+                epochs_by_index[contract_epoch.validator_definition_index].append(
+                    Epoch(
+                        start_height=contract_epoch.start_height,
+                        validators=split_addresses(contract_epoch.validators),
+                        validator_definition_index=contract_epoch.validator_definition_index,
+                    )
+                )
+
+            return [
+                FetchedContractEpochs(
+                    validator_definition_index=validator_contract.validator_definition_index,
+                    contract_address=validator_contract.contract_address,
+                    enter_height=validator_contract.enter_height,
+                    last_fetch_height=validator_contract.last_fetch_height,
+                    epochs=epochs_by_index[
+                        validator_contract.validator_definition_index
+                    ],
+                )
+                for validator_contract in session.query(ValidatorContract).order_by(
+                    ValidatorContract.validator_definition_index
+                )
+            ]
+
+    def store_offline_reporter_state_changes(
+        self, state_changes: OfflineReporterStateChanges
+    ) -> None:
+        """apply the changes of the offline reporter state to the stored one"""
+        with self._session() as session:
+            _store_offline_reporter_state_changes(session, state_changes)
+            if self.current_session is None:
+                session.commit()
+
+    def replace_offline_reporter_state(self, state: OfflineReporterStateV3) -> None:
+        """replace the stored offline reporter state by the given one"""
+        with self._session() as session:
+            session.query(OfflineIntervalRow).delete()
+            session.query(ReportedOfflineValidator).delete()
+            _store_offline_reporter_state_changes(
+                session,
+                OfflineReporterStateChanges(
+                    added_offline_intervals=[
+                        (validator, offline_interval)
+                        for validator, offline_intervals in (
+                            state.recent_offline_intervals_by_validator.items()
+                        )
+                        for offline_interval in offline_intervals
+                    ],
+                    removed_offline_intervals=[],
+                    reported_validators=[
+                        (window_size, validator)
+                        for window_size, validators in (
+                            state.reported_validators_by_window_size.items()
+                        )
+                        for validator in validators
+                    ],
+                ),
+            )
+            if self.current_session is None:
+                session.commit()
+
+    def load_offline_reporter_state(self) -> OfflineReporterStateV3:
+        with self._session() as session:
+            recent_offline_intervals_by_validator: Dict[
+                bytes, List[OfflineInterval]
+            ] = defaultdict(list)
+            for row in session.query(OfflineIntervalRow).order_by(
+                OfflineIntervalRow.validator, OfflineIntervalRow.step
+            ):
+                recent_offline_intervals_by_validator[row.validator].append(
+                    OfflineInterval(step=row.step, length=row.length)
+                )
+
+            reported_validators_by_window_size: Dict[int, Set[bytes]] = defaultdict(set)
+            for row in session.query(ReportedOfflineValidator):
+                reported_validators_by_window_size[row.window_size].add(row.validator)
+
+            return OfflineReporterStateV3(
+                recent_offline_intervals_by_validator=dict(
+                    recent_offline_intervals_by_validator
+                ),
+                reported_validators_by_window_size=dict(
+                    reported_validators_by_window_size
+                ),
+            )
+
+    def append_to_branch(self, position: int, block_headers: List[BlockHeader]) -> None:
+        """stage blocks of the branch the block fetcher syncs backwards, starting at
+        the given position"""
+        with self._session() as session:
+            _append_to_branch(session, position, block_headers)
+            if self.current_session is None:
+                session.commit()
+
+    def truncate_branch(self, length: int) -> None:
+        """delete the staged blocks from the given position on"""
+        with self._session() as session:
+            session.query(BranchBlock).filter(BranchBlock.position >= length).delete()
+            if self.current_session is None:
+                session.commit()
+
+    def replace_branch(self, block_headers: List[BlockHeader]) -> None:
+        with self._session() as session:
+            session.query(BranchBlock).delete()
+            _append_to_branch(session, 0, block_headers)
+            if self.current_session is None:
+                session.commit()
+
+    def get_branch_length(self) -> int:
+        with self._session() as session:
+            return session.query(BranchBlock).count()
+
+    def get_branch_block(self, position: int) -> BlockHeader:
+        (block_header,) = self.get_branch_blocks(position, position + 1)
+        return block_header
+
+    def get_branch_blocks(self, start: int, end: int) -> List[BlockHeader]:
+        """return the staged blocks from position `start` up to `end` (exclusive)"""
+        with self._session() as session:
+            try:
+                return [
+                    decode_block_header(blob)
+                    for (blob,) in session.query(BranchBlock.blob)
+                    .filter(BranchBlock.position >= start, BranchBlock.position < end)
+                    .order_by(BranchBlock.position)
+                ]
+            except DecodingError as e:
+                raise InvalidDataError(f"Invalid branch: {e}") from e
+
+    def load_branch(self) -> List[BlockHeader]:
+        return self.get_branch_blocks(0, self.get_branch_length())
+
+    def store_blob(self, name, blob: bytes) -> None:
+        with self._session() as session:
+            store_blob(session, name, blob)
+            if self.current_session is None:
+                session.commit()
+
+    def load_blob(self, name) -> Optional[bytes]:
+        with self._session() as session:
+            return load_blob(session, name)
+
+    def delete_blob(self, name):
+        with self._session() as session:
+            session.query(NamedBlob).filter(NamedBlob.name == name).delete()
+            if self.current_session is None:
+                session.commit()
 
     def store_pickled(self, name, obj):
-        session = self._get_session()
-        store_pickled(session, name, obj)
-        if self.current_session is None:
-            session.commit()
+        with self._session() as session:
+            store_pickled(session, name, obj)
+            if self.current_session is None:
+                session.commit()
 
     def load_pickled(self, name):
-        session = self._get_session()
-        try:
-            return load_pickled(session, name)
-        except Exception as e:
-            raise InvalidDataError(f"Invalid {name}: {e}") from e
+        with self._session() as session:
+            try:
+                return load_pickled(session, name)
+            except Exception as e:
+                raise InvalidDataError(f"Invalid {name}: {e}") from e
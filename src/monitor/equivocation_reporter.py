@@ -1,7 +1,7 @@
 import structlog
 from eth_utils import encode_hex
 
-from monitor.blocks import get_proposer, get_canonicalized_block, get_step
+from monitor.blocks import enrich_block, get_step
 
 
 class EquivocationReporter:
@@ -25,7 +25,7 @@ class EquivocationReporter:
         self.report_callbacks.append(callback)
 
     def __call__(self, block):
-        proposer = get_proposer(get_canonicalized_block(block))
+        proposer = enrich_block(block).proposer
         step = get_step(block)
         blocks_by_same_proposer_at_same_step = self.db.get_blocks_by_proposer_and_step(
             proposer, step
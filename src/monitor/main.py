@@ -1,37 +1,80 @@
+from concurrent.futures import ProcessPoolExecutor
 import datetime
+import functools
 import json
 from pathlib import Path
 import signal
-import time
 import pkg_resources
 import logging
 
-from typing import NamedTuple
+from typing import Dict, List, NamedTuple, Optional
 
 import structlog
 
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import sessionmaker
 
 from web3 import Web3, HTTPProvider
-from eth_utils import encode_hex
+from eth_utils import encode_hex, is_hex_address, to_canonical_address
 from eth_keys import keys
 
 import monitor.db as db
+from monitor.codec import DecodingError, Migrations
 from monitor import blocksel, node_status
-from monitor.db import BlockDB
-from monitor.block_fetcher import BlockFetcher, format_block, BlockFetcherStateV1
+from monitor.db import (
+    BlockDB,
+    InvalidDataError,
+    RetentionPolicy,
+    SQLiteProfile,
+    SQLITE_JOURNAL_MODES,
+    SQLITE_SYNCHRONOUS_LEVELS,
+    apply_sqlite_profile,
+)
+from monitor.block_fetcher import (
+    BlockFetcher,
+    format_block,
+    BlockFetcherStateV1,
+    BlockFetcherStateV2,
+    BlockFetcherStateV3,
+)
+from monitor import block_fetcher
+from monitor.chain_head import ChainHead, fetch_chain_head
 from monitor import offline_reporter
 from monitor.offline_reporter import (
     OfflineReporter,
+    OfflineReporterStateV3,
     OfflineReporterStateV2,
     OfflineReporterStateV1,
+    OfflineWindow,
 )
 from monitor import skip_reporter
-from monitor.skip_reporter import SkipReporter, SkipReporterStateV2, SkipReporterStateV1
+from monitor.skip_reporter import (
+    SkipReporter,
+    SkipReporterStateV3,
+    SkipReporterStateV2,
+    SkipReporterStateV1,
+)
 from monitor.equivocation_reporter import EquivocationReporter
-from monitor.blocks import get_canonicalized_block, get_proposer, rlp_encoded_block
+from monitor.new_heads import HeadPoller, HeadSubscription
+from monitor.state_codec import (
+    BLOCK_FETCHER_STATE_CODEC,
+    SKIP_REPORTER_STATE_CODEC,
+)
+from monitor.blocks import (
+    AUTO_ECC_BACKEND,
+    ECC_BACKENDS,
+    get_available_ecc_backends,
+    get_canonicalized_block,
+    get_ecc_backend,
+    get_proposer,
+    rlp_encoded_block,
+    set_ecc_backend,
+)
 from monitor.validators import (
+    Epoch,
     EpochFetcher,
+    FetchedContractEpochs,
     PrimaryOracle,
     get_validator_definition_ranges,
     get_static_epochs,
@@ -47,17 +90,30 @@ default_db_dir = str(Path.cwd() / "state")
 SKIP_FILE_NAME = "skips"
 DB_FILE_NAME = "tlbc-monitor.db"
 SQLITE_URL_FORMAT = "sqlite:////{path}"
+# the app state has been stored as a whole by older versions
 APP_STATE_KEY = "appstate"
+# the branch the block fetcher syncs backwards and the offline reporter state are stored
+# in their own tables, so that only their changes have to be written in each cycle
+BLOCK_FETCHER_STATE_KEY = "blockfetcherstate"
+SKIP_REPORTER_STATE_KEY = "skipreporterstate"
 
 
 STEP_DURATION = 5
 BLOCK_FETCH_INTERVAL = STEP_DURATION / 2
+# maximum time to wait for a new head announced via a subscription before fetching anyways
+NEW_HEAD_TIMEOUT = 12 * STEP_DURATION
 GRACE_PERIOD = 10  # number of blocks that have to pass before a missed block is counted
 DEFAULT_OFFLINE_WINDOW_SIZE_IN_SECONDS = 24 * 60 * 60
 DEFAULT_ALLOWED_SKIP_RATE = 0.5
 MAX_REORG_DEPTH = (
     1000  # blocks at this depth in the chain are assumed to not be replaced
 )
+# number of recent block hashes kept in memory, covering the blocks that can be
+# replaced by a reorg with a margin for the blocks fetched during a cycle
+HASH_INDEX_SIZE = MAX_REORG_DEPTH + 1000
+DEFAULT_RPC_BATCH_SIZE = 100
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_RECOVERY_PROCESSES = 4
 
 BLOCK_HASH_AND_TIMESTAMP_TEMPLATE = "{block_hash} ({block_timestamp})"
 EQUIVOCATION_REPORT_TEMPLATE = """\
@@ -86,14 +142,24 @@ Signature of block header two:
 
 """
 
-logging.basicConfig(level=logging.INFO)
-structlog.configure(logger_factory=structlog.stdlib.LoggerFactory())
+
+def configure_logging():
+    logging.basicConfig(level=logging.INFO)
+    structlog.configure(logger_factory=structlog.stdlib.LoggerFactory())
 
 
 def step_number_to_timestamp(step):
     return step * STEP_DURATION
 
 
+def format_skip(validator, step):
+    """format a skip as a line of the skip file"""
+    skip_timestamp = step_number_to_timestamp(step)
+    return "{},{},{}\n".format(
+        step, encode_hex(validator), datetime.datetime.utcfromtimestamp(skip_timestamp)
+    )
+
+
 class AppStateV1(NamedTuple):
     block_fetcher_state: BlockFetcherStateV1
     skip_reporter_state: SkipReporterStateV1
@@ -116,6 +182,71 @@ def upgrade_v1_to_v2(v1: AppStateV1):
     )
 
 
+class AppStateV3(NamedTuple):
+    block_fetcher_state: BlockFetcherStateV1
+    skip_reporter_state: SkipReporterStateV3
+    offline_reporter_state: OfflineReporterStateV2
+
+
+def upgrade_v2_to_v3(v2: AppStateV2):
+    return AppStateV3(
+        block_fetcher_state=v2.block_fetcher_state,
+        skip_reporter_state=skip_reporter.upgrade_v2_to_v3(v2.skip_reporter_state),
+        offline_reporter_state=v2.offline_reporter_state,
+    )
+
+
+class AppStateV4(NamedTuple):
+    block_fetcher_state: BlockFetcherStateV1
+    skip_reporter_state: SkipReporterStateV3
+    offline_reporter_state: OfflineReporterStateV3
+
+
+def upgrade_v3_to_v4(v3: AppStateV3, offline_window_size: int):
+    return AppStateV4(
+        block_fetcher_state=v3.block_fetcher_state,
+        skip_reporter_state=v3.skip_reporter_state,
+        offline_reporter_state=offline_reporter.upgrade_v2_to_v3(
+            v3.offline_reporter_state, offline_window_size
+        ),
+    )
+
+
+class AppStateV5(NamedTuple):
+    block_fetcher_state: BlockFetcherStateV2
+    skip_reporter_state: SkipReporterStateV3
+    offline_reporter_state: OfflineReporterStateV3
+
+
+def upgrade_v4_to_v5(v4: AppStateV4):
+    return AppStateV5(
+        block_fetcher_state=block_fetcher.upgrade_v1_to_v2(v4.block_fetcher_state),
+        skip_reporter_state=v4.skip_reporter_state,
+        offline_reporter_state=v4.offline_reporter_state,
+    )
+
+
+APP_STATE_MIGRATIONS = Migrations("appstate")
+APP_STATE_MIGRATIONS.register(AppStateV1, AppStateV2, upgrade_v1_to_v2)
+APP_STATE_MIGRATIONS.register(AppStateV2, AppStateV3, upgrade_v2_to_v3)
+APP_STATE_MIGRATIONS.register(
+    AppStateV3, AppStateV4, upgrade_v3_to_v4, required_options=["offline_window_size"]
+)
+APP_STATE_MIGRATIONS.register(AppStateV4, AppStateV5, upgrade_v4_to_v5)
+
+
+class AppStateV6(NamedTuple):
+    """The states of the reporters as loaded from their separate storage
+
+    It is not stored as a whole, so that there is no upgrade to it. The branch of the
+    block fetcher is staged in the db instead.
+    """
+
+    block_fetcher_state: BlockFetcherStateV3
+    skip_reporter_state: SkipReporterStateV3
+    offline_reporter_state: OfflineReporterStateV3
+
+
 class InvalidAppStateException(Exception):
     pass
 
@@ -131,19 +262,32 @@ class App:
         chain_spec_path,
         report_dir,
         db_path,
-        skip_rate,
-        offline_window_size,
+        offline_windows,
         initial_block_resolver,
         upgrade_db=False,
         watch_chain_spec=False,
+        rpc_batch_size=DEFAULT_RPC_BATCH_SIZE,
+        max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS,
+        subscription_uri=None,
+        recovery_processes=DEFAULT_RECOVERY_PROCESSES,
+        ecc_backend=AUTO_ECC_BACKEND,
+        sqlite_profile=SQLiteProfile(),
+        retention_policy=None,
+        export_skip_file=True,
     ):
         self.report_dir = report_dir
 
-        self.skip_file = open(report_dir / SKIP_FILE_NAME, "a")
+        # skips are stored in the db, the skip file is an optional export
+        self.skip_file = (
+            open(report_dir / SKIP_FILE_NAME, "a") if export_skip_file else None
+        )
 
         self.w3 = None
         self.epoch_fetcher = None
         self.primary_oracle = None
+        # fetched epochs that are not stored yet, as they might still be replaced by a
+        # reorg, by validator definition index
+        self._unfinalized_contract_epochs: Dict[int, List[Epoch]] = {}
 
         self.db = None
         self.block_fetcher = None
@@ -151,21 +295,43 @@ class App:
         self.offline_reporter = None
         self.equivocation_reporter = None
         self.initial_block_resolver = initial_block_resolver
+        self.rpc_batch_size = rpc_batch_size
+        self.max_concurrent_requests = max_concurrent_requests
+        self.retention_policy = retention_policy
+        self.offline_windows = offline_windows
 
         self.chain_spec_path = chain_spec_path
         self.original_chain_spec = None
         self.watch_chain_spec = watch_chain_spec
 
-        self._initialize_db(db_path)
+        set_ecc_backend(ecc_backend)
+        self.logger.info("recovering block proposers", ecc_backend=get_ecc_backend())
+
+        # proposers are recovered in worker processes, as this is CPU bound
+        self.recovery_executor = (
+            ProcessPoolExecutor(
+                max_workers=recovery_processes,
+                initializer=_initialize_recovery_worker,
+                initargs=(get_ecc_backend(),),
+            )
+            if recovery_processes > 1
+            else None
+        )
+
+        if subscription_uri is None:
+            self.head_waiter = HeadPoller(poll_interval=BLOCK_FETCH_INTERVAL)
+        else:
+            self.head_waiter = HeadSubscription(
+                subscription_uri,
+                poll_interval=BLOCK_FETCH_INTERVAL,
+                timeout=NEW_HEAD_TIMEOUT,
+            )
+
+        self._initialize_db(db_path, sqlite_profile)
         self._initialize_w3(rpc_uri)
         self.wait_for_node_fully_synced()
         self._initialize_primary_oracle(chain_spec_path)
-
-        app_state = self._load_app_state()
-        if upgrade_db:
-            app_state = self._upgrade_app_state(app_state)
-
-        self._initialize_reporters(app_state, skip_rate, offline_window_size)
+        self._restore_reporters(upgrade_db, offline_windows)
         self._register_reporter_callbacks()
         self._running = False
 
@@ -181,32 +347,47 @@ class App:
         self._running = True
         try:
             self.logger.info("starting sync")
+            self.head_waiter.start()
             while self._running:
                 self._run_cycle()
         finally:
-            self.skip_file.close()
+            if self.skip_file is not None:
+                self.skip_file.close()
+            if self.recovery_executor is not None:
+                self.recovery_executor.shutdown()
 
     def _run_cycle(self) -> None:
-        self._update_epochs()
+        # take a single snapshot of the chain head so that the whole cycle sees a
+        # consistent view of the chain
+        chain_head = fetch_chain_head(self.w3)
         with self.db.persistent_session() as session:
+            self._update_epochs(chain_head)
             number_of_new_blocks = self.block_fetcher.fetch_and_insert_new_blocks(
                 max_number_of_blocks=500,
                 max_block_height=self.epoch_fetcher.last_fetch_height,
+                chain_head=chain_head,
             )
-            self.db.store_pickled(APP_STATE_KEY, self.app_state)
-            self.skip_file.flush()
+            if self.retention_policy is not None:
+                self.db.prune(
+                    self.block_fetcher.head,
+                    self.retention_policy,
+                    min_retained_blocks=MAX_REORG_DEPTH,
+                )
+            self._store_app_state_changes()
+            if self.skip_file is not None:
+                self.skip_file.flush()
             session.commit()
 
         self.logger.info(
-            f"Syncing ({self.block_fetcher.get_sync_status():.0%})"
+            f"Syncing ({self.block_fetcher.get_sync_status(chain_head):.0%})"
             if self.block_fetcher.syncing
             else "Synced",
             head=format_block(self.block_fetcher.head),
-            head_hash=self.block_fetcher.head.hash.hex(),
+            head_hash=encode_hex(self.block_fetcher.head.hash),
         )
 
         if number_of_new_blocks == 0:
-            time.sleep(BLOCK_FETCH_INTERVAL)
+            self.head_waiter.wait_for_new_head()
 
         # check at the end of the cycle so that we quit immediately when the chain spec has
         # changed
@@ -228,11 +409,50 @@ class App:
             self.logger.info("Chain spec file has changed.")
             self.stop()
 
-    def _update_epochs(self) -> None:
-        new_epochs = self.epoch_fetcher.fetch_new_epochs()
-        for epoch in new_epochs:
-            self.primary_oracle.add_epoch(epoch)
+    def _update_epochs(self, chain_head: Optional[ChainHead] = None) -> None:
+        if chain_head is None:
+            chain_head = fetch_chain_head(self.w3)
+        fetched_contract_epochs = self.epoch_fetcher.fetch_new_contract_epochs(
+            chain_head
+        )
+        for fetched in fetched_contract_epochs:
+            for epoch in fetched.epochs:
+                self.primary_oracle.add_epoch(epoch)
         self.primary_oracle.max_height = self.epoch_fetcher.last_fetch_height
+        self._store_final_contract_epochs(fetched_contract_epochs, chain_head)
+
+    def _store_final_contract_epochs(
+        self,
+        fetched_contract_epochs: List[FetchedContractEpochs],
+        chain_head: ChainHead,
+    ) -> None:
+        """store the fetched epochs that can not be replaced by a reorg anymore, so that
+        they do not have to be fetched again after a restart
+
+        The stored fetch height is limited to the final height as well, so that newer
+        epochs are fetched again after a restart.
+        """
+        final_height = max(chain_head.number - MAX_REORG_DEPTH, 0)
+        final_contract_epochs = []
+        for fetched in fetched_contract_epochs:
+            epochs = (
+                self._unfinalized_contract_epochs.pop(
+                    fetched.validator_definition_index, []
+                )
+                + fetched.epochs
+            )
+            final_contract_epochs.append(
+                fetched._replace(
+                    last_fetch_height=min(fetched.last_fetch_height, final_height),
+                    epochs=[
+                        epoch for epoch in epochs if epoch.start_height <= final_height
+                    ],
+                )
+            )
+            self._unfinalized_contract_epochs[fetched.validator_definition_index] = [
+                epoch for epoch in epochs if epoch.start_height > final_height
+            ]
+        self.db.store_fetched_contract_epochs(final_contract_epochs)
 
     def stop(self):
         self.logger.info(
@@ -242,19 +462,39 @@ class App:
 
     @property
     def app_state(self):
-        return AppStateV2(
+        return AppStateV6(
             block_fetcher_state=self.block_fetcher.state,
             skip_reporter_state=self.skip_reporter.state,
             offline_reporter_state=self.offline_reporter.state,
         )
 
+    def _store_app_state_changes(self) -> None:
+        # the block fetcher stages the branch in the db itself
+        self._store_state_blobs(self.block_fetcher.state, self.skip_reporter.state)
+        self.db.store_offline_reporter_state_changes(
+            self.offline_reporter.pop_state_changes()
+        )
+
+    def _store_state_blobs(self, block_fetcher_state, skip_reporter_state) -> None:
+        self.db.store_blob(
+            BLOCK_FETCHER_STATE_KEY,
+            BLOCK_FETCHER_STATE_CODEC.encode(block_fetcher_state),
+        )
+        self.db.store_blob(
+            SKIP_REPORTER_STATE_KEY,
+            SKIP_REPORTER_STATE_CODEC.encode(skip_reporter_state),
+        )
+
     #
     # Initialization
     #
-    def _initialize_db(self, db_path):
+    def _initialize_db(self, db_path, sqlite_profile):
         db_url = SQLITE_URL_FORMAT.format(path=db_path)
         engine = create_engine(db_url)
-        self.db = BlockDB(engine)
+        apply_sqlite_profile(engine, sqlite_profile)
+        self.db = BlockDB(
+            engine, executor=self.recovery_executor, hash_index_size=HASH_INDEX_SIZE
+        )
 
     def _initialize_w3(self, rpc_uri):
         self.w3 = Web3(HTTPProvider(rpc_uri))
@@ -281,17 +521,33 @@ class App:
                 validator_definition
             )
 
-            self.epoch_fetcher = EpochFetcher(self.w3, validator_definition_ranges)
+            self.epoch_fetcher = EpochFetcher(
+                self.w3, validator_definition_ranges, max_reorg_depth=MAX_REORG_DEPTH
+            )
             self.primary_oracle = PrimaryOracle()
 
             static_epochs = get_static_epochs(validator_definition_ranges)
             for epoch in static_epochs:
                 self.primary_oracle.add_epoch(epoch)
 
-            self._update_epochs()
+            restored_epochs = self.epoch_fetcher.restore(
+                self.db.load_fetched_contract_epochs()
+            )
+            for epoch in restored_epochs:
+                self.primary_oracle.add_epoch(epoch)
+
+            if self.epoch_fetcher.last_fetch_height > 0:
+                self.logger.info(
+                    "restored epochs from the database",
+                    number_of_epochs=len(restored_epochs),
+                    last_fetch_height=self.epoch_fetcher.last_fetch_height,
+                )
+                self.primary_oracle.max_height = self.epoch_fetcher.last_fetch_height
+            else:
+                self._update_epochs()
 
-    def _initialize_reporters(self, app_state, skip_rate, offline_window_size):
-        if not isinstance(app_state, AppStateV2):
+    def _initialize_reporters(self, app_state, offline_windows):
+        if not isinstance(app_state, AppStateV6):
             raise InvalidAppStateException()
 
         self.block_fetcher = BlockFetcher(
@@ -300,6 +556,9 @@ class App:
             db=self.db,
             max_reorg_depth=MAX_REORG_DEPTH,
             initial_block_resolver=self.initial_block_resolver,
+            rpc_batch_size=self.rpc_batch_size,
+            max_concurrent_requests=self.max_concurrent_requests,
+            executor=self.recovery_executor,
         )
         self.skip_reporter = SkipReporter(
             state=app_state.skip_reporter_state,
@@ -309,14 +568,26 @@ class App:
         self.offline_reporter = OfflineReporter(
             state=app_state.offline_reporter_state,
             primary_oracle=self.primary_oracle,
-            offline_window_size=offline_window_size,
-            allowed_skip_rate=skip_rate,
+            offline_windows=offline_windows,
         )
         self.equivocation_reporter = EquivocationReporter(db=self.db)
 
+    def _restore_reporters(self, upgrade_db, offline_windows):
+        """Initialize the reporters from the stored app state, an app state stored as a
+        whole by an older version is migrated to the current layout"""
+        app_state = self._load_app_state()
+        if isinstance(app_state, AppStateV6):
+            self._initialize_reporters(app_state, offline_windows)
+            return
+
+        # the upgrades from v2 on do not lose any information, so they are always done
+        if upgrade_db or isinstance(app_state, (AppStateV2, AppStateV3, AppStateV4)):
+            app_state = self._upgrade_app_state(app_state, offline_windows)
+        self._migrate_legacy_app_state(app_state, offline_windows)
+
     def _initialize_app_state(self):
         self.logger.info("no state entry found, starting from fresh state")
-        return AppStateV2(
+        return AppStateV6(
             block_fetcher_state=BlockFetcher.get_fresh_state(),
             skip_reporter_state=SkipReporter.get_fresh_state(),
             offline_reporter_state=OfflineReporter.get_fresh_state(),
@@ -324,44 +595,104 @@ class App:
 
     def _load_app_state(self):
         """Loads and returns the app state object. Make sure do initialize the db first"""
-        return self.db.load_pickled(APP_STATE_KEY) or self._initialize_app_state()
-
-    def _upgrade_app_state(self, app_state):
-        if isinstance(app_state, AppStateV1):
-            self.logger.info("Upgrade appstate from v1 to v2")
-            return upgrade_v1_to_v2(app_state)
-        elif isinstance(app_state, AppStateV2):
-            return app_state
-        else:
+        legacy_app_state = self.db.load_pickled(APP_STATE_KEY)
+        if legacy_app_state is not None:
+            return legacy_app_state
+
+        block_fetcher_state_blob = self.db.load_blob(BLOCK_FETCHER_STATE_KEY)
+        if block_fetcher_state_blob is None:
+            return self._initialize_app_state()
+
+        try:
+            block_fetcher_state = BLOCK_FETCHER_STATE_CODEC.decode(
+                block_fetcher_state_blob
+            )
+            skip_reporter_state = SKIP_REPORTER_STATE_CODEC.decode(
+                self.db.load_blob(SKIP_REPORTER_STATE_KEY)
+            )
+        except DecodingError as e:
+            raise InvalidDataError(f"Invalid app state: {e}") from e
+
+        return AppStateV6(
+            block_fetcher_state=block_fetcher_state,
+            skip_reporter_state=skip_reporter_state,
+            offline_reporter_state=self.db.load_offline_reporter_state(),
+        )
+
+    def _migrate_legacy_app_state(self, legacy_app_state, offline_windows):
+        """Initialize the reporters from the app state loaded from the legacy key, store
+        their states in the current layout and delete the legacy one"""
+        if not isinstance(legacy_app_state, AppStateV5):
+            raise InvalidAppStateException()
+
+        self.logger.info("Migrate appstate to incremental storage")
+        block_fetcher_state = legacy_app_state.block_fetcher_state
+        with self.db.persistent_session() as session:
+            # the block fetcher continues with the branch staged in the db
+            self.db.replace_branch(block_fetcher_state.current_branch)
+            self._initialize_reporters(
+                AppStateV6(
+                    block_fetcher_state=block_fetcher.upgrade_v2_to_v3(
+                        block_fetcher_state
+                    ),
+                    skip_reporter_state=legacy_app_state.skip_reporter_state,
+                    offline_reporter_state=legacy_app_state.offline_reporter_state,
+                ),
+                offline_windows,
+            )
+            app_state = self.app_state
+            self._store_state_blobs(
+                app_state.block_fetcher_state, app_state.skip_reporter_state
+            )
+            self.db.replace_offline_reporter_state(app_state.offline_reporter_state)
+            self.db.delete_blob(APP_STATE_KEY)
+            session.commit()
+
+    def _upgrade_app_state(self, app_state, offline_windows):
+        try:
+            return APP_STATE_MIGRATIONS.upgrade(
+                app_state,
+                AppStateV5,
+                # older app states have been created with a single offline window,
+                # which is assumed to be the first one
+                offline_window_size=offline_windows[0].size,
+            )
+        except ValueError as e:
             raise InvalidAppStateException(
                 "Can not upgrade unsupported app state version"
-            )
+            ) from e
 
     def _register_reporter_callbacks(self):
         self.block_fetcher.register_report_callback(self.skip_reporter)
         self.block_fetcher.register_report_callback(self.equivocation_reporter)
         self.skip_reporter.register_report_callback(self.skip_logger)
         self.skip_reporter.register_report_callback(self.offline_reporter)
-        self.offline_reporter.register_report_callback(self.offline_logger)
+        # reports of additional offline windows are stored in separate files
+        for offline_window in self.offline_windows:
+            self.offline_reporter.register_report_callback(
+                functools.partial(self.offline_logger, offline_window),
+                window_size=offline_window.size,
+            )
         self.equivocation_reporter.register_report_callback(self.equivocation_logger)
 
     #
     # Reporters
     #
     def skip_logger(self, validator, skipped_proposal):
-        skip_timestamp = step_number_to_timestamp(skipped_proposal.step)
-        self.skip_file.write(
-            "{},{},{}\n".format(
-                skipped_proposal.step,
-                encode_hex(validator),
-                datetime.datetime.utcfromtimestamp(skip_timestamp),
-            )
-        )
+        # called while fetching blocks, so the skip is stored in the same transaction
+        # as the app state
+        self.db.insert_skip(validator, skipped_proposal.step)
+        if self.skip_file is not None:
+            self.skip_file.write(format_skip(validator, skipped_proposal.step))
 
-    def offline_logger(self, validator, steps):
+    def offline_logger(self, offline_window, validator, steps):
         filename = (
             f"offline_report_{encode_hex(validator)}_steps_{min(steps)}_to_{max(steps)}"
         )
+        # the reports of the first offline window keep the name used before multiple
+        # windows were supported
+        if offline_window != self.offline_windows[0]:
+            filename += f"_window_{offline_window.size * STEP_DURATION}s"
         with open(self.report_dir / filename, "w") as f:
             json.dump({"validator": encode_hex(validator), "missed_steps": steps}, f)
 
@@ -423,9 +754,26 @@ class App:
             )
 
 
+def _initialize_recovery_worker(ecc_backend):
+    # the app shuts down its worker processes itself
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    set_ecc_backend(ecc_backend)
+
+
 def validate_skip_rate(ctx, param, value):
-    if not 0 <= value <= 1:
-        raise click.BadParameter("skip rate must be a value between 0 and 1")
+    for skip_rate in value:
+        if not 0 <= skip_rate <= 1:
+            raise click.BadParameter("skip rate must be a value between 0 and 1")
+
+    return value
+
+
+def validate_ecc_backend(ctx, param, value):
+    if value != AUTO_ECC_BACKEND and value not in get_available_ecc_backends():
+        raise click.BadParameter(
+            f"{value} is not available, try to install it or use {AUTO_ECC_BACKEND}"
+        )
 
     return value
 
@@ -493,22 +841,115 @@ def create_directory(ctx, param, value):
 @click.option(
     "--skip-rate",
     "-o",
-    default=DEFAULT_ALLOWED_SKIP_RATE,
+    "skip_rates",
+    default=[DEFAULT_ALLOWED_SKIP_RATE],
     show_default=True,
     type=float,
+    multiple=True,
     callback=validate_skip_rate,
-    help="maximum rate of assigned steps a validator can skip without being reported as offline",
+    help="maximum rate of assigned steps a validator can skip without being reported as offline, "
+    "either once for all offline windows or once per offline window",
 )
 @click.option(
     "--offline-window",
     "-w",
-    "offline_window_size_in_seconds",
-    default=DEFAULT_OFFLINE_WINDOW_SIZE_IN_SECONDS,
+    "offline_window_sizes_in_seconds",
+    default=[DEFAULT_OFFLINE_WINDOW_SIZE_IN_SECONDS],
     show_default=True,
     type=click.IntRange(min=0),
-    help="size in seconds of the time window considered when determining if validators are offline or not",
+    multiple=True,
+    help="size in seconds of the time window considered when determining if validators are offline or not, "
+    "can be given multiple times to check several windows at once",
 )
 @click.option("--sync-from", default="-1000", show_default=True, help="starting block")
+@click.option(
+    "--rpc-batch-size",
+    default=DEFAULT_RPC_BATCH_SIZE,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="number of blocks requested in a single JSON RPC batch request when syncing forwards, 1 disables batching",
+)
+@click.option(
+    "--max-concurrent-requests",
+    default=DEFAULT_MAX_CONCURRENT_REQUESTS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="number of block requests kept in flight when syncing forwards",
+)
+@click.option(
+    "--recovery-processes",
+    default=DEFAULT_RECOVERY_PROCESSES,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="number of processes used to recover the proposers of fetched blocks, 1 disables parallel recovery",
+)
+@click.option(
+    "--ecc-backend",
+    default=AUTO_ECC_BACKEND,
+    show_default=True,
+    type=click.Choice([AUTO_ECC_BACKEND, *ECC_BACKENDS]),
+    callback=validate_ecc_backend,
+    help="secp256k1 implementation used to recover the proposers of fetched blocks, auto selects the fastest available one",
+)
+@click.option(
+    "--export-skip-file/--no-export-skip-file",
+    default=True,
+    show_default=True,
+    help="append reported skips to the skips file in the report directory, they are always stored in the database",
+)
+@click.option(
+    "--retain-blocks",
+    default=None,
+    type=click.IntRange(min=MAX_REORG_DEPTH),
+    help="number of blocks behind the latest fetched block that are kept in the database, older ones are deleted",
+)
+@click.option(
+    "--retain-steps",
+    default=None,
+    type=click.IntRange(min=1),
+    help=f"number of steps behind the latest fetched block whose blocks are kept in the database, older ones are deleted, but at least the latest {MAX_REORG_DEPTH} blocks are kept",
+)
+@click.option(
+    "--sqlite-journal-mode",
+    default=SQLiteProfile().journal_mode,
+    show_default=True,
+    type=click.Choice(SQLITE_JOURNAL_MODES),
+    help="journal mode of the database",
+)
+@click.option(
+    "--sqlite-synchronous",
+    default=SQLiteProfile().synchronous,
+    show_default=True,
+    type=click.Choice(SQLITE_SYNCHRONOUS_LEVELS),
+    help="how often the database waits for data to be written to disk, see the SQLite documentation of PRAGMA synchronous",
+)
+@click.option(
+    "--sqlite-cache-size",
+    default=SQLiteProfile().cache_size,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="size of the page cache of the database in KiB",
+)
+@click.option(
+    "--sqlite-mmap-size",
+    default=SQLiteProfile().mmap_size,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="maximum number of bytes of the database file accessed via memory mapping, 0 disables memory mapping",
+)
+@click.option(
+    "--sqlite-busy-timeout",
+    default=SQLiteProfile().busy_timeout,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="time in milliseconds to wait for a lock on the database",
+)
+@click.option(
+    "--subscription-uri",
+    "-s",
+    default=None,
+    help="WebSocket URI or IPC path of the node to subscribe to new blocks instead of polling for them",
+)
 @click.option(
     "--upgrade-db",
     help="Allow to upgrade the database (experimental). Some skips will be missed around the upgrade time",
@@ -528,15 +969,63 @@ def main(
     chain_spec_path,
     report_dir,
     db_dir,
-    skip_rate,
-    offline_window_size_in_seconds,
+    skip_rates,
+    offline_window_sizes_in_seconds,
     sync_from,
+    rpc_batch_size,
+    max_concurrent_requests,
+    recovery_processes,
+    ecc_backend,
+    export_skip_file,
+    retain_blocks,
+    retain_steps,
+    sqlite_journal_mode,
+    sqlite_synchronous,
+    sqlite_cache_size,
+    sqlite_mmap_size,
+    sqlite_busy_timeout,
+    subscription_uri,
     upgrade_db,
     version,
     watch_chain_spec,
 ):
+    configure_logging()
+
+    if retain_blocks is not None and retain_steps is not None:
+        raise click.BadOptionUsage(
+            "retain_steps", "--retain-blocks and --retain-steps are mutually exclusive"
+        )
+    elif retain_blocks is not None:
+        retention_policy = RetentionPolicy(unit="blocks", size=retain_blocks)
+    elif retain_steps is not None:
+        retention_policy = RetentionPolicy(unit="steps", size=retain_steps)
+    else:
+        retention_policy = None
+
+    if len(skip_rates) == 1:
+        skip_rates = skip_rates * len(offline_window_sizes_in_seconds)
+    elif len(skip_rates) != len(offline_window_sizes_in_seconds):
+        raise click.BadOptionUsage(
+            "skip_rates",
+            "--skip-rate has to be given either once or once per --offline-window",
+        )
+    offline_windows = [
+        OfflineWindow(
+            size=offline_window_size_in_seconds // STEP_DURATION,
+            allowed_skip_rate=skip_rate,
+        )
+        for offline_window_size_in_seconds, skip_rate in zip(
+            offline_window_sizes_in_seconds, skip_rates
+        )
+    ]
+    if len({offline_window.size for offline_window in offline_windows}) != len(
+        offline_windows
+    ):
+        raise click.BadOptionUsage(
+            "offline_window_sizes_in_seconds", "offline windows must be distinct"
+        )
+
     initial_block_resolver = blocksel.make_blockresolver(sync_from)
-    offline_window_size_in_steps = offline_window_size_in_seconds // STEP_DURATION
     db_path = Path(db_dir) / DB_FILE_NAME
     try:
         app = App(
@@ -544,11 +1033,24 @@ def main(
             chain_spec_path=Path(chain_spec_path),
             report_dir=Path(report_dir),
             db_path=db_path,
-            skip_rate=skip_rate,
-            offline_window_size=offline_window_size_in_steps,
+            offline_windows=offline_windows,
             initial_block_resolver=initial_block_resolver,
             upgrade_db=upgrade_db,
             watch_chain_spec=watch_chain_spec,
+            rpc_batch_size=rpc_batch_size,
+            max_concurrent_requests=max_concurrent_requests,
+            subscription_uri=subscription_uri,
+            recovery_processes=recovery_processes,
+            ecc_backend=ecc_backend,
+            retention_policy=retention_policy,
+            export_skip_file=export_skip_file,
+            sqlite_profile=SQLiteProfile(
+                journal_mode=sqlite_journal_mode,
+                synchronous=sqlite_synchronous,
+                cache_size=sqlite_cache_size,
+                mmap_size=sqlite_mmap_size,
+                busy_timeout=sqlite_busy_timeout,
+            ),
         )
 
         signal.signal(signal.SIGTERM, lambda _signum, _frame: app.stop())
@@ -566,5 +1068,70 @@ def main(
         ) from e
 
 
+def validate_validator_address(ctx, param, value):
+    if value is None:
+        return None
+    if not is_hex_address(value):
+        raise click.BadParameter(f"{value} is not a hex address")
+    return to_canonical_address(value)
+
+
+def first_step_number_at_or_after(date: datetime.datetime) -> int:
+    timestamp = int(date.replace(tzinfo=datetime.timezone.utc).timestamp())
+    return -(-timestamp // STEP_DURATION)
+
+
+@click.command()
+@click.option(
+    "--db-dir",
+    "-d",
+    default=default_db_dir,
+    show_default=True,
+    type=click.Path(exists=True, file_okay=False, resolve_path=True),
+    help="path to the directory in which the database of the monitor is stored",
+)
+@click.option(
+    "--validator",
+    "-v",
+    default=None,
+    callback=validate_validator_address,
+    help="only show the skips of the validator with this address",
+)
+@click.option(
+    "--since",
+    default=None,
+    type=click.DateTime(),
+    help="only show the skips at or after this UTC date",
+)
+@click.option(
+    "--until",
+    default=None,
+    type=click.DateTime(),
+    help="only show the skips before this UTC date",
+)
+def query_skips(db_dir, validator, since, until):
+    """Print the skips stored in the database in the format of the skips file."""
+    db_path = Path(db_dir) / DB_FILE_NAME
+    if not db_path.is_file():
+        raise click.ClickException(f"No database found at {db_path}")
+
+    # the database is only read, so that it can be queried while the monitor is running
+    session = sessionmaker(bind=db.create_read_only_engine(db_path))()
+    try:
+        skips = db.get_skips(
+            session,
+            validator=validator,
+            min_step=first_step_number_at_or_after(since) if since else None,
+            max_step=first_step_number_at_or_after(until) - 1 if until else None,
+        )
+    except DatabaseError as e:
+        raise click.ClickException(f"Can not read skips from database: {e}") from e
+    finally:
+        session.close()
+
+    for skip in skips:
+        click.echo(format_skip(skip.validator, skip.step), nl=False)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+"""wait for new blocks, either by polling or by subscribing to new heads"""
+import asyncio
+import json
+import threading
+import time
+
+import structlog
+import websockets
+
+
+SUBSCRIBE_REQUEST_ID = 1
+RECONNECT_INTERVAL = 5  # seconds
+
+
+class HeadPoller:
+    """Wait for new heads by sleeping for a fixed interval."""
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+
+    def start(self):
+        pass
+
+    def wait_for_new_head(self) -> bool:
+        time.sleep(self.poll_interval)
+        return False
+
+
+class _WebsocketConnection:
+    def __init__(self, uri):
+        self.uri = uri
+        self._websocket = None
+
+    async def __aenter__(self):
+        self._websocket = await websockets.connect(self.uri)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._websocket.close()
+
+    async def send(self, message: str) -> None:
+        await self._websocket.send(message)
+
+    async def receive(self):
+        return json.loads(await self._websocket.recv())
+
+
+class _IPCConnection:
+    def __init__(self, path):
+        self.path = path
+        self._reader = None
+        self._writer = None
+        self._buffer = ""
+        self._decoder = json.JSONDecoder()
+
+    async def __aenter__(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._writer.close()
+
+    async def send(self, message: str) -> None:
+        self._writer.write(message.encode())
+        await self._writer.drain()
+
+    async def receive(self):
+        """receive the next JSON message, IPC messages are not delimited"""
+        while True:
+            self._buffer = self._buffer.lstrip()
+            try:
+                message, end = self._decoder.raw_decode(self._buffer)
+            except json.JSONDecodeError:
+                data = await self._reader.read(4096)
+                if not data:
+                    raise ConnectionError("IPC connection closed")
+                self._buffer += data.decode()
+            else:
+                self._buffer = self._buffer[end:]
+                return message
+
+
+def _open_connection(uri):
+    if uri.startswith(("ws://", "wss://")):
+        return _WebsocketConnection(uri)
+    else:
+        return _IPCConnection(uri)
+
+
+class HeadSubscription:
+    """Wait for new heads announced by the node via an `eth_subscribe` subscription.
+
+    The subscription is kept alive in a background thread and reconnected if the
+    connection fails. While it is not established, waiting falls back to polling.
+    """
+
+    logger = structlog.get_logger("monitor.new_heads")
+
+    def __init__(self, uri, *, poll_interval, timeout):
+        """
+        :param uri: WebSocket URI or IPC path of the node
+        :param poll_interval: time to wait while not subscribed
+        :param timeout: maximum time to wait for a new head while subscribed
+        """
+        self.uri = uri
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        self.subscribed = False
+        self._new_head = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wait_for_new_head(self) -> bool:
+        """wait until a new head has arrived since the last call or the timeout has passed
+
+        Returns True if a new head has arrived.
+        """
+        timeout = self.timeout if self.subscribed else self.poll_interval
+        new_head_arrived = self._new_head.wait(timeout)
+        self._new_head.clear()
+        return new_head_arrived
+
+    def _run(self):
+        asyncio.run(self._subscribe_forever())
+
+    async def _subscribe_forever(self):
+        while True:
+            try:
+                await self._subscribe()
+            except (OSError, ValueError, KeyError, websockets.WebSocketException) as e:
+                self.logger.warning(
+                    f"New heads subscription failed, polling until reconnected: {e}"
+                )
+            except Exception:
+                # the thread must not end, otherwise it would poll forever
+                self.logger.exception(
+                    "New heads subscription failed unexpectedly, polling until reconnected"
+                )
+            finally:
+                self.subscribed = False
+            await asyncio.sleep(RECONNECT_INTERVAL)
+
+    async def _subscribe(self):
+        async with _open_connection(self.uri) as connection:
+            await connection.send(
+                json.dumps(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": SUBSCRIBE_REQUEST_ID,
+                        "method": "eth_subscribe",
+                        "params": ["newHeads"],
+                    }
+                )
+            )
+            response = await connection.receive()
+            if "error" in response:
+                raise ValueError(f"eth_subscribe failed: {response['error']}")
+            subscription_id = response["result"]
+
+            self.subscribed = True
+            self.logger.info("Subscribed to new heads", uri=self.uri)
+            # a head might have arrived while we were not subscribed
+            self._new_head.set()
+
+            while True:
+                message = await connection.receive()
+                if (
+                    message.get("method") == "eth_subscription"
+                    and message["params"]["subscription"] == subscription_id
+                ):
+                    self._new_head.set()
@@ -1,6 +1,17 @@
-from bisect import bisect_right
-from collections import defaultdict
-from typing import Any, NamedTuple, List, Callable, Set, Dict, DefaultDict
+from collections import defaultdict, deque
+from typing import (
+    Any,
+    NamedTuple,
+    List,
+    Callable,
+    Set,
+    Dict,
+    DefaultDict,
+    Deque,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import structlog
 
@@ -47,36 +58,161 @@ def upgrade_v1_to_v2(v1: OfflineReporterStateV1):
     )
 
 
+class OfflineReporterStateV3(NamedTuple):
+    # the offline intervals are shared by all offline windows, they are kept as long as
+    # they are within the largest one
+    recent_offline_intervals_by_validator: Dict[bytes, List[OfflineInterval]]
+    reported_validators_by_window_size: Dict[int, Set[bytes]]
+
+
+def upgrade_v2_to_v3(v2: OfflineReporterStateV2, offline_window_size: int):
+    # The offline times are recomputed from the offline intervals, the reported
+    # validators are assigned to the offline window the v2 state has been created with
+    return OfflineReporterStateV3(
+        recent_offline_intervals_by_validator=v2.recent_offline_intervals_by_validator,
+        reported_validators_by_window_size={
+            offline_window_size: v2.reported_validators
+        },
+    )
+
+
+class OfflineReporterStateChanges(NamedTuple):
+    """Changes of the state since they have been popped the last time."""
+
+    added_offline_intervals: List[Tuple[bytes, OfflineInterval]]
+    # validators and steps of the removed intervals
+    removed_offline_intervals: List[Tuple[bytes, int]]
+    # window sizes and validators
+    reported_validators: List[Tuple[int, bytes]]
+
+
+class OfflineWindow(NamedTuple):
+    # size of the window in number of steps
+    size: int
+
+    # maximum rate of assigned steps a validator can skip within the window
+    allowed_skip_rate: float
+
+
+class _OfflineWindowTracker:
+    """Track the offline time of validators within a single offline window.
+
+    The offline intervals are kept in a queue shared by all windows, a window only keeps
+    the index of its oldest interval in it.
+    """
+
+    def __init__(self, offline_window: OfflineWindow, reported_validators: Set[bytes]):
+        self.offline_window = offline_window
+        self.reported_validators = reported_validators
+
+        # offline time in number of steps
+        self.offline_time_by_validator: DefaultDict[bytes, int] = defaultdict(int)
+
+        # index of the oldest offline interval within the window in the shared queue
+        self.first_offline_interval_index = 0
+
+        self.report_callbacks: List[Callable[[bytes, List[int]], Any]] = []
+
+    def add_offline_interval(
+        self, validator: bytes, offline_interval: OfflineInterval
+    ) -> None:
+        self.offline_time_by_validator[validator] += offline_interval.length
+
+    def clear_outdated_offline_intervals(
+        self, offline_interval_queue: Deque[Tuple[int, bytes, int]], current_step: int
+    ) -> None:
+        """clear the offline intervals of the shared queue that fell out of the window"""
+        cutoff = current_step - self.offline_window.size
+
+        while (
+            self.first_offline_interval_index < len(offline_interval_queue)
+            and offline_interval_queue[self.first_offline_interval_index][0] < cutoff
+        ):
+            _, validator, length = offline_interval_queue[
+                self.first_offline_interval_index
+            ]
+            self.offline_time_by_validator[validator] -= length
+            if self.offline_time_by_validator[validator] == 0:
+                del self.offline_time_by_validator[validator]
+            self.first_offline_interval_index += 1
+
+    def is_offline(self, validator: bytes) -> bool:
+        skip_rate = self.offline_time_by_validator[validator] / self.offline_window.size
+        return skip_rate > self.offline_window.allowed_skip_rate
+
+
 class OfflineReporter:
     """Report when validators are offline.
 
     The reporter expects to be notified whenever a validator has failed to propose during a step
     they were the primary of by calling it with the primary address and the skipped proposal.
+
+    Validators are checked against several offline windows at once. The offline intervals are
+    shared between them in a single queue ordered by step, each window only keeps track of
+    the offline times and of its position in the queue.
     """
 
     logger = structlog.get_logger("monitor.offline_reporter")
 
     def __init__(
         self,
-        state: OfflineReporterStateV2,
+        state: OfflineReporterStateV3,
         primary_oracle: PrimaryOracle,
-        offline_window_size,
-        allowed_skip_rate,
+        offline_windows: Sequence[OfflineWindow],
     ):
-        self.primary_oracle = primary_oracle
+        window_sizes = [offline_window.size for offline_window in offline_windows]
+        if not window_sizes:
+            raise ValueError("At least one offline window is required")
+        if len(set(window_sizes)) != len(window_sizes):
+            raise ValueError("The sizes of the offline windows must be distinct")
 
-        self.offline_window_size = offline_window_size
-        self.allowed_skip_rate = allowed_skip_rate
+        self.primary_oracle = primary_oracle
 
-        self.reported_validators = state.reported_validators
-        self.recent_offline_intervals_by_validator = defaultdict(
-            list, state.recent_offline_intervals_by_validator
+        self.recent_offline_intervals_by_validator: DefaultDict[
+            bytes, Deque[OfflineInterval]
+        ] = defaultdict(
+            deque,
+            {
+                validator: deque(offline_intervals)
+                for validator, offline_intervals in (
+                    state.recent_offline_intervals_by_validator.items()
+                )
+            },
         )
-        self.offline_time_by_validator = defaultdict(
-            int, state.offline_time_by_validator
+
+        # steps, validators and lengths of the offline intervals within the largest window
+        # ordered by step, so that outdated intervals can be cleared without looking at
+        # every validator
+        self.offline_interval_queue: Deque[Tuple[int, bytes, int]] = deque(
+            sorted(
+                (offline_interval.step, validator, offline_interval.length)
+                for validator, offline_intervals in (
+                    self.recent_offline_intervals_by_validator.items()
+                )
+                for offline_interval in offline_intervals
+            )
         )
 
-        self.report_callbacks: List[Callable[[bytes, List[int]], Any]] = []
+        # ordered by window size
+        self.window_trackers = [
+            _OfflineWindowTracker(
+                offline_window,
+                reported_validators=set(
+                    state.reported_validators_by_window_size.get(
+                        offline_window.size, set()
+                    )
+                ),
+            )
+            for offline_window in sorted(offline_windows)
+        ]
+        for window_tracker in self.window_trackers:
+            for step, validator, length in self.offline_interval_queue:
+                window_tracker.add_offline_interval(
+                    validator, OfflineInterval(step, length)
+                )
+
+        # the given state is assumed to be stored already
+        self._state_changes = OfflineReporterStateChanges([], [], [])
 
     @classmethod
     def from_fresh_state(cls, *args, **kwargs):
@@ -84,83 +220,154 @@ class OfflineReporter:
 
     @staticmethod
     def get_fresh_state():
-        return OfflineReporterStateV2(
-            reported_validators=set(),
+        return OfflineReporterStateV3(
             recent_offline_intervals_by_validator={},
-            offline_time_by_validator={},
+            reported_validators_by_window_size={},
         )
 
     @property
     def state(self):
-        return OfflineReporterStateV2(
-            reported_validators=self.reported_validators,
-            recent_offline_intervals_by_validator=dict(
-                self.recent_offline_intervals_by_validator
-            ),
-            offline_time_by_validator=self.offline_time_by_validator,
+        return OfflineReporterStateV3(
+            recent_offline_intervals_by_validator={
+                validator: list(offline_intervals)
+                for validator, offline_intervals in (
+                    self.recent_offline_intervals_by_validator.items()
+                )
+            },
+            reported_validators_by_window_size={
+                window_tracker.offline_window.size: window_tracker.reported_validators
+                for window_tracker in self.window_trackers
+            },
         )
 
-    def register_report_callback(self, callback):
-        self.report_callbacks.append(callback)
+    def pop_state_changes(self) -> OfflineReporterStateChanges:
+        """return the changes of the state since the last call, so that only those have
+        to be stored"""
+        state_changes = self._state_changes
+        self._state_changes = OfflineReporterStateChanges([], [], [])
+        return state_changes
+
+    @property
+    def offline_windows(self) -> List[OfflineWindow]:
+        return [
+            window_tracker.offline_window for window_tracker in self.window_trackers
+        ]
+
+    def register_report_callback(self, callback, window_size: Optional[int] = None):
+        """register a callback for the reports of the offline window with the given size
+
+        If no size is given, the callback is registered for all offline windows.
+        """
+        window_trackers = [
+            window_tracker
+            for window_tracker in self.window_trackers
+            if window_size is None or window_tracker.offline_window.size == window_size
+        ]
+        if not window_trackers:
+            raise ValueError(f"There is no offline window of size {window_size}")
+
+        for window_tracker in window_trackers:
+            window_tracker.report_callbacks.append(callback)
 
     def __call__(self, primary, skipped_proposal: SkippedProposal):
-        if primary in self.reported_validators:
-            return  # ignore validators that have already been reported
+        unreported_window_trackers = [
+            window_tracker
+            for window_tracker in self.window_trackers
+            if primary not in window_tracker.reported_validators
+        ]
+        if not unreported_window_trackers:
+            return  # ignore validators that have already been reported in every window
 
         step = skipped_proposal.step
 
         self._clear_outdated_offline_intervals(step)
         self._update_offline_intervals(primary, skipped_proposal)
 
-        if self._is_offline(primary):
-            self.logger.info(
-                "Detected offline validator", address=encode_hex(primary), step=step
-            )
+        for window_tracker in unreported_window_trackers:
+            if window_tracker.is_offline(primary):
+                self._report(window_tracker, primary, step)
+
+        if all(
+            primary in window_tracker.reported_validators
+            for window_tracker in self.window_trackers
+        ):
+            for offline_interval in self.recent_offline_intervals_by_validator.pop(
+                primary
+            ):
+                self._state_changes.removed_offline_intervals.append(
+                    (primary, offline_interval.step)
+                )
 
-            self.reported_validators.add(primary)
-            offline_steps = self.recent_offline_intervals_by_validator.pop(primary)
+    def _report(self, window_tracker, validator: bytes, step: int) -> None:
+        window_size = window_tracker.offline_window.size
+        self.logger.info(
+            "Detected offline validator",
+            address=encode_hex(validator),
+            step=step,
+            window_size=window_size,
+        )
 
-            for callback in self.report_callbacks:
-                callback(
-                    primary,
-                    list(sorted(offline_step.step for offline_step in offline_steps)),
-                )
+        window_tracker.reported_validators.add(validator)
+        self._state_changes.reported_validators.append((window_size, validator))
+        # the intervals of larger windows might be older than the reported window
+        offline_steps = [
+            offline_interval.step
+            for offline_interval in self.recent_offline_intervals_by_validator[
+                validator
+            ]
+            if offline_interval.step >= step - window_size
+        ]
+
+        for callback in window_tracker.report_callbacks:
+            callback(validator, offline_steps)
 
     def _update_offline_intervals(
         self, validator: bytes, skipped_proposal: SkippedProposal
     ) -> None:
-        # It is important that they are ordered
-        if self.recent_offline_intervals_by_validator[validator]:
-            assert (
-                skipped_proposal.step
-                > self.recent_offline_intervals_by_validator[validator][-1].step
-            )
+        # It is important that they are ordered, the skips of all validators are reported
+        # in order of their steps
+        if self.offline_interval_queue:
+            assert skipped_proposal.step > self.offline_interval_queue[-1][0]
         length = len(self.primary_oracle.get_validators(skipped_proposal.block_height))
+        offline_interval = OfflineInterval(skipped_proposal.step, length=length)
 
-        self.recent_offline_intervals_by_validator[validator].append(
-            OfflineInterval(skipped_proposal.step, length=length)
+        self.recent_offline_intervals_by_validator[validator].append(offline_interval)
+        self._state_changes.added_offline_intervals.append(
+            (validator, offline_interval)
         )
-        self.offline_time_by_validator[validator] += length
+        self.offline_interval_queue.append(
+            (offline_interval.step, validator, offline_interval.length)
+        )
+        # validators stay tracked in windows they have been reported in already, so
+        # that the shared intervals expire with the largest window
+        for window_tracker in self.window_trackers:
+            window_tracker.add_offline_interval(validator, offline_interval)
 
     def _clear_outdated_offline_intervals(self, current_step) -> None:
-        cutoff = current_step - self.offline_window_size
-        cleared_offline_steps_by_validator: DefaultDict[
-            bytes, List[OfflineInterval]
-        ] = defaultdict(list)
-
-        for (
-            validator,
-            offline_steps,
-        ) in self.recent_offline_intervals_by_validator.items():
-            # OfflineStep(cutoff, 0) is used because bisect does not support a key
-            index = bisect_right(offline_steps, OfflineInterval(cutoff, 0))
-            cleared_offline_steps_by_validator[validator] = offline_steps[index:]
-
-            for offline_step in offline_steps[:index]:
-                self.offline_time_by_validator[validator] -= offline_step.length
-
-        self.recent_offline_intervals_by_validator = cleared_offline_steps_by_validator
-
-    def _is_offline(self, validator: bytes) -> bool:
-        skip_rate = self.offline_time_by_validator[validator] / self.offline_window_size
-        return skip_rate > self.allowed_skip_rate
+        for window_tracker in self.window_trackers:
+            window_tracker.clear_outdated_offline_intervals(
+                self.offline_interval_queue, current_step
+            )
+
+        # the shared intervals are removed once they fell out of the largest window,
+        # which is the last window they fall out of
+        largest_window_tracker = self.window_trackers[-1]
+        number_of_outdated_intervals = (
+            largest_window_tracker.first_offline_interval_index
+        )
+        for window_tracker in self.window_trackers:
+            window_tracker.first_offline_interval_index -= number_of_outdated_intervals
+
+        for _ in range(number_of_outdated_intervals):
+            step, validator, _ = self.offline_interval_queue.popleft()
+            # the intervals of validators reported in all windows have been removed already
+            offline_intervals = self.recent_offline_intervals_by_validator.get(
+                validator
+            )
+            if not offline_intervals or offline_intervals[0].step != step:
+                continue
+
+            offline_intervals.popleft()
+            self._state_changes.removed_offline_intervals.append((validator, step))
+            if not offline_intervals:
+                del self.recent_offline_intervals_by_validator[validator]
@@ -0,0 +1,176 @@
+"""send multiple JSON RPC requests as a single batch
+
+web3.py does not support JSON RPC batch requests. To still get exactly the same
+results as for single requests, every request is passed through the middlewares
+of the web3 instance twice: once to find out what the provider would send to the
+node and, after the batch has been answered, once more to format the raw response
+just like web3 would have done it.
+"""
+import json
+from typing import Any, List, Sequence, Tuple
+
+from eth_utils import to_bytes
+from hexbytes import HexBytes
+from web3 import HTTPProvider
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.blocks import select_method_for_block_identifier
+from web3._utils.contracts import prepare_transaction
+from web3._utils.encoding import Web3JsonEncoder
+from web3._utils.request import make_post_request
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.middleware import combine_middlewares
+from web3.types import RPCEndpoint, RPCResponse
+
+from monitor.web3_retry_middleware import http_retry_request_middleware_endlessly
+
+Request = Tuple[RPCEndpoint, Any]
+
+
+class _CapturedRequest(Exception):
+    def __init__(self, method, params):
+        super().__init__(method, params)
+        self.method = method
+        self.params = params
+
+
+def _capture_request(method, params):
+    raise _CapturedRequest(method, params)
+
+
+def _request_func(w3, provider_request_fn):
+    return combine_middlewares(
+        middlewares=tuple(w3.middleware_onion) + tuple(w3.provider.middlewares),
+        web3=w3,
+        provider_request_fn=provider_request_fn,
+    )
+
+
+def _get_provider_request(w3, method, params) -> Request:
+    """return the request as the provider of w3 would receive it"""
+    try:
+        _request_func(w3, _capture_request)(method, params)
+    except _CapturedRequest as captured_request:
+        return captured_request.method, captured_request.params
+    raise ValueError(f"Request {method} is not passed on to the provider")
+
+
+def _format_response(w3, method, params, raw_response: RPCResponse) -> Any:
+    """format the raw response to a request like web3 would do it"""
+    response = _request_func(w3, lambda _method, _params: raw_response)(method, params)
+    if "error" in response:
+        raise ValueError(response["error"])
+    return response["result"]
+
+
+def _post_batch(w3, provider_requests: Sequence[Request]) -> List[RPCResponse]:
+    provider = w3.provider
+    batch = [
+        {"jsonrpc": "2.0", "method": method, "params": params or [], "id": request_id}
+        for request_id, (method, params) in enumerate(provider_requests)
+    ]
+    request_data = to_bytes(text=json.dumps(batch, cls=Web3JsonEncoder))
+
+    def post(_method, data):
+        return make_post_request(
+            provider.endpoint_uri, data, **provider.get_request_kwargs()
+        )
+
+    raw_response = http_retry_request_middleware_endlessly(post, w3)(
+        "batch", request_data
+    )
+    responses = provider.decode_rpc_response(raw_response)
+
+    if not isinstance(responses, list):
+        # nodes answer with a single error if they fail to handle the batch as a whole
+        raise ValueError(f"Batch request failed: {responses.get('error', responses)}")
+
+    responses_by_id = {response["id"]: response for response in responses}
+    try:
+        return [responses_by_id[request_id] for request_id in range(len(batch))]
+    except KeyError as e:
+        raise ValueError(f"Missing response to request {e} of batch request") from e
+
+
+def make_batch_request(w3, requests: Sequence[Request]) -> List[Any]:
+    """make the given (method, params) requests and return their results in order
+
+    If the provider talks HTTP, all requests are sent in a single JSON RPC batch,
+    otherwise they are made one after another.
+    """
+    provider_requests = [
+        _get_provider_request(w3, method, params) for method, params in requests
+    ]
+
+    if isinstance(w3.provider, HTTPProvider):
+        raw_responses = _post_batch(w3, provider_requests)
+    else:
+        raw_responses = [
+            w3.provider.make_request(method, params)
+            for method, params in provider_requests
+        ]
+
+    return [
+        _format_response(w3, method, params, raw_response)
+        for (method, params), raw_response in zip(requests, raw_responses)
+    ]
+
+
+def get_blocks(w3, block_identifiers) -> List[Any]:
+    """fetch the given blocks with a single batch request
+
+    In contrast to w3.eth.getBlock, blocks that can not be found are returned as
+    `None` instead of raising an exception.
+    """
+    return make_batch_request(
+        w3,
+        [
+            (
+                select_method_for_block_identifier(
+                    block_identifier,
+                    if_predefined=RPCEndpoint("eth_getBlockByNumber"),
+                    if_hash=RPCEndpoint("eth_getBlockByHash"),
+                    if_number=RPCEndpoint("eth_getBlockByNumber"),
+                ),
+                [block_identifier, False],
+            )
+            for block_identifier in block_identifiers
+        ],
+    )
+
+
+def call_contract_functions(w3, contract_functions, block_identifier) -> List[Any]:
+    """call the given contract functions with a single batch request
+
+    The results are decoded just like `ContractFunction.call` would do it.
+    """
+    call_transactions = [
+        prepare_transaction(
+            contract_function.address,
+            w3,
+            fn_identifier=contract_function.function_identifier,
+            contract_abi=contract_function.contract_abi,
+            fn_abi=contract_function.abi,
+            transaction={},
+            fn_args=contract_function.args,
+            fn_kwargs=contract_function.kwargs,
+        )
+        for contract_function in contract_functions
+    ]
+    return_data = make_batch_request(
+        w3,
+        [
+            (RPCEndpoint("eth_call"), [call_transaction, block_identifier])
+            for call_transaction in call_transactions
+        ],
+    )
+
+    results = []
+    for contract_function, data in zip(contract_functions, return_data):
+        output_types = get_abi_output_types(contract_function.abi)
+        output_data = map_abi_data(
+            BASE_RETURN_NORMALIZERS,
+            output_types,
+            w3.codec.decode_abi(output_types, HexBytes(data)),
+        )
+        results.append(output_data[0] if len(output_data) == 1 else output_data)
+    return results
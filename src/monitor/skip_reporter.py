@@ -1,3 +1,5 @@
+import bisect
+import math
 from typing import Any, NamedTuple, List, Callable, Set
 
 import structlog
@@ -21,16 +23,58 @@ class SkipReporterStateV2(NamedTuple):
     open_skipped_proposals: Set["SkippedProposal"]
 
 
+class SkipReporterStateV3(NamedTuple):
+    latest_step: int
+    open_skipped_step_ranges: List["SkippedStepRange"]
+
+
 def upgrade_v1_to_v2(v1: SkipReporterStateV1):
     # As we can not recover the block height, we will just clear the proposels
     return SkipReporterStateV2(latest_step=v1.latest_step, open_skipped_proposals=set())
 
 
+def upgrade_v2_to_v3(v2: SkipReporterStateV2):
+    open_skipped_step_ranges: List[SkippedStepRange] = []
+    for proposal in sorted(v2.open_skipped_proposals):
+        if (
+            open_skipped_step_ranges
+            and open_skipped_step_ranges[-1].last_step == proposal.step - 1
+            and open_skipped_step_ranges[-1].block_height == proposal.block_height
+        ):
+            open_skipped_step_ranges[-1] = open_skipped_step_ranges[-1]._replace(
+                last_step=proposal.step
+            )
+        else:
+            open_skipped_step_ranges.append(
+                SkippedStepRange(proposal.step, proposal.step, proposal.block_height)
+            )
+    return SkipReporterStateV3(
+        latest_step=v2.latest_step, open_skipped_step_ranges=open_skipped_step_ranges
+    )
+
+
 class SkippedProposal(NamedTuple):
     step: int
     block_height: int
 
 
+class SkippedStepRange(NamedTuple):
+    """Consecutive skipped steps (inclusive) before the block at the given height"""
+
+    first_step: int
+    last_step: int
+    block_height: int
+
+    def proposals(self, last_step=None):
+        """return the skipped proposals of the range, up to last_step if given"""
+        if last_step is None or last_step > self.last_step:
+            last_step = self.last_step
+        return [
+            SkippedProposal(step, self.block_height)
+            for step in range(self.first_step, last_step + 1)
+        ]
+
+
 class SkipReporter:
     """Report whenever validators do not propose in time.
 
@@ -47,7 +91,10 @@ class SkipReporter:
         self.grace_period = grace_period
 
         self.latest_step = state.latest_step
-        self.open_skipped_proposals = state.open_skipped_proposals
+        # disjoint ranges of open skipped steps in ascending order, so that long gaps do
+        # not have to be stored step by step
+        self.open_skipped_step_ranges = list(state.open_skipped_step_ranges)
+
         self.report_callbacks: List[Callable[[bytes, int], Any]] = []
 
     @classmethod
@@ -56,13 +103,21 @@ class SkipReporter:
 
     @staticmethod
     def get_fresh_state():
-        return SkipReporterStateV2(latest_step=0, open_skipped_proposals=set())
+        return SkipReporterStateV3(latest_step=0, open_skipped_step_ranges=[])
+
+    @property
+    def open_skipped_proposals(self) -> Set[SkippedProposal]:
+        return {
+            proposal
+            for step_range in self.open_skipped_step_ranges
+            for proposal in step_range.proposals()
+        }
 
     @property
     def state(self):
-        return SkipReporterStateV2(
+        return SkipReporterStateV3(
             latest_step=self.latest_step,
-            open_skipped_proposals=self.open_skipped_proposals,
+            open_skipped_step_ranges=list(self.open_skipped_step_ranges),
         )
 
     def register_report_callback(self, callback):
@@ -88,7 +143,6 @@ class SkipReporter:
         # report misses
         missed_proposals = self.get_missed_proposals()
 
-        reported_proposals = set()
         for proposal in missed_proposals:
             primary = self.primary_oracle.get_primary(
                 height=proposal.block_height, step=proposal.step
@@ -99,32 +153,36 @@ class SkipReporter:
             for callback in self.report_callbacks:
                 callback(primary, proposal)
 
-            reported_proposals.add(proposal)
-
-        # remove misses from open steps as they have been reported already
-        self.open_skipped_proposals -= set(reported_proposals)
+            # remove misses from open steps as they have been reported already
+            self.remove_open_skipped_proposals_with_step(proposal.step)
 
     def update_open_skipped_proposals(self, step_seen, block_height_seen):
-        if step_seen > self.latest_step:
-            for step in range(self.latest_step + 1, step_seen):
-                skipped_proposal = SkippedProposal(step, block_height_seen)
-                self.open_skipped_proposals.add(skipped_proposal)
-            self.latest_step = step_seen
+        if step_seen > self.latest_step + 1:
+            self.open_skipped_step_ranges.append(
+                SkippedStepRange(self.latest_step + 1, step_seen - 1, block_height_seen)
+            )
+        self.latest_step = max(self.latest_step, step_seen)
 
     def remove_open_skipped_proposals_with_step(self, step):
+        index = bisect.bisect_right(self.open_skipped_step_ranges, (step, math.inf)) - 1
+        if index < 0 or self.open_skipped_step_ranges[index].last_step < step:
+            return
 
-        self.open_skipped_proposals = {
-            proposal
-            for proposal in self.open_skipped_proposals
-            if proposal.step != step
-        }
+        step_range = self.open_skipped_step_ranges.pop(index)
+        if step < step_range.last_step:
+            self.open_skipped_step_ranges.insert(
+                index, step_range._replace(first_step=step + 1)
+            )
+        if step_range.first_step < step:
+            self.open_skipped_step_ranges.insert(
+                index, step_range._replace(last_step=step - 1)
+            )
 
     def get_missed_proposals(self):
         grace_period_end = self.latest_step - self.grace_period
-        missed_skips = [
-            skipped_proposal
-            for skipped_proposal in self.open_skipped_proposals
-            if skipped_proposal.step < grace_period_end
-        ]
-        missed_skips = sorted(missed_skips, key=lambda x: x.step)
-        return missed_skips
+        missed_proposals = []
+        for step_range in self.open_skipped_step_ranges:
+            if step_range.first_step >= grace_period_end:
+                break
+            missed_proposals += step_range.proposals(last_step=grace_period_end - 1)
+        return missed_proposals
@@ -0,0 +1,66 @@
+"""Versioned binary formats of the states stored as blobs"""
+from monitor.block_fetcher import BlockFetcherStateV3
+from monitor.codec import (
+    Reader,
+    VersionedCodec,
+    Writer,
+    read_block_header,
+    write_block_header,
+)
+from monitor.skip_reporter import SkippedStepRange, SkipReporterStateV3
+
+
+def write_block_fetcher_state_v3(writer: Writer, state: BlockFetcherStateV3) -> None:
+    writer.write_varint(0 if state.head is None else 1)
+    if state.head is not None:
+        write_block_header(writer, state.head)
+    writer.write_varint(state.initial_blocknr)
+
+
+def read_block_fetcher_state_v3(reader: Reader) -> BlockFetcherStateV3:
+    head = read_block_header(reader) if reader.read_varint() else None
+    return BlockFetcherStateV3(head=head, initial_blocknr=reader.read_varint())
+
+
+def write_skip_reporter_state_v3(writer: Writer, state: SkipReporterStateV3) -> None:
+    writer.write_varint(state.latest_step)
+    writer.write_varint(len(state.open_skipped_step_ranges))
+    # the ranges are disjoint and in ascending order, so the steps are encoded as
+    # differences to the previous one to keep the varints short
+    previous_step = 0
+    for step_range in state.open_skipped_step_ranges:
+        writer.write_varint(step_range.first_step - previous_step)
+        writer.write_varint(step_range.last_step - step_range.first_step)
+        writer.write_varint(step_range.block_height)
+        previous_step = step_range.last_step
+
+
+def read_skip_reporter_state_v3(reader: Reader) -> SkipReporterStateV3:
+    latest_step = reader.read_varint()
+    open_skipped_step_ranges = []
+    previous_step = 0
+    for _ in range(reader.read_varint()):
+        first_step = previous_step + reader.read_varint()
+        last_step = first_step + reader.read_varint()
+        open_skipped_step_ranges.append(
+            SkippedStepRange(first_step, last_step, block_height=reader.read_varint())
+        )
+        previous_step = last_step
+    return SkipReporterStateV3(
+        latest_step=latest_step, open_skipped_step_ranges=open_skipped_step_ranges
+    )
+
+
+BLOCK_FETCHER_STATE_CODEC: VersionedCodec[BlockFetcherStateV3] = VersionedCodec(
+    "block fetcher state"
+)
+BLOCK_FETCHER_STATE_CODEC.register(
+    1, BlockFetcherStateV3, write_block_fetcher_state_v3, read_block_fetcher_state_v3
+)
+
+SKIP_REPORTER_STATE_CODEC: VersionedCodec[SkipReporterStateV3] = VersionedCodec(
+    "skip reporter state"
+)
+SKIP_REPORTER_STATE_CODEC.register(
+    1, SkipReporterStateV3, write_skip_reporter_state_v3, read_skip_reporter_state_v3
+)
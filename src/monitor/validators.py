@@ -1,16 +1,27 @@
 import bisect
 from collections.abc import Mapping
-from itertools import chain, takewhile, dropwhile
+from itertools import chain
 import json
-from typing import cast, NamedTuple, List, Dict, Optional, Sequence, Union
+from typing import cast, NamedTuple, List, Dict, Optional, Sequence, Tuple, Union
 import os
 
-from eth_typing import ChecksumAddress
+import structlog
+from eth_typing import BlockNumber, ChecksumAddress
 from eth_utils import is_hex_address, decode_hex, to_canonical_address
-from eth_utils.toolz import sliding_window, last
+from eth_utils.toolz import sliding_window
 
 from web3 import Web3
 
+from monitor.chain_head import ChainHead, fetch_chain_head
+from monitor.rpc_batch import call_contract_functions
+
+# number of new epochs from which on their validator sets are discovered from the
+# InitiateChange logs instead of querying the contract for each of them
+MIN_NEW_EPOCHS_FOR_LOG_DISCOVERY = 4
+# maximum number of validator sets queried with a single JSON RPC batch request
+VALIDATOR_SET_BATCH_SIZE = 100
+# maximum number of blocks covered by a single eth_getLogs request
+LOG_DISCOVERY_BLOCK_RANGE = 100_000
 
 VALIDATOR_CONTRACT_ABI_PATH = os.path.join(
     os.path.dirname(__file__), "validator_contract_abi.json"
@@ -145,6 +156,18 @@ class Epoch(NamedTuple):
     validator_definition_index: int
 
 
+class FetchedContractEpochs(NamedTuple):
+    """Epochs fetched from the validator contract of a validator definition range."""
+
+    validator_definition_index: int
+    contract_address: bytes
+    enter_height: int
+    # height at which the contract has been queried, the validator sets are known until
+    # this height
+    last_fetch_height: int
+    epochs: List[Epoch]
+
+
 def get_static_epochs(
     validator_definition_ranges: Sequence[ValidatorDefinitionRange],
 ) -> Sequence[Epoch]:
@@ -171,6 +194,10 @@ class PrimaryOracle:
         self._ordered_start_heights: List[int] = []
         self.max_height = 0
 
+        # start height, end height (exclusive, None for the latest epoch) and validators of
+        # the epoch found by the last lookup, as consecutive lookups mostly hit the same one
+        self._last_hit: Optional[Tuple[int, Optional[int], List[bytes]]] = None
+
     def get_primary(self, *, height: int, step: int):
         validators = self.get_validators(height)
         index = step % len(validators)
@@ -184,18 +211,33 @@ class PrimaryOracle:
                 f"Validator sets are only known until height {self.max_height}"
             )
 
-        try:
-            epoch_start_height = last(
-                takewhile(
-                    lambda start_height: start_height <= block_height,
-                    self._ordered_start_heights,
-                )
-            )
-        except IndexError:
+        if self._last_hit is not None:
+            start_height, end_height, validators = self._last_hit
+            if start_height <= block_height and (
+                end_height is None or block_height < end_height
+            ):
+                return validators
+
+        index = self._get_epoch_index(block_height)
+        if index is None:
             raise ValueError(f"Block #{block_height} is earlier than the first epoch")
-        else:
-            epoch = self._epochs[epoch_start_height]
-            return epoch.validators
+
+        epoch = self._epochs[self._ordered_start_heights[index]]
+        end_height = (
+            self._ordered_start_heights[index + 1]
+            if index + 1 < len(self._ordered_start_heights)
+            else None
+        )
+        self._last_hit = (epoch.start_height, end_height, epoch.validators)
+        return epoch.validators
+
+    def _get_epoch_index(self, block_height: int) -> Optional[int]:
+        """get the index of the start height of the epoch containing the given height
+
+        Returns None if the height is earlier than the first epoch.
+        """
+        index = bisect.bisect_right(self._ordered_start_heights, block_height) - 1
+        return index if index >= 0 else None
 
     def add_epoch(self, epoch: Epoch) -> None:
         """Add an epoch if it is relevant."""
@@ -206,6 +248,7 @@ class PrimaryOracle:
             if epoch.start_height not in self._epochs:
                 bisect.insort(self._ordered_start_heights, epoch.start_height)
             self._epochs[epoch.start_height] = epoch
+            self._last_hit = None
 
             self._remove_epochs_rendered_irrelevant(epoch)
 
@@ -218,16 +261,11 @@ class PrimaryOracle:
         belongs to the 5th or later validator definition range, but not if it belongs to the 4th or
         earlier one.
         """
-        earlier_epoch_start_heights = takewhile(
-            lambda start_height: start_height <= epoch.start_height,
-            self._ordered_start_heights,
-        )
-        try:
-            previous_epoch_start_height = last(earlier_epoch_start_heights)
-        except IndexError:
+        index = self._get_epoch_index(epoch.start_height)
+        if index is None:
             return True
         else:
-            previous_epoch = self._epochs[previous_epoch_start_height]
+            previous_epoch = self._epochs[self._ordered_start_heights[index]]
             return (
                 previous_epoch.validator_definition_index
                 <= epoch.validator_definition_index
@@ -242,33 +280,37 @@ class PrimaryOracle:
 
         For the definition of (ir)relevant, see also the docstring to `_is_relevant`.
         """
-        later_epoch_indices_and_start_heights = dropwhile(
-            lambda index_and_height: index_and_height[1] <= inserted_epoch.start_height,
-            enumerate(self._ordered_start_heights),
+        first_later_index = bisect.bisect_right(
+            self._ordered_start_heights, inserted_epoch.start_height
         )
 
-        indices_to_remove = []
-        for index, start_height in later_epoch_indices_and_start_heights:
+        end_of_removal_index = first_later_index
+        for start_height in self._ordered_start_heights[first_later_index:]:
             epoch = self._epochs[start_height]
             if (
                 epoch.validator_definition_index
                 < inserted_epoch.validator_definition_index
             ):
-                indices_to_remove.append(index)
+                end_of_removal_index += 1
             else:
                 break
 
-        for index in reversed(indices_to_remove):
-            removed_start_height = self._ordered_start_heights.pop(index)
-            self._epochs.pop(removed_start_height)
+        for start_height in self._ordered_start_heights[
+            first_later_index:end_of_removal_index
+        ]:
+            self._epochs.pop(start_height)
+        del self._ordered_start_heights[first_later_index:end_of_removal_index]
 
 
 class ContractEpochFetcher:
+    logger = structlog.get_logger("monitor.validators")
+
     def __init__(
         self,
         w3: Web3,
         validator_definition_range: ValidatorDefinitionRange,
         validator_definition_index: int,
+        max_reorg_depth: int = 1000,
     ) -> None:
         if not validator_definition_range.is_contract:
             raise ValueError(
@@ -276,6 +318,9 @@ class ContractEpochFetcher:
             )
 
         self._w3 = w3
+        self._contract_address = to_canonical_address(
+            validator_definition_range.contract_address  # type: ignore
+        )
         # it seems web3 expects `None` type for contract address wrongfully
         self._contract = w3.eth.contract(
             address=validator_definition_range.contract_address,  # type: ignore
@@ -284,11 +329,16 @@ class ContractEpochFetcher:
 
         self._enter_height = validator_definition_range.enter_height
         self._validator_definition_index = validator_definition_index
+        self._max_reorg_depth = max_reorg_depth
 
         self._last_fetch_height: Optional[int] = None
         self._earliest_fetched_epoch: Optional[Epoch] = None
         self._latest_fetched_epoch: Optional[Epoch] = None
 
+        # whether the contract has to be queried at the next fetch, as a change of the
+        # validator set might have been initiated that is not finalized yet
+        self._change_pending = True
+
     @property
     def earliest_fetched_epoch(self) -> Optional[Epoch]:
         return self._earliest_fetched_epoch
@@ -301,9 +351,70 @@ class ContractEpochFetcher:
     def last_fetch_height(self) -> Optional[int]:
         return self._last_fetch_height
 
-    def fetch_new_epochs(self) -> List[Epoch]:
-        self._last_fetch_height = self._w3.eth.blockNumber
-        epoch_start_heights = self._contract.functions.getEpochStartHeights().call()
+    def matches(self, fetched_contract_epochs: FetchedContractEpochs) -> bool:
+        """check if the epochs have been fetched from the same validator definition range"""
+        return (
+            fetched_contract_epochs.validator_definition_index
+            == self._validator_definition_index
+            and fetched_contract_epochs.contract_address == self._contract_address
+            and fetched_contract_epochs.enter_height == self._enter_height
+        )
+
+    def restore(self, fetched_contract_epochs: FetchedContractEpochs) -> None:
+        """continue after epochs fetched before, e.g. by a previous run"""
+        if not self.matches(fetched_contract_epochs):
+            raise ValueError("The epochs have been fetched from a different contract")
+
+        self._last_fetch_height = fetched_contract_epochs.last_fetch_height
+        # changes pending at the last fetch are not known
+        self._change_pending = True
+        if fetched_contract_epochs.epochs:
+            self._earliest_fetched_epoch = fetched_contract_epochs.epochs[0]
+            self._latest_fetched_epoch = fetched_contract_epochs.epochs[-1]
+
+    def fetch_new_contract_epochs(
+        self, chain_head: Optional[ChainHead] = None
+    ) -> FetchedContractEpochs:
+        """fetch the epochs that have started since the last call together with the
+        information needed to restore the fetcher"""
+        epochs = self.fetch_new_epochs(chain_head)
+        assert self._last_fetch_height is not None
+        return FetchedContractEpochs(
+            validator_definition_index=self._validator_definition_index,
+            contract_address=self._contract_address,
+            enter_height=self._enter_height,
+            last_fetch_height=self._last_fetch_height,
+            epochs=epochs,
+        )
+
+    def fetch_new_epochs(self, chain_head: Optional[ChainHead] = None) -> List[Epoch]:
+        """fetch the epochs that have started since the last call
+
+        The contract is queried at the given chain head, which is fetched if not given. New
+        epochs only start when a change of the validator set initiated before is finalized, so
+        the contract is not queried if no change has been initiated since the last call, or
+        in blocks that may have been replaced by a reorg since.
+        """
+        if chain_head is None:
+            chain_head = fetch_chain_head(self._w3)
+
+        if (
+            self._last_fetch_height is not None
+            and chain_head.number <= self._last_fetch_height
+        ):
+            return []
+
+        if not self._change_pending and not self._has_initiated_change(chain_head):
+            self._last_fetch_height = chain_head.number
+            return []
+
+        self._last_fetch_height = chain_head.number
+        self._change_pending = not self._contract.functions.finalized().call(
+            block_identifier=BlockNumber(chain_head.number)
+        )
+        epoch_start_heights = self._contract.functions.getEpochStartHeights().call(
+            block_identifier=BlockNumber(chain_head.number)
+        )
 
         # epoch start heights will only be updated in the contract by the finalizeChange function which is called at most once
         # per block
@@ -319,20 +430,25 @@ class ContractEpochFetcher:
             )
         ]
 
-        new_epochs = []
-        for epoch_start_height in new_epoch_start_heights:
-            validators = [
-                decode_hex(validator)
-                for validator in self._contract.functions.getValidators(
-                    epoch_start_height
-                ).call()
-            ]
-            epoch = Epoch(
+        if len(new_epoch_start_heights) >= MIN_NEW_EPOCHS_FOR_LOG_DISCOVERY:
+            validator_sets = self._discover_validator_sets(
+                new_epoch_start_heights, chain_head
+            )
+        else:
+            validator_sets = self._get_validator_sets(
+                new_epoch_start_heights, chain_head
+            )
+
+        new_epochs = [
+            Epoch(
                 start_height=max(epoch_start_height, self._enter_height),
                 validators=validators,
                 validator_definition_index=self._validator_definition_index,
             )
-            new_epochs.append(epoch)
+            for epoch_start_height, validators in zip(
+                new_epoch_start_heights, validator_sets
+            )
+        ]
 
         if new_epochs:
             if self.earliest_fetched_epoch is None:
@@ -341,17 +457,115 @@ class ContractEpochFetcher:
 
         return new_epochs
 
+    def _get_validator_sets(
+        self, epoch_start_heights: List[int], chain_head: ChainHead
+    ) -> List[List[bytes]]:
+        """query the validator sets of the given epochs with batch requests"""
+        validator_sets: List[List[bytes]] = []
+        for chunk_start in range(0, len(epoch_start_heights), VALIDATOR_SET_BATCH_SIZE):
+            chunk_end = chunk_start + VALIDATOR_SET_BATCH_SIZE
+            results = call_contract_functions(
+                self._w3,
+                [
+                    self._contract.functions.getValidators(epoch_start_height)
+                    for epoch_start_height in epoch_start_heights[chunk_start:chunk_end]
+                ],
+                block_identifier=BlockNumber(chain_head.number),
+            )
+            validator_sets += [
+                [decode_hex(validator) for validator in validators]
+                for validators in results
+            ]
+        return validator_sets
+
+    def _get_initiate_change_logs(self, from_block: int, to_block: int) -> List:
+        """get the InitiateChange logs in the given block range (inclusive) in chunks"""
+        logs: List = []
+        for chunk_start in range(from_block, to_block + 1, LOG_DISCOVERY_BLOCK_RANGE):
+            logs += self._contract.events.InitiateChange.getLogs(
+                fromBlock=chunk_start,
+                toBlock=min(chunk_start + LOG_DISCOVERY_BLOCK_RANGE - 1, to_block),
+            )
+        return logs
+
+    def _discover_validator_sets(
+        self, new_epoch_start_heights: List[int], chain_head: ChainHead
+    ) -> List[List[bytes]]:
+        """get the validator sets of the new epochs from the InitiateChange logs
+
+        The validator set of an epoch is the one of the change initiated after the start
+        of the previous epoch and finalized at the start of the epoch, so only the logs
+        between the starts of the first and the last new epoch are needed. The contract
+        has no cheaper way to verify a validator set, so every set is queried in batches
+        as well. If a set taken from the logs does not match, the sets of the contract
+        are used.
+        """
+        logs = self._get_initiate_change_logs(
+            new_epoch_start_heights[0], new_epoch_start_heights[-1]
+        )
+        log_block_numbers = [log.blockNumber for log in logs]
+
+        discovered_validator_sets: Dict[int, List[bytes]] = {}
+        for previous_epoch_start_height, epoch_start_height in sliding_window(
+            2, new_epoch_start_heights
+        ):
+            first_log_index = bisect.bisect_right(
+                log_block_numbers, previous_epoch_start_height
+            )
+            end_log_index = bisect.bisect_left(log_block_numbers, epoch_start_height)
+            # otherwise it is ambiguous which change has been finalized
+            if end_log_index - first_log_index == 1:
+                discovered_validator_sets[epoch_start_height] = [
+                    to_canonical_address(validator)
+                    for validator in logs[first_log_index].args._newSet
+                ]
+
+        validator_sets = self._get_validator_sets(new_epoch_start_heights, chain_head)
+        for epoch_start_height, validators in zip(
+            new_epoch_start_heights, validator_sets
+        ):
+            if (
+                epoch_start_height in discovered_validator_sets
+                and discovered_validator_sets[epoch_start_height] != validators
+            ):
+                self.logger.warning(
+                    "Validator sets discovered from logs do not match the contract, "
+                    "using the validator sets of the contract instead",
+                    epoch_start_height=epoch_start_height,
+                )
+                break
+
+        return validator_sets
+
+    def _has_initiated_change(self, chain_head: ChainHead) -> bool:
+        """check if a change of the validator set has been initiated since the last fetch
+
+        The blocks before the last fetch height that may have been replaced by a reorg are
+        checked as well, as a change initiated in them has not been seen by the last fetch.
+        """
+        assert self._last_fetch_height is not None
+        initiate_change_logs = self._get_initiate_change_logs(
+            max(self._last_fetch_height + 1 - self._max_reorg_depth, 0),
+            chain_head.number,
+        )
+        return len(initiate_change_logs) > 0
+
 
 class EpochFetcher:
     def __init__(
-        self, w3: Web3, validator_definition_ranges: Sequence[ValidatorDefinitionRange]
+        self,
+        w3: Web3,
+        validator_definition_ranges: Sequence[ValidatorDefinitionRange],
+        max_reorg_depth: int = 1000,
     ) -> None:
         validate_validator_definition_order(validator_definition_ranges)
         self._w3 = w3
         self._last_fetch_height = 0
         self._validator_definition_ranges = validator_definition_ranges
         self._contract_epoch_fetchers = [
-            ContractEpochFetcher(w3, validator_definition_range, index)
+            ContractEpochFetcher(
+                w3, validator_definition_range, index, max_reorg_depth=max_reorg_depth
+            )
             for index, validator_definition_range in enumerate(
                 self._validator_definition_ranges
             )
@@ -362,16 +576,50 @@ class EpochFetcher:
     def last_fetch_height(self) -> int:
         return self._last_fetch_height
 
-    def fetch_new_epochs(self) -> List[Epoch]:
+    def fetch_new_epochs(self, chain_head: Optional[ChainHead] = None) -> List[Epoch]:
         new_epochs: List[Epoch] = []
+        for fetched_contract_epochs in self.fetch_new_contract_epochs(chain_head):
+            new_epochs += fetched_contract_epochs.epochs
+        return new_epochs
+
+    def fetch_new_contract_epochs(
+        self, chain_head: Optional[ChainHead] = None
+    ) -> List[FetchedContractEpochs]:
+        """fetch the new epochs of each contract, so that they can be stored to restore
+        the fetcher later on"""
+        if chain_head is None:
+            chain_head = fetch_chain_head(self._w3)
+
+        fetched_contract_epochs = [
+            fetcher.fetch_new_contract_epochs(chain_head)
+            for fetcher in self._contract_epoch_fetchers
+        ]
+
+        self._remove_stale_fetchers()
+        self._set_last_fetch_height(chain_head.number)
+
+        return fetched_contract_epochs
+
+    def restore(
+        self, fetched_contract_epochs: Sequence[FetchedContractEpochs]
+    ) -> List[Epoch]:
+        """continue after epochs fetched before, e.g. by a previous run
+
+        Epochs fetched from contracts that are not part of the validator definition anymore
+        are ignored. Returns the restored epochs.
+        """
+        restored_epochs: List[Epoch] = []
         for fetcher in self._contract_epoch_fetchers:
-            epochs = fetcher.fetch_new_epochs()
-            new_epochs += epochs
+            for fetched in fetched_contract_epochs:
+                if fetcher.matches(fetched):
+                    fetcher.restore(fetched)
+                    restored_epochs += fetched.epochs
 
         self._remove_stale_fetchers()
-        self._set_last_fetch_height()
+        if self._contract_epoch_fetchers:
+            self._set_last_fetch_height(None)
 
-        return new_epochs
+        return restored_epochs
 
     def _remove_stale_fetchers(self) -> None:
         while self._pop_first_fetcher_if_stale():
@@ -407,9 +655,10 @@ class EpochFetcher:
             else:
                 return None
 
-    def _set_last_fetch_height(self) -> None:
+    def _set_last_fetch_height(self, chain_head_number: Optional[int]) -> None:
         if not self._contract_epoch_fetchers:
-            self._last_fetch_height = self._w3.eth.blockNumber
+            assert chain_head_number is not None
+            self._last_fetch_height = chain_head_number
         elif any(
             contract_epoch_fetcher.last_fetch_height is None
             for contract_epoch_fetcher in self._contract_epoch_fetchers
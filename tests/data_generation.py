@@ -24,7 +24,9 @@ def random_step():
     return random_generator.randint(0, 2 ** 32)
 
 
-def make_block(*, block_hash=None, parent_hash=None, proposer_privkey=None, step=None):
+def make_block(
+    *, block_hash=None, parent_hash=None, proposer_privkey=None, step=None, number=0
+):
     if proposer_privkey is None:
         proposer_privkey = random_private_key()
 
@@ -40,7 +42,7 @@ def make_block(*, block_hash=None, parent_hash=None, proposer_privkey=None, step
             "receiptsRoot": HexBytes(random_hash()),
             "logsBloom": HexBytes(b"\x00" * 256),
             "difficulty": 0,
-            "number": 0,
+            "number": number,
             "gasLimit": 0,
             "gasUsed": 0,
             "timestamp": 0,  # only needed to compute hash, not step
@@ -64,6 +66,8 @@ def make_branch(length):
     parent_hashes = [random_hash()] + hashes[:-1]
 
     return [
-        make_block(block_hash=child_hash, parent_hash=parent_hash, step=step)
+        make_block(
+            block_hash=child_hash, parent_hash=parent_hash, step=step, number=step
+        )
         for child_hash, parent_hash, step in zip(hashes, parent_hashes, steps)
     ]
@@ -1,3 +1,5 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import pytest
 
 from web3.datastructures import AttributeDict
@@ -5,8 +7,18 @@ from web3.datastructures import AttributeDict
 from monitor.blocks import (
     get_canonicalized_block,
     get_proposer,
+    get_proposers,
     get_step,
+    MIN_PARALLEL_RECOVERY_BATCH_SIZE,
     calculate_block_signature,
+    bare_hash,
+    enrich_block,
+    enrich_blocks,
+    get_block_header,
+    get_block_headers,
+    get_available_ecc_backends,
+    get_ecc_backend,
+    set_ecc_backend,
 )
 
 from eth_utils.toolz import merge
@@ -41,11 +53,107 @@ def test_signing(block, private_key):
     assert get_proposer(resigned_block) == private_key.public_key.to_canonical_address()
 
 
+@pytest.mark.parametrize("block", KOVAN_BLOCKS)
+def test_enrich_block(block):
+    enriched_block = enrich_block(block)
+    canonicalized_block = get_canonicalized_block(block)
+
+    assert enriched_block.canonicalizedBlock == canonicalized_block
+    assert enriched_block.bareHash == bare_hash(canonicalized_block)
+    assert enriched_block.proposer == get_proposer(canonicalized_block)
+    assert enriched_block.hash == block.hash
+
+
+def test_enrich_blocks_only_once():
+    enriched_block = enrich_block(KOVAN_BLOCKS[0])
+    blocks = enrich_blocks([enriched_block, KOVAN_BLOCKS[1]])
+
+    assert blocks[0] is enriched_block
+    assert blocks[1] == enrich_block(KOVAN_BLOCKS[1])
+
+
+@pytest.mark.parametrize("block", KOVAN_BLOCKS)
+def test_get_block_header(block):
+    block_header = get_block_header(block)
+
+    assert block_header.number == block.number
+    assert block_header.hash == block.hash
+    assert block_header.parentHash == block.parentHash
+    assert block_header.step == get_step(block)
+    assert block_header.timestamp == block.timestamp
+    assert block_header.proposer == get_proposer(get_canonicalized_block(block))
+
+
+def test_block_headers_are_enriched_blocks():
+    block_header = get_block_header(KOVAN_BLOCKS[0])
+
+    assert enrich_block(block_header) is block_header
+    assert get_block_headers([block_header])[0] is block_header
+
+
+@pytest.fixture
+def restore_ecc_backend():
+    ecc_backend = get_ecc_backend()
+    yield
+    set_ecc_backend(ecc_backend)
+
+
+@pytest.mark.parametrize("ecc_backend", get_available_ecc_backends())
+def test_get_proposer_with_ecc_backend(ecc_backend, restore_ecc_backend):
+    set_ecc_backend(ecc_backend)
+    assert get_ecc_backend() == ecc_backend
+
+    canonicalized_block = get_canonicalized_block(KOVAN_BLOCKS[0])
+    assert get_proposer(canonicalized_block) == canonicalized_block.author
+
+
+def test_set_auto_ecc_backend(restore_ecc_backend):
+    set_ecc_backend("auto")
+    assert get_ecc_backend() == get_available_ecc_backends()[0]
+
+
+def test_set_unknown_ecc_backend(restore_ecc_backend):
+    with pytest.raises(ValueError):
+        set_ecc_backend("unknown")
+
+
 def test_get_proposer_of_genesis_block():
     canonicalized_genesis_block = get_canonicalized_block(KOVAN_GENESIS_BLOCK)
     assert get_proposer(canonicalized_genesis_block) == b"\x00" * 20
 
 
+@pytest.mark.parametrize("use_executor", [False, True])
+@pytest.mark.parametrize("number_of_blocks", [1, MIN_PARALLEL_RECOVERY_BATCH_SIZE, 100])
+def test_get_proposers(use_executor, number_of_blocks):
+    canonicalized_block = get_canonicalized_block(KOVAN_BLOCKS[0])
+    private_keys = [
+        keys.PrivateKey(index.to_bytes(32, "big"))
+        for index in range(1, number_of_blocks + 1)
+    ]
+    blocks = [
+        AttributeDict(
+            merge(
+                canonicalized_block,
+                {
+                    "signature": calculate_block_signature(
+                        canonicalized_block, private_key
+                    ).to_bytes()
+                },
+            )
+        )
+        for private_key in private_keys
+    ]
+
+    expected_proposers = [
+        private_key.public_key.to_canonical_address() for private_key in private_keys
+    ]
+    if use_executor:
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            assert get_proposers(blocks, executor) == expected_proposers
+    else:
+        assert get_proposers(blocks) == expected_proposers
+
+
 @pytest.mark.parametrize(
     ["block", "step"],
     zip([KOVAN_GENESIS_BLOCK] + KOVAN_BLOCKS, [0, 372114854, 375469975, 377074489]),
@@ -0,0 +1,140 @@
+from typing import NamedTuple
+
+import pytest
+
+from monitor.block_fetcher import BlockFetcherStateV3
+from monitor.blocks import get_block_headers
+from monitor.codec import (
+    DecodingError,
+    Migrations,
+    Reader,
+    VersionedCodec,
+    Writer,
+    decode_block_header,
+    encode_block_header,
+)
+from monitor.skip_reporter import SkippedStepRange, SkipReporterStateV3
+from monitor.state_codec import (
+    BLOCK_FETCHER_STATE_CODEC,
+    SKIP_REPORTER_STATE_CODEC,
+)
+
+from tests.data_generation import make_block
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 2 ** 32, 2 ** 64 + 1])
+def test_varint_roundtrip(value):
+    writer = Writer()
+    writer.write_varint(value)
+    reader = Reader(writer.getvalue())
+    assert reader.read_varint() == value
+    assert reader.at_end()
+
+
+def test_varint_length():
+    writer = Writer()
+    writer.write_varint(127)
+    writer.write_varint(128)
+    assert len(writer.getvalue()) == 3
+
+
+def test_negative_varint():
+    with pytest.raises(ValueError):
+        Writer().write_varint(-1)
+
+
+def test_truncated_data():
+    writer = Writer()
+    writer.write_bytes(b"\x01" * 10)
+    with pytest.raises(DecodingError):
+        Reader(writer.getvalue()[:-1]).read_bytes()
+
+
+def test_block_header_roundtrip():
+    (block_header,) = get_block_headers([make_block(step=1234, number=56)])
+    assert decode_block_header(encode_block_header(block_header)) == block_header
+
+
+def test_block_fetcher_state_roundtrip():
+    (head,) = get_block_headers([make_block(step=1234, number=56)])
+    state = BlockFetcherStateV3(head=head, initial_blocknr=3)
+    assert (
+        BLOCK_FETCHER_STATE_CODEC.decode(BLOCK_FETCHER_STATE_CODEC.encode(state))
+        == state
+    )
+
+
+def test_fresh_block_fetcher_state_roundtrip():
+    state = BlockFetcherStateV3(head=None, initial_blocknr=0)
+    assert (
+        BLOCK_FETCHER_STATE_CODEC.decode(BLOCK_FETCHER_STATE_CODEC.encode(state))
+        == state
+    )
+
+
+def test_skip_reporter_state_roundtrip():
+    state = SkipReporterStateV3(
+        latest_step=400_000_000,
+        open_skipped_step_ranges=[
+            SkippedStepRange(399_999_950, 399_999_950, 1000),
+            SkippedStepRange(399_999_952, 399_999_980, 1001),
+        ],
+    )
+    assert (
+        SKIP_REPORTER_STATE_CODEC.decode(SKIP_REPORTER_STATE_CODEC.encode(state))
+        == state
+    )
+
+
+class StateV1(NamedTuple):
+    value: int
+
+
+class StateV2(NamedTuple):
+    value: int
+    offset: int
+
+
+def write_state_v1(writer, state):
+    writer.write_varint(state.value)
+
+
+def read_state_v1(reader):
+    return StateV1(reader.read_varint())
+
+
+def test_unknown_version():
+    codec = VersionedCodec("state")
+    codec.register(1, StateV1, write_state_v1, read_state_v1)
+    data = codec.encode(StateV1(5))
+
+    other_codec = VersionedCodec("state")
+    other_codec.register(2, StateV1, write_state_v1, read_state_v1)
+    with pytest.raises(DecodingError):
+        other_codec.decode(data)
+
+
+def test_encode_unregistered_type():
+    codec = VersionedCodec("state")
+    codec.register(1, StateV1, write_state_v1, read_state_v1)
+    with pytest.raises(ValueError):
+        codec.encode(StateV2(5, 1))
+
+
+def test_migrations():
+    migrations = Migrations("state")
+    migrations.register(
+        StateV1,
+        StateV2,
+        lambda v1, offset: StateV2(v1.value, offset),
+        required_options=["offset"],
+    )
+
+    assert migrations.upgrade(StateV1(5), StateV2, offset=2) == StateV2(5, 2)
+    assert migrations.upgrade(StateV2(5, 1), StateV2) == StateV2(5, 1)
+
+
+def test_migrations_without_path():
+    migrations = Migrations("state")
+    with pytest.raises(ValueError):
+        migrations.upgrade(StateV1(5), StateV2)
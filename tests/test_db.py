@@ -1,7 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from monitor.db import AlreadyExists
-from monitor.blocks import get_proposer, get_canonicalized_block, get_step
+from sqlalchemy import create_engine
+
+from monitor.db import (
+    AlreadyExists,
+    BlockDB,
+    HashIndex,
+    RetentionPolicy,
+    SQLiteProfile,
+    apply_sqlite_profile,
+)
+from monitor.blocks import (
+    get_block_headers,
+    get_proposer,
+    get_canonicalized_block,
+    get_step,
+)
+from monitor.offline_reporter import (
+    OfflineInterval,
+    OfflineReporter,
+    OfflineReporterStateV3,
+    OfflineWindow,
+)
+from monitor.skip_reporter import SkippedProposal
+from monitor.validators import Epoch, FetchedContractEpochs
 
 from tests.data_generation import (
     random_address,
@@ -44,6 +68,20 @@ def test_insert_branch(populated_db):
         assert populated_db.contains(block.hash)
 
 
+def test_insert_branch_with_executor(engine):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        db = BlockDB(engine, executor=executor)
+        branch = make_branch(100)
+        db.insert_branch(branch)
+
+    for block in branch:
+        proposer = get_proposer(get_canonicalized_block(block))
+        (retrieved_block,) = db.get_blocks_by_proposer_and_step(
+            proposer, get_step(block)
+        )
+        assert retrieved_block.hash == block.hash
+
+
 def test_insert_broken_branch(populated_db):
     branch = make_branch(5) + make_branch(5)
     with pytest.raises(ValueError):
@@ -57,6 +95,36 @@ def test_insert_branch_with_existing_block(populated_db):
     with pytest.raises(AlreadyExists):
         populated_db.insert_branch(branch)
 
+    for other_block in branch[:5] + branch[6:]:
+        assert not populated_db.contains(other_block.hash)
+
+
+def test_insert_branch_with_existing_block_in_persistent_session(empty_db):
+    validator = random_address()
+    inserted_branch = make_branch(3)
+    branch = make_branch(10)
+    with empty_db.persistent_session() as session:
+        empty_db.insert_branch(inserted_branch)
+        empty_db.insert_skip(validator, 1)
+        empty_db.store_pickled("foo", dict(bar=2))
+        empty_db.insert(branch[5])
+        with pytest.raises(AlreadyExists):
+            empty_db.insert_branch(branch)
+        session.commit()
+
+    # the earlier changes of the session are kept
+    for block in inserted_branch + [branch[5]]:
+        assert empty_db.contains(block.hash)
+    assert [skip.step for skip in empty_db.get_skips()] == [1]
+    assert empty_db.load_pickled("foo") == dict(bar=2)
+    for other_block in branch[:5] + branch[6:]:
+        assert not empty_db.contains(other_block.hash)
+
+
+def test_insert_empty_branch(empty_db):
+    empty_db.insert_branch([])
+    assert empty_db.is_empty()
+
 
 def test_contains_inserted_block(populated_db, inserted_blocks):
     for block in inserted_blocks:
@@ -185,3 +253,317 @@ def test_session_handling_commit(empty_db):
 
     for block in branch:
         assert empty_db.contains(block.hash)
+
+
+def test_hash_index_is_bounded():
+    hash_index = HashIndex(3)
+    hash_index.add_all([b"a", b"b", b"c"])
+    hash_index.add_all([b"a", b"d"])
+
+    assert len(hash_index) == 3
+    assert b"b" not in hash_index
+    assert all(block_hash in hash_index for block_hash in [b"a", b"c", b"d"])
+
+
+@pytest.fixture
+def indexed_db(engine):
+    return BlockDB(engine, hash_index_size=5)
+
+
+def test_hash_index_contains_inserted_blocks(indexed_db):
+    branch = make_branch(10)
+    indexed_db.insert_branch(branch)
+
+    assert all(block.hash not in indexed_db.hash_index for block in branch[:5])
+    assert all(block.hash in indexed_db.hash_index for block in branch[5:])
+    assert all(indexed_db.contains(block.hash) for block in branch)
+
+
+def test_hash_index_contains_only_committed_blocks(indexed_db):
+    committed_branch = make_branch(3)
+    rolled_back_branch = make_branch(3)
+
+    with indexed_db.persistent_session() as session:
+        indexed_db.insert_branch(committed_branch)
+        assert len(indexed_db.hash_index) == 0
+        session.commit()
+
+        indexed_db.insert_branch(rolled_back_branch)
+        session.rollback()
+
+    assert all(block.hash in indexed_db.hash_index for block in committed_branch)
+    assert all(block.hash not in indexed_db.hash_index for block in rolled_back_branch)
+    assert not any(indexed_db.contains(block.hash) for block in rolled_back_branch)
+
+
+def test_hash_index_is_rebuilt_with_latest_blocks(engine, indexed_db):
+    branch = make_branch(10)
+    indexed_db.insert_branch(branch)
+
+    rebuilt_db = BlockDB(engine, hash_index_size=4)
+    latest_blocks = sorted(branch, key=get_step)[-4:]
+    assert all(block.hash in rebuilt_db.hash_index for block in latest_blocks)
+    assert len(rebuilt_db.hash_index) == 4
+
+
+def test_apply_sqlite_profile(tmp_path):
+    engine = create_engine(f"sqlite:////{tmp_path / 'test.db'}")
+    apply_sqlite_profile(
+        engine,
+        SQLiteProfile(
+            journal_mode="wal",
+            synchronous="off",
+            cache_size=1024,
+            mmap_size=4096,
+            busy_timeout=1234,
+        ),
+    )
+    db = BlockDB(engine)
+    db.insert_branch(make_branch(3))
+
+    with engine.connect() as connection:
+
+        def pragma(name):
+            return connection.execute(f"PRAGMA {name}").scalar()
+
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 0
+        assert pragma("cache_size") == -1024
+        assert pragma("mmap_size") == 4096
+        assert pragma("busy_timeout") == 1234
+
+
+def test_apply_invalid_sqlite_profile(engine):
+    with pytest.raises(ValueError):
+        apply_sqlite_profile(engine, SQLiteProfile(synchronous="sometimes"))
+
+
+@pytest.mark.parametrize("unit", ["blocks", "steps"])
+def test_prune(indexed_db, unit):
+    branch = make_branch(20)
+    indexed_db.insert_branch(branch)
+
+    assert indexed_db.prune(branch[-1], RetentionPolicy(unit=unit, size=10)) == 9
+
+    assert not any(indexed_db.contains(block.hash) for block in branch[:9])
+    assert all(indexed_db.contains(block.hash) for block in branch[9:])
+
+
+def test_prune_steps_with_skipped_steps(empty_db):
+    # every other step is skipped, so fewer blocks than steps are retained
+    branch = make_branch(20)
+    for block in branch:
+        block.step = str(2 * block.number)
+    empty_db.insert_branch(branch)
+
+    assert (
+        empty_db.prune(
+            branch[-1], RetentionPolicy(unit="steps", size=10), min_retained_blocks=8
+        )
+        == 11
+    )
+    assert not any(empty_db.contains(block.hash) for block in branch[:11])
+    assert all(empty_db.contains(block.hash) for block in branch[11:])
+
+
+@pytest.mark.parametrize("unit", ["blocks", "steps"])
+def test_prune_retains_min_blocks(empty_db, unit):
+    branch = make_branch(20)
+    empty_db.insert_branch(branch)
+
+    assert (
+        empty_db.prune(
+            branch[-1], RetentionPolicy(unit=unit, size=5), min_retained_blocks=10
+        )
+        == 9
+    )
+    assert all(empty_db.contains(block.hash) for block in branch[9:])
+
+
+def test_prune_in_batches(empty_db):
+    branch = make_branch(20)
+    empty_db.insert_branch(branch)
+    retention_policy = RetentionPolicy(unit="blocks", size=5)
+
+    assert empty_db.prune(branch[-1], retention_policy, max_number_of_blocks=10) == 10
+    assert empty_db.prune(branch[-1], retention_policy, max_number_of_blocks=10) == 4
+    assert empty_db.prune(branch[-1], retention_policy, max_number_of_blocks=10) == 0
+    assert all(empty_db.contains(block.hash) for block in branch[14:])
+
+
+def test_prune_blocks_without_number(empty_db):
+    branch = make_branch(20)
+    empty_db.insert_branch(branch)
+    with empty_db.engine.begin() as connection:
+        connection.execute("UPDATE blocks SET number = NULL WHERE step < 5")
+
+    assert empty_db.prune(branch[-1], RetentionPolicy(unit="blocks", size=10)) == 9
+    assert all(empty_db.contains(block.hash) for block in branch[9:])
+
+
+def test_add_number_column(tmp_path):
+    engine = create_engine(f"sqlite:////{tmp_path / 'test.db'}")
+    with engine.begin() as connection:
+        connection.execute(
+            "CREATE TABLE blocks (hash VARCHAR(32) NOT NULL, proposer VARCHAR(20), "
+            "step INTEGER, PRIMARY KEY (hash))"
+        )
+        connection.execute("INSERT INTO blocks VALUES (x'01', x'02', 3)")
+
+    db = BlockDB(engine)
+    assert db.contains(b"\x01")
+
+    branch = make_branch(3)
+    db.insert_branch(branch)
+    assert all(db.contains(block.hash) for block in branch)
+
+
+def test_insert_and_get_skips(empty_db):
+    validator_one, validator_two = random_address(), random_address()
+    empty_db.insert_skip(validator_one, 10)
+    empty_db.insert_skip(validator_two, 5)
+    empty_db.insert_skip(validator_one, 3)
+    empty_db.insert_skip(validator_one, 3)
+
+    assert [(skip.validator, skip.step) for skip in empty_db.get_skips()] == [
+        (validator_one, 3),
+        (validator_two, 5),
+        (validator_one, 10),
+    ]
+    assert [skip.step for skip in empty_db.get_skips(validator=validator_one)] == [
+        3,
+        10,
+    ]
+    assert [skip.step for skip in empty_db.get_skips(min_step=4, max_step=10)] == [
+        5,
+        10,
+    ]
+
+
+def test_skips_are_stored_in_persistent_session(empty_db):
+    validator = random_address()
+    with empty_db.persistent_session() as session:
+        empty_db.insert_skip(validator, 1)
+        session.rollback()
+        empty_db.insert_skip(validator, 2)
+        session.commit()
+
+    assert [skip.step for skip in empty_db.get_skips()] == [2]
+
+
+def test_store_and_load_fetched_contract_epochs(empty_db):
+    contract_address = random_address()
+    validators = [random_address() for _ in range(3)]
+    empty_db.store_fetched_contract_epochs(
+        [
+            FetchedContractEpochs(
+                1, contract_address, 100, 120, [Epoch(100, validators, 1)]
+            )
+        ]
+    )
+    empty_db.store_fetched_contract_epochs(
+        [
+            FetchedContractEpochs(
+                1, contract_address, 100, 150, [Epoch(130, validators[:1], 1)]
+            )
+        ]
+    )
+
+    assert empty_db.load_fetched_contract_epochs() == [
+        FetchedContractEpochs(
+            1,
+            contract_address,
+            100,
+            150,
+            [Epoch(100, validators, 1), Epoch(130, validators[:1], 1)],
+        )
+    ]
+
+
+def test_store_fetched_contract_epochs_of_other_contract(empty_db):
+    validators = [random_address()]
+    empty_db.store_fetched_contract_epochs(
+        [
+            FetchedContractEpochs(
+                1, random_address(), 100, 120, [Epoch(100, validators, 1)]
+            )
+        ]
+    )
+    other_contract_address = random_address()
+    empty_db.store_fetched_contract_epochs(
+        [FetchedContractEpochs(1, other_contract_address, 100, 150, [])]
+    )
+
+    assert empty_db.load_fetched_contract_epochs() == [
+        FetchedContractEpochs(1, other_contract_address, 100, 150, [])
+    ]
+
+
+def test_store_offline_reporter_state_changes(empty_db, validators, primary_oracle):
+    offline_windows = [OfflineWindow(10, 0.5), OfflineWindow(40, 0.5)]
+    offline_reporter = OfflineReporter.from_fresh_state(
+        primary_oracle=primary_oracle, offline_windows=offline_windows
+    )
+
+    # report the first validator in the small window, the intervals of the second one
+    # are partially cleared
+    for step in range(0, 60, 3):
+        offline_reporter(validators[step % 2], SkippedProposal(step, 0))
+        empty_db.store_offline_reporter_state_changes(
+            offline_reporter.pop_state_changes()
+        )
+
+    state = offline_reporter.state
+    assert state.reported_validators_by_window_size[10]
+    loaded_state = empty_db.load_offline_reporter_state()
+    assert loaded_state.recent_offline_intervals_by_validator == (
+        state.recent_offline_intervals_by_validator
+    )
+    assert loaded_state.reported_validators_by_window_size == {
+        window_size: validators
+        for window_size, validators in state.reported_validators_by_window_size.items()
+        if validators
+    }
+
+
+def test_replace_offline_reporter_state(empty_db, validators):
+    empty_db.replace_offline_reporter_state(
+        OfflineReporterStateV3(
+            recent_offline_intervals_by_validator={
+                validators[0]: [OfflineInterval(1, 3)]
+            },
+            reported_validators_by_window_size={10: {validators[1]}},
+        )
+    )
+    state = OfflineReporterStateV3(
+        recent_offline_intervals_by_validator={
+            validators[1]: [OfflineInterval(2, 3), OfflineInterval(5, 3)]
+        },
+        reported_validators_by_window_size={20: {validators[0], validators[2]}},
+    )
+    empty_db.replace_offline_reporter_state(state)
+
+    assert empty_db.load_offline_reporter_state() == state
+
+
+def test_staged_branch(empty_db):
+    branch = get_block_headers(make_branch(5))
+    empty_db.append_to_branch(0, branch[:3])
+    empty_db.append_to_branch(3, branch[3:])
+    assert empty_db.get_branch_length() == 5
+    assert empty_db.load_branch() == branch
+    assert empty_db.get_branch_blocks(1, 3) == branch[1:3]
+    assert empty_db.get_branch_block(4) == branch[4]
+
+    empty_db.truncate_branch(2)
+    assert empty_db.load_branch() == branch[:2]
+
+    other_branch = get_block_headers(make_branch(2))
+    empty_db.replace_branch(other_branch)
+    assert empty_db.load_branch() == other_branch
+
+
+def test_delete_blob(empty_db):
+    empty_db.store_pickled("foo", dict(bar=1))
+    empty_db.delete_blob("foo")
+    assert empty_db.load_pickled("foo") is None
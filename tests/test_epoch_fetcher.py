@@ -1,13 +1,16 @@
 import json
 import random
-from typing import List, Sequence, Tuple, Union, Type
+from typing import List, Optional, Sequence, Tuple, Union, Type
 import os
 
+from unittest.mock import Mock, call
+
 import pytest
 
 from eth_tester import EthereumTester
 from web3 import Web3
 from web3.contract import Contract
+from web3.datastructures import AttributeDict
 from web3.providers.eth_tester import EthereumTesterProvider
 
 from eth_utils.toolz import sliding_window
@@ -17,8 +20,11 @@ from monitor.validators import (
     Epoch,
     ContractEpochFetcher,
     EpochFetcher,
+    MIN_NEW_EPOCHS_FOR_LOG_DISCOVERY,
     get_static_epochs,
 )
+from monitor.chain_head import ChainHead
+from monitor.rpc_batch import call_contract_functions
 from web3.types import TxReceipt
 
 
@@ -149,8 +155,11 @@ def mine_until(w3: Web3, tester: EthereumTester, height: int) -> None:
     tester.mine_blocks(height - w3.eth.blockNumber)
 
 
-def change_validators(contract: Contract) -> Tuple[List[bytes], int]:
-    validators = [get_random_address() for _ in range(2)]
+def change_validators(
+    contract: Contract, validators: Optional[List[bytes]] = None
+) -> Tuple[List[bytes], int]:
+    if validators is None:
+        validators = [get_random_address() for _ in range(2)]
     tx_hashes = [
         contract.functions.testChangeValiatorSet(validators).transact(),
         contract.functions.testFinalizeChange().transact(),
@@ -221,6 +230,21 @@ def test_fetch_multiple_updates(w3, tester, validator_set_contract):
     assert epochs == [Epoch(height1, validators1, 0), Epoch(height2, validators2, 0)]
 
 
+def test_fetch_at_chain_head(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    validators1 = initialize_validators(contract)
+    chain_head = ChainHead(number=w3.eth.blockNumber)
+
+    mine_until(w3, tester, 105)
+    change_validators(contract)
+
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    assert fetcher.fetch_new_epochs(chain_head) == [Epoch(100, validators1, 0)]
+    assert fetcher.last_fetch_height == chain_head.number
+
+
 def test_contract_epoch_fetcher_initialization(w3, validator_set_contract):
     val_def, (contract,) = initialize_scenario(
         validator_set_contract, transition_heights=[100]
@@ -343,3 +367,221 @@ def test_epoch_fetcher_without_contracts(w3, tester):
     mine_until(w3, tester, 50)
     fetcher.fetch_new_epochs()
     assert fetcher.last_fetch_height == 50
+
+
+def test_epoch_fetcher_restore(w3, tester, validator_set_contract):
+    val_def, (contract1, contract2) = initialize_scenario(
+        validator_set_contract, transition_heights=[100, 200]
+    )
+    validators1 = initialize_validators(contract1)
+    fetched_contract_epochs = EpochFetcher(w3, val_def).fetch_new_contract_epochs()
+    last_fetch_height = w3.eth.blockNumber
+
+    restored_fetcher = EpochFetcher(w3, val_def)
+    assert restored_fetcher.restore(fetched_contract_epochs) == [
+        Epoch(100, validators1, 0)
+    ]
+    assert restored_fetcher.last_fetch_height == last_fetch_height
+
+    validators2 = initialize_validators(contract2)
+    assert restored_fetcher.fetch_new_epochs() == [Epoch(200, validators2, 1)]
+
+
+def test_epoch_fetcher_ignores_epochs_of_other_contracts(
+    w3, tester, validator_set_contract
+):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    initialize_validators(contract)
+    fetched_contract_epochs = EpochFetcher(w3, val_def).fetch_new_contract_epochs()
+
+    other_val_def, _ = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    restored_fetcher = EpochFetcher(w3, other_val_def)
+    assert restored_fetcher.restore(fetched_contract_epochs) == []
+    assert restored_fetcher.last_fetch_height == 0
+
+
+def record_calls(tester: EthereumTester) -> Mock:
+    """record the contract calls executed by the tester"""
+    tester.call = Mock(wraps=tester.call)  # type: ignore
+    return tester.call
+
+
+def test_fetch_without_new_head(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    initialize_validators(contract)
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    chain_head = ChainHead(number=w3.eth.blockNumber)
+    fetcher.fetch_new_epochs(chain_head)
+
+    calls = record_calls(tester)
+    assert fetcher.fetch_new_epochs(chain_head) == []
+    assert calls.call_count == 0
+
+
+def test_fetch_without_initiated_change(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    initialize_validators(contract)
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    fetcher.fetch_new_epochs()
+
+    mine_until(w3, tester, 110)
+    calls = record_calls(tester)
+    assert fetcher.fetch_new_epochs() == []
+    assert calls.call_count == 0
+    assert fetcher.last_fetch_height == 110
+
+
+def test_fetch_change_finalized_later(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    initialize_validators(contract)
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    fetcher.fetch_new_epochs()
+
+    mine_until(w3, tester, 105)
+    validators = [get_random_address() for _ in range(2)]
+    w3.eth.waitForTransactionReceipt(
+        contract.functions.testChangeValiatorSet(validators).transact()
+    )
+    assert fetcher.fetch_new_epochs() == []
+
+    mine_until(w3, tester, 110)
+    receipt = w3.eth.waitForTransactionReceipt(
+        contract.functions.testFinalizeChange().transact()
+    )
+    assert fetcher.fetch_new_epochs() == [Epoch(receipt["blockNumber"], validators, 0)]
+
+
+def test_fetch_many_updates_from_logs(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    validators = initialize_validators(contract)
+    expected_epochs = [Epoch(100, validators, 0)]
+    mine_until(w3, tester, 100)
+    for _ in range(MIN_NEW_EPOCHS_FOR_LOG_DISCOVERY + 1):
+        mine_until(w3, tester, w3.eth.blockNumber + 5)
+        validators, height = change_validators(contract)
+        expected_epochs.append(Epoch(height, validators, 0))
+
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    calls = record_calls(tester)
+    assert fetcher.fetch_new_epochs() == expected_epochs
+    # finalized, getEpochStartHeights and the validators of each epoch to verify them
+    assert calls.call_count == 2 + len(expected_epochs)
+
+
+def test_fetch_logs_of_new_epochs_only(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    initialize_validators(contract)
+    mine_until(w3, tester, 100)
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    fetcher.fetch_new_epochs()
+
+    new_epochs = []
+    for _ in range(MIN_NEW_EPOCHS_FOR_LOG_DISCOVERY):
+        mine_until(w3, tester, w3.eth.blockNumber + 5)
+        validators, height = change_validators(contract)
+        new_epochs.append(Epoch(height, validators, 0))
+
+    get_logs = Mock(wraps=fetcher._get_initiate_change_logs)
+    fetcher._get_initiate_change_logs = get_logs  # type: ignore
+    assert fetcher.fetch_new_epochs() == new_epochs
+    assert get_logs.call_args == call(
+        new_epochs[0].start_height, new_epochs[-1].start_height
+    )
+
+
+def test_verify_each_validator_set_from_logs(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    validators = initialize_validators(contract)
+    expected_epochs = [Epoch(100, validators, 0)]
+    mine_until(w3, tester, 100)
+    for _ in range(MIN_NEW_EPOCHS_FOR_LOG_DISCOVERY + 1):
+        mine_until(w3, tester, w3.eth.blockNumber + 5)
+        validators, height = change_validators(contract)
+        expected_epochs.append(Epoch(height, validators, 0))
+
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    get_logs = fetcher._get_initiate_change_logs
+
+    def get_logs_with_wrong_first_set(from_block, to_block):
+        first_log, *other_logs = get_logs(from_block, to_block)
+        wrong_args = AttributeDict(
+            dict(first_log.args, _newSet=[Web3.toChecksumAddress(get_random_address())])
+        )
+        return [AttributeDict(dict(first_log, args=wrong_args))] + other_logs
+
+    fetcher._get_initiate_change_logs = get_logs_with_wrong_first_set  # type: ignore
+    assert fetcher.fetch_new_epochs() == expected_epochs
+
+
+def test_fetch_empty_validator_set_from_logs(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    validators = initialize_validators(contract)
+    expected_epochs = [Epoch(100, validators, 0)]
+    mine_until(w3, tester, 100)
+    for index in range(MIN_NEW_EPOCHS_FOR_LOG_DISCOVERY + 1):
+        mine_until(w3, tester, w3.eth.blockNumber + 5)
+        # an empty validator set is discovered from the logs as well
+        validators, height = change_validators(contract, [] if index == 1 else None)
+        expected_epochs.append(Epoch(height, validators, 0))
+
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0)
+    assert fetcher.fetch_new_epochs() == expected_epochs
+
+
+def test_batched_contract_calls_equal_single_calls(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[0]
+    )
+    initialize_validators(contract)
+    mine_until(w3, tester, w3.eth.blockNumber + 5)
+    change_validators(contract)
+
+    epoch_start_heights = contract.functions.getEpochStartHeights().call()
+    contract_functions = [contract.functions.getEpochStartHeights()] + [
+        contract.functions.getValidators(epoch_start_height)
+        for epoch_start_height in epoch_start_heights
+    ]
+    block_number = w3.eth.blockNumber
+    assert call_contract_functions(w3, contract_functions, block_number) == [
+        contract_function.call(block_identifier=block_number)
+        for contract_function in contract_functions
+    ]
+
+
+def test_fetch_change_initiated_in_reorg(w3, tester, validator_set_contract):
+    val_def, (contract,) = initialize_scenario(
+        validator_set_contract, transition_heights=[100]
+    )
+    initialize_validators(contract)
+    fetcher = ContractEpochFetcher(w3, val_def[0], 0, max_reorg_depth=10)
+
+    mine_until(w3, tester, 105)
+    fork_snapshot_id = tester.take_snapshot()
+    mine_until(w3, tester, 110)
+    assert len(fetcher.fetch_new_epochs()) == 1
+
+    # the reorg replaces blocks up to the last fetch height with a change of validators
+    tester.revert_to_snapshot(fork_snapshot_id)
+    validators, height = change_validators(contract)
+    assert height <= 110
+    mine_until(w3, tester, 112)
+
+    assert fetcher.fetch_new_epochs() == [Epoch(height, validators, 0)]
@@ -1,8 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import time
+
 import pytest
 from unittest.mock import Mock, call
 
-from monitor.block_fetcher import BlockFetcher, FetchingForkWithUnkownBaseError
+from monitor import block_fetcher as block_fetcher_module
+from monitor import blocks as blocks_module
+from monitor.block_fetcher import (
+    BlockFetcher,
+    FetchingForkWithUnkownBaseError,
+    prefetch,
+)
+from monitor.blocks import get_block_header
 from monitor.blocksel import ResolveBlockByNumber, ResolveGenesisBlock
+from monitor.chain_head import ChainHead
 
 
 @pytest.fixture
@@ -27,7 +40,7 @@ def block_fetcher(w3, empty_db, report_callback, max_reorg_depth):
 def test_genesis(w3, block_fetcher):
     genesis = w3.eth.getBlock(0)
     block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=1)
-    assert block_fetcher.head == genesis
+    assert block_fetcher.head == get_block_header(genesis)
 
 
 def test_fetch_single_blocks(eth_tester, block_fetcher, report_callback):
@@ -53,6 +66,62 @@ def test_fetch_multiple_blocks(eth_tester, block_fetcher, report_callback):
     ]
 
 
+@pytest.mark.parametrize(
+    "rpc_batch_size, max_concurrent_requests", [(2, 1), (500, 1), (1, 3), (2, 3)]
+)
+def test_fetch_multiple_blocks_in_batches(
+    w3, eth_tester, empty_db, report_callback, rpc_batch_size, max_concurrent_requests
+):
+    block_fetcher = BlockFetcher.from_fresh_state(
+        w3,
+        empty_db,
+        max_reorg_depth=3,
+        rpc_batch_size=rpc_batch_size,
+        max_concurrent_requests=max_concurrent_requests,
+    )
+    block_fetcher.register_report_callback(report_callback)
+
+    eth_tester.mine_blocks(9)
+    assert block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=7) == 7
+    assert block_fetcher.head.number == 6
+    assert report_callback.call_args_list == [
+        call(get_block_header(w3.eth.getBlock(number))) for number in range(7)
+    ]
+
+
+def test_prefetch_keeps_order():
+    def slow_identity(argument):
+        time.sleep((argument % 3) / 100)
+        return argument
+
+    assert list(prefetch(slow_identity, range(20), concurrency=4)) == list(range(20))
+
+
+def test_prefetch_limits_calls_in_progress():
+    lock = threading.Lock()
+    calls = []
+    calls_in_progress = 0
+    max_calls_in_progress = 0
+
+    def tracked_identity(argument):
+        nonlocal calls_in_progress, max_calls_in_progress
+        with lock:
+            calls.append(argument)
+            calls_in_progress += 1
+            max_calls_in_progress = max(max_calls_in_progress, calls_in_progress)
+        time.sleep(0.01)
+        with lock:
+            calls_in_progress -= 1
+        return argument
+
+    results = prefetch(tracked_identity, itertools.count(), concurrency=3)
+    assert list(itertools.islice(results, 5)) == list(range(5))
+    results.close()
+
+    assert max_calls_in_progress <= 3
+    assert len(calls) <= 5 + 3
+
+
 def test_number_of_fetched_blocks(eth_tester, block_fetcher):
     eth_tester.mine_blocks(8)
     assert (
@@ -81,6 +150,20 @@ def test_max_block_height_of_fetched_blocks(
     assert block_fetcher.head.number == max_block_height
 
 
+def test_sync_to_given_chain_head(eth_tester, w3, block_fetcher, monkeypatch):
+    eth_tester.mine_blocks(8)
+
+    def fail():
+        raise AssertionError("the block number should be taken from the chain head")
+
+    monkeypatch.setattr(type(w3.eth), "blockNumber", property(lambda eth: fail()))
+
+    chain_head = ChainHead(number=5)
+    assert block_fetcher.fetch_and_insert_new_blocks(chain_head=chain_head) == 6
+    assert block_fetcher.head.number == 5
+    assert block_fetcher.get_sync_status(chain_head) == 1
+
+
 def test_fail_to_sync_from_block_number_that_does_not_exist(block_fetcher):
     # Work on the chain with only the genesis block.
     block_fetcher.initial_block_resolver = ResolveBlockByNumber(1)
@@ -95,20 +178,20 @@ def test_forward_backward_sync_transition(eth_tester, block_fetcher, report_call
     # forward sync until block 5
     assert block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=6) == 6
     assert block_fetcher.head.number == 5
-    assert len(block_fetcher.current_branch) == 0
+    assert block_fetcher.branch_length == 0
     assert report_callback.call_count == 6
     report_callback.reset_mock()
 
     # sync blocks 6 to 7 forwards, start backward sync with block 10
     assert block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=3) == 3
     assert block_fetcher.head.number == 7
-    assert len(block_fetcher.current_branch) == 1
+    assert block_fetcher.branch_length == 1
     assert report_callback.call_count == 2
     report_callback.reset_mock()
 
     # finish backward sync (block 8 and 9)
     assert block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=2) == 2
-    assert len(block_fetcher.current_branch) == 0
+    assert block_fetcher.branch_length == 0
     assert block_fetcher.head.number == 10
     assert report_callback.call_count == 3
     report_callback.reset_mock()
@@ -169,14 +252,14 @@ def test_noticed_reorg(w3, eth_tester, block_fetcher, report_callback):
     # mine some common blocks
     common_hashes = [0]  # genesis
     common_hashes.extend(eth_tester.mine_blocks(2, coinbase=coinbase1))
-    common_reports = [call(w3.eth.getBlock(h)) for h in common_hashes]
+    common_reports = [call(get_block_header(w3.eth.getBlock(h))) for h in common_hashes]
 
     # point of fork
     fork_snapshot_id = eth_tester.take_snapshot()
 
     # mine some blocks on fork A
     fork_a_hashes = eth_tester.mine_blocks(2, coinbase=coinbase1)
-    fork_a_reports = [call(w3.eth.getBlock(h)) for h in fork_a_hashes]
+    fork_a_reports = [call(get_block_header(w3.eth.getBlock(h))) for h in fork_a_hashes]
 
     # fetch
     block_fetcher.fetch_and_insert_new_blocks()
@@ -184,7 +267,7 @@ def test_noticed_reorg(w3, eth_tester, block_fetcher, report_callback):
     # mine on fork B
     eth_tester.revert_to_snapshot(fork_snapshot_id)
     fork_b_hashes = eth_tester.mine_blocks(2, coinbase=coinbase2)
-    fork_b_reports = [call(w3.eth.getBlock(h)) for h in fork_b_hashes]
+    fork_b_reports = [call(get_block_header(w3.eth.getBlock(h))) for h in fork_b_hashes]
 
     # fetch again
     block_fetcher.fetch_and_insert_new_blocks()
@@ -325,20 +408,20 @@ def test_rediscovered_reorg(w3, eth_tester, block_fetcher, report_callback):
     # mine some common blocks
     common_hashes = [0]  # genesis
     common_hashes.extend(eth_tester.mine_blocks(2, coinbase=coinbase1))
-    common_reports = [call(w3.eth.getBlock(h)) for h in common_hashes]
+    common_reports = [call(get_block_header(w3.eth.getBlock(h))) for h in common_hashes]
 
     # point of fork
     fork_snapshot_id = eth_tester.take_snapshot()
 
     # mine some blocks on fork A
     fork_a_hashes = eth_tester.mine_blocks(2, coinbase=coinbase1)
-    fork_a_reports = [call(w3.eth.getBlock(h)) for h in fork_a_hashes]
+    fork_a_reports = [call(get_block_header(w3.eth.getBlock(h))) for h in fork_a_hashes]
     fork_a_head_snapshot_id = eth_tester.take_snapshot()
 
     # mine on fork B
     eth_tester.revert_to_snapshot(fork_snapshot_id)
     fork_b_hashes = eth_tester.mine_blocks(2, coinbase=coinbase2)
-    fork_b_reports = [call(w3.eth.getBlock(h)) for h in fork_b_hashes]
+    fork_b_reports = [call(get_block_header(w3.eth.getBlock(h))) for h in fork_b_hashes]
 
     # fetch (will not find hidden fork A)
     block_fetcher.fetch_and_insert_new_blocks()
@@ -346,7 +429,9 @@ def test_rediscovered_reorg(w3, eth_tester, block_fetcher, report_callback):
     # mine on A again to discover all blocks there
     eth_tester.revert_to_snapshot(fork_a_head_snapshot_id)
     new_fork_a_hashes = eth_tester.mine_blocks(2, coinbase=coinbase1)
-    new_fork_a_reports = [call(w3.eth.getBlock(h)) for h in new_fork_a_hashes]
+    new_fork_a_reports = [
+        call(get_block_header(w3.eth.getBlock(h))) for h in new_fork_a_hashes
+    ]
 
     # fetch and see fork A reappear
     block_fetcher.fetch_and_insert_new_blocks()
@@ -360,7 +445,7 @@ def test_state_generation(eth_tester, block_fetcher):
     block_fetcher.fetch_and_insert_new_blocks()
 
     assert block_fetcher.state.head == block_fetcher.head
-    assert block_fetcher.state.current_branch == block_fetcher.current_branch
+    assert block_fetcher.state.initial_blocknr == block_fetcher.initial_blocknr
 
 
 def test_restart(w3, eth_tester, block_fetcher, report_callback):
@@ -369,7 +454,7 @@ def test_restart(w3, eth_tester, block_fetcher, report_callback):
     report_callback.reset_mock()
 
     new_block_hashes = eth_tester.mine_blocks(3)
-    reports = [call(w3.eth.getBlock(h)) for h in new_block_hashes]
+    reports = [call(get_block_header(w3.eth.getBlock(h))) for h in new_block_hashes]
     restarted_block_fetcher = BlockFetcher(block_fetcher.state, w3, block_fetcher.db)
     restarted_block_fetcher.register_report_callback(report_callback)
     restarted_block_fetcher.fetch_and_insert_new_blocks()
@@ -380,7 +465,7 @@ def test_restart(w3, eth_tester, block_fetcher, report_callback):
 def test_restart_with_fetch(w3, eth_tester, block_fetcher, report_callback):
     new_block_hashes = [0]  # genesis
     new_block_hashes.extend(eth_tester.mine_blocks(6))
-    reports = [call(w3.eth.getBlock(h)) for h in new_block_hashes]
+    reports = [call(get_block_header(w3.eth.getBlock(h))) for h in new_block_hashes]
     block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=4)
 
     restarted_block_fetcher = BlockFetcher(block_fetcher.state, w3, block_fetcher.db)
@@ -422,5 +507,116 @@ def test_restart_with_reorg(w3, eth_tester, block_fetcher, report_callback):
     restarted_block_fetcher.register_report_callback(report_callback)
     restarted_block_fetcher.fetch_and_insert_new_blocks()
     assert report_callback.call_args_list == [
-        call(w3.eth.getBlock(h)) for h in early_fork_a_hashes + late_fork_a_hashes
+        call(get_block_header(w3.eth.getBlock(h)))
+        for h in early_fork_a_hashes + late_fork_a_hashes
+    ]
+
+
+# with a large max reorg depth, blocks are only synced backwards
+@pytest.mark.parametrize("max_reorg_depth", [10])
+def test_restart_with_staged_branch(w3, eth_tester, block_fetcher, report_callback):
+    new_block_hashes = eth_tester.mine_blocks(6)
+
+    # fetch genesis and sync backwards in several cycles
+    for _ in range(3):
+        block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=2)
+        assert len(block_fetcher.db.load_branch()) == block_fetcher.branch_length
+    assert block_fetcher.branch_length == 5
+    assert [block.number for block in block_fetcher.db.load_branch()] == [
+        6,
+        5,
+        4,
+        3,
+        2,
+    ]
+    report_callback.reset_mock()
+
+    restarted_block_fetcher = BlockFetcher(block_fetcher.state, w3, block_fetcher.db)
+    restarted_block_fetcher.register_report_callback(report_callback)
+    restarted_block_fetcher.fetch_and_insert_new_blocks()
+
+    assert restarted_block_fetcher.head.number == 6
+    assert restarted_block_fetcher.branch_length == 0
+    assert block_fetcher.db.load_branch() == []
+    assert report_callback.call_args_list == [
+        call(get_block_header(w3.eth.getBlock(h))) for h in new_block_hashes
+    ]
+
+
+@pytest.mark.parametrize("max_reorg_depth", [10])
+def test_insert_staged_branch_in_chunks(
+    w3, eth_tester, block_fetcher, report_callback, monkeypatch
+):
+    monkeypatch.setattr(block_fetcher_module, "BRANCH_INSERT_CHUNK_SIZE", 2)
+    new_block_hashes = eth_tester.mine_blocks(7)
+
+    block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=1)
+    report_callback.reset_mock()
+
+    # the whole branch is fetched, but only its oldest chunk is inserted
+    assert block_fetcher.fetch_and_insert_new_blocks() == 7
+    assert block_fetcher.head.number == 2
+    assert block_fetcher.branch_length == 5
+
+    # each call inserts the next chunk
+    assert block_fetcher.fetch_and_insert_new_blocks() == 2
+    assert block_fetcher.head.number == 4
+    assert block_fetcher.fetch_and_insert_new_blocks() == 2
+    assert block_fetcher.fetch_and_insert_new_blocks() == 1
+    assert block_fetcher.head.number == 7
+    assert block_fetcher.db.load_branch() == []
+    assert block_fetcher.fetch_and_insert_new_blocks() == 0
+
+    assert report_callback.call_args_list == [
+        call(get_block_header(w3.eth.getBlock(h))) for h in new_block_hashes
+    ]
+
+
+@pytest.mark.parametrize("max_reorg_depth", [10])
+def test_restart_between_staged_branch_chunks(
+    w3, eth_tester, block_fetcher, report_callback, monkeypatch
+):
+    monkeypatch.setattr(block_fetcher_module, "BRANCH_INSERT_CHUNK_SIZE", 2)
+    new_block_hashes = eth_tester.mine_blocks(5)
+
+    block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=1)
+    report_callback.reset_mock()
+    block_fetcher.fetch_and_insert_new_blocks()
+    assert block_fetcher.head.number == 2
+
+    restarted_block_fetcher = BlockFetcher(block_fetcher.state, w3, block_fetcher.db)
+    restarted_block_fetcher.register_report_callback(report_callback)
+    assert restarted_block_fetcher.branch_length == 3
+    while restarted_block_fetcher.fetch_and_insert_new_blocks() > 0:
+        pass
+
+    assert restarted_block_fetcher.head.number == 5
+    assert restarted_block_fetcher.db.load_branch() == []
+    assert report_callback.call_args_list == [
+        call(get_block_header(w3.eth.getBlock(h))) for h in new_block_hashes
+    ]
+
+
+def test_recover_proposers_of_backwards_synced_blocks_at_once(
+    w3, eth_tester, empty_db, report_callback, monkeypatch
+):
+    monkeypatch.setattr(blocks_module, "MIN_PARALLEL_RECOVERY_BATCH_SIZE", 2)
+    new_block_hashes = eth_tester.mine_blocks(7)
+
+    with ThreadPoolExecutor(max_workers=2) as thread_pool_executor:
+        executor = Mock(wraps=thread_pool_executor)
+        block_fetcher = BlockFetcher.from_fresh_state(
+            w3, empty_db, max_reorg_depth=10, executor=executor
+        )
+        block_fetcher.register_report_callback(report_callback)
+        block_fetcher.fetch_and_insert_new_blocks(max_number_of_blocks=1)
+        executor.reset_mock()
+        report_callback.reset_mock()
+
+        assert block_fetcher.fetch_and_insert_new_blocks() == 7
+
+    # the staged headers are inserted without recovering the proposers again
+    assert executor.map.call_count == 1
+    assert report_callback.call_args_list == [
+        call(get_block_header(w3.eth.getBlock(h))) for h in new_block_hashes
     ]
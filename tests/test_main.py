@@ -0,0 +1,138 @@
+import pytest
+from web3.datastructures import AttributeDict
+
+from monitor import skip_reporter
+from monitor.block_fetcher import BlockFetcherStateV1, BlockFetcherStateV3
+from monitor.blocks import get_block_header, get_block_headers
+from monitor.chain_head import ChainHead
+from monitor.main import (
+    APP_STATE_KEY,
+    MAX_REORG_DEPTH,
+    App,
+    AppStateV2,
+    AppStateV6,
+)
+from monitor.offline_reporter import (
+    OfflineInterval,
+    OfflineReporterStateV2,
+    OfflineReporterStateV3,
+    OfflineWindow,
+)
+from monitor.skip_reporter import SkippedProposal, SkipReporterStateV2
+from monitor.validators import Epoch, FetchedContractEpochs, PrimaryOracle
+
+from tests.data_generation import make_branch, random_address
+
+
+@pytest.fixture
+def app(empty_db):
+    """an app that only has the db initialized"""
+    app = App.__new__(App)
+    app.db = empty_db
+    app._unfinalized_contract_epochs = {}
+    return app
+
+
+def test_store_only_final_contract_epochs(app, empty_db, validators):
+    contract_address = random_address()
+    early_epoch = Epoch(100, validators, 1)
+    late_epoch = Epoch(MAX_REORG_DEPTH + 200, validators[:1], 1)
+
+    # the late epoch might still be replaced by a reorg
+    app._store_final_contract_epochs(
+        [
+            FetchedContractEpochs(
+                1,
+                contract_address,
+                50,
+                MAX_REORG_DEPTH + 300,
+                [early_epoch, late_epoch],
+            )
+        ],
+        ChainHead(number=MAX_REORG_DEPTH + 300),
+    )
+    assert empty_db.load_fetched_contract_epochs() == [
+        FetchedContractEpochs(1, contract_address, 50, 300, [early_epoch])
+    ]
+
+    # it is stored once it is final, although it is not fetched again
+    app._store_final_contract_epochs(
+        [FetchedContractEpochs(1, contract_address, 50, 2 * MAX_REORG_DEPTH + 300, [])],
+        ChainHead(number=2 * MAX_REORG_DEPTH + 300),
+    )
+    assert empty_db.load_fetched_contract_epochs() == [
+        FetchedContractEpochs(
+            1, contract_address, 50, MAX_REORG_DEPTH + 300, [early_epoch, late_epoch]
+        )
+    ]
+
+
+@pytest.fixture
+def offline_windows():
+    return [OfflineWindow(size=100, allowed_skip_rate=0.5)]
+
+
+def restore_app(db, offline_windows):
+    """create an app that restores its reporters from the given db"""
+    app = App.__new__(App)
+    app.db = db
+    app.w3 = None
+    app.initial_block_resolver = None
+    app.rpc_batch_size = 1
+    app.max_concurrent_requests = 1
+    app.recovery_executor = None
+    app.primary_oracle = PrimaryOracle()
+    app._restore_reporters(upgrade_db=False, offline_windows=offline_windows)
+    return app
+
+
+def test_migrate_legacy_app_state(empty_db, validators, offline_windows):
+    # the blocks as returned by web3, without the private keys of the test data
+    head, *branch = [
+        AttributeDict({key: value for key, value in block.items() if key != "privkey"})
+        for block in make_branch(4)
+    ]
+    skip_reporter_state = SkipReporterStateV2(
+        latest_step=20,
+        open_skipped_proposals={SkippedProposal(10, 5), SkippedProposal(11, 5)},
+    )
+    empty_db.store_pickled(
+        APP_STATE_KEY,
+        AppStateV2(
+            block_fetcher_state=BlockFetcherStateV1(
+                head=head, current_branch=list(reversed(branch)), initial_blocknr=0
+            ),
+            skip_reporter_state=skip_reporter_state,
+            offline_reporter_state=OfflineReporterStateV2(
+                reported_validators={validators[0]},
+                recent_offline_intervals_by_validator={
+                    validators[1]: [OfflineInterval(8, 3)]
+                },
+                offline_time_by_validator={validators[1]: 3},
+            ),
+        ),
+    )
+
+    app = restore_app(empty_db, offline_windows)
+
+    assert empty_db.load_pickled(APP_STATE_KEY) is None
+    assert empty_db.load_branch() == get_block_headers(list(reversed(branch)))
+    assert app.block_fetcher.branch_length == 3
+
+    expected_app_state = AppStateV6(
+        block_fetcher_state=BlockFetcherStateV3(
+            head=get_block_header(head), initial_blocknr=0
+        ),
+        skip_reporter_state=skip_reporter.upgrade_v2_to_v3(skip_reporter_state),
+        offline_reporter_state=OfflineReporterStateV3(
+            recent_offline_intervals_by_validator={
+                validators[1]: [OfflineInterval(8, 3)]
+            },
+            reported_validators_by_window_size={100: {validators[0]}},
+        ),
+    )
+    assert app.app_state == expected_app_state
+
+    restarted_app = restore_app(empty_db, offline_windows)
+    assert restarted_app.app_state == expected_app_state
+    assert restarted_app.block_fetcher.branch_length == 3
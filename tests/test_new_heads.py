@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from monitor import new_heads
+from monitor.new_heads import HeadPoller, HeadSubscription
+
+SUBSCRIPTION_ID = "0x9cef478923ff08bf67fde6c64013158d"
+
+
+class FakeIPCNode:
+    """Serve eth_subscribe on a unix socket and send head notifications on demand"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.loop = asyncio.new_event_loop()
+        self.writers = []
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(
+            asyncio.start_unix_server(self._handle, path=self.path), self.loop
+        ).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _handle(self, reader, writer):
+        request = json.loads(await reader.read(4096))
+        assert request["method"] == "eth_subscribe"
+        assert request["params"] == ["newHeads"]
+        writer.write(
+            json.dumps(
+                {"jsonrpc": "2.0", "id": request["id"], "result": SUBSCRIPTION_ID}
+            ).encode()
+        )
+        self.writers.append(writer)
+
+    def announce_head(self):
+        async def send():
+            for writer in self.writers:
+                writer.write(
+                    json.dumps(
+                        {
+                            "jsonrpc": "2.0",
+                            "method": "eth_subscription",
+                            "params": {"subscription": SUBSCRIPTION_ID, "result": {}},
+                        }
+                    ).encode()
+                )
+
+        asyncio.run_coroutine_threadsafe(send(), self.loop).result()
+
+
+@pytest.fixture
+def fake_node(tmp_path):
+    fake_node = FakeIPCNode(tmp_path / "node.ipc")
+    fake_node.start()
+    yield fake_node
+    fake_node.stop()
+
+
+def wait_until_subscribed(subscription):
+    for _ in range(100):
+        if subscription.subscribed:
+            return
+        time.sleep(0.01)
+    raise AssertionError("Not subscribed")
+
+
+def test_poller_waits_for_interval():
+    start = time.monotonic()
+    assert not HeadPoller(poll_interval=0.05).wait_for_new_head()
+    assert time.monotonic() - start >= 0.05
+
+
+def test_subscription_wakes_up_on_new_head(fake_node):
+    subscription = HeadSubscription(fake_node.path, poll_interval=0.05, timeout=10)
+    subscription.start()
+    wait_until_subscribed(subscription)
+    # heads that arrived before subscribing are not known, so the first wait returns immediately
+    assert subscription.wait_for_new_head()
+
+    fake_node.announce_head()
+    start = time.monotonic()
+    assert subscription.wait_for_new_head()
+    assert time.monotonic() - start < 5
+
+
+def test_subscription_times_out_without_new_head(fake_node):
+    subscription = HeadSubscription(fake_node.path, poll_interval=10, timeout=0.05)
+    subscription.start()
+    wait_until_subscribed(subscription)
+    assert subscription.wait_for_new_head()
+
+    assert not subscription.wait_for_new_head()
+
+
+def test_fall_back_to_polling_without_subscription(tmp_path):
+    subscription = HeadSubscription(
+        str(tmp_path / "missing.ipc"), poll_interval=0.05, timeout=10
+    )
+    subscription.start()
+    start = time.monotonic()
+    assert not subscription.wait_for_new_head()
+    assert not subscription.subscribed
+    assert time.monotonic() - start < 5
+
+
+def test_reconnect_after_unexpected_error(fake_node, monkeypatch):
+    monkeypatch.setattr(new_heads, "RECONNECT_INTERVAL", 0.01)
+    subscribe = HeadSubscription._subscribe
+    failures = []
+
+    async def fail_once(self):
+        if not failures:
+            failures.append(True)
+            raise asyncio.TimeoutError()
+        await subscribe(self)
+
+    monkeypatch.setattr(HeadSubscription, "_subscribe", fail_once)
+
+    subscription = HeadSubscription(fake_node.path, poll_interval=0.05, timeout=10)
+    subscription.start()
+    wait_until_subscribed(subscription)
+    assert failures
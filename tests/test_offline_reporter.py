@@ -3,7 +3,13 @@ import itertools
 
 from unittest.mock import Mock
 
-from monitor.offline_reporter import OfflineReporter
+from monitor.offline_reporter import (
+    OfflineInterval,
+    OfflineReporter,
+    OfflineReporterStateV2,
+    OfflineWindow,
+    upgrade_v2_to_v3,
+)
 from monitor.skip_reporter import SkippedProposal
 
 OFFLINE_WINDOW_SIZE = 20
@@ -26,8 +32,7 @@ def assigned_steps(primary_oracle):
 def offline_reporter(validators, primary_oracle):
     return OfflineReporter.from_fresh_state(
         primary_oracle=primary_oracle,
-        offline_window_size=OFFLINE_WINDOW_SIZE,
-        allowed_skip_rate=ALLOWED_SKIP_RATE,
+        offline_windows=[OfflineWindow(OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE)],
     )
 
 
@@ -116,8 +121,7 @@ def test_reporting_after_restart(validators, offline_reporter, primary_oracle):
     restarted_offline_reporter = OfflineReporter(
         state=offline_reporter.state,
         primary_oracle=primary_oracle,
-        offline_window_size=OFFLINE_WINDOW_SIZE,
-        allowed_skip_rate=ALLOWED_SKIP_RATE,
+        offline_windows=[OfflineWindow(OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE)],
     )
     report_callback = Mock()
     restarted_offline_reporter.register_report_callback(report_callback)
@@ -128,3 +132,166 @@ def test_reporting_after_restart(validators, offline_reporter, primary_oracle):
 
     restarted_offline_reporter(validators[0], SkippedProposal(step=24, block_height=16))
     report_callback.assert_not_called()
+
+
+def test_outdated_offline_intervals_are_cleared(validators, offline_reporter):
+    for i, step in enumerate([0, 3]):
+        offline_reporter(validators[0], SkippedProposal(step, step - i))
+    offline_reporter(validators[1], SkippedProposal(step=10, block_height=8))
+    assert (
+        offline_reporter.window_trackers[0].offline_time_by_validator[validators[0]] > 0
+    )
+
+    offline_reporter(
+        validators[1], SkippedProposal(step=3 + OFFLINE_WINDOW_SIZE + 1, block_height=9)
+    )
+
+    assert (
+        offline_reporter.window_trackers[0].offline_time_by_validator[validators[0]]
+        == 0
+    )
+    assert (
+        validators[0]
+        not in offline_reporter.state.recent_offline_intervals_by_validator
+    )
+    assert [
+        offline_interval.step
+        for offline_interval in offline_reporter.state.recent_offline_intervals_by_validator[
+            validators[1]
+        ]
+    ] == [10, 3 + OFFLINE_WINDOW_SIZE + 1]
+    assert len(offline_reporter.offline_interval_queue) == 2
+
+
+def test_report_per_offline_window(validators, primary_oracle):
+    offline_reporter = OfflineReporter.from_fresh_state(
+        primary_oracle=primary_oracle,
+        offline_windows=[
+            OfflineWindow(2 * OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE),
+            OfflineWindow(OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE),
+        ],
+    )
+    small_window_callback = Mock()
+    large_window_callback = Mock()
+    offline_reporter.register_report_callback(
+        small_window_callback, window_size=OFFLINE_WINDOW_SIZE
+    )
+    offline_reporter.register_report_callback(
+        large_window_callback, window_size=2 * OFFLINE_WINDOW_SIZE
+    )
+
+    offline_validator = validators[0]
+    steps = list(range(0, 40, 3))
+    for i, step in enumerate(steps):
+        offline_reporter(offline_validator, SkippedProposal(step, step - i))
+
+    small_window_callback.assert_called_once_with(offline_validator, [0, 3, 6, 9])
+    large_window_callback.assert_called_once_with(
+        offline_validator, [0, 3, 6, 9, 12, 15, 18]
+    )
+    # the validator has been reported in every window, so its skips are not kept anymore
+    assert (
+        offline_validator
+        not in offline_reporter.state.recent_offline_intervals_by_validator
+    )
+
+
+def test_offline_windows_share_offline_intervals(validators, primary_oracle):
+    offline_reporter = OfflineReporter.from_fresh_state(
+        primary_oracle=primary_oracle,
+        offline_windows=[
+            OfflineWindow(OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE),
+            OfflineWindow(2 * OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE),
+        ],
+    )
+    for i, step in enumerate([0, 6, 12, 21, 27, 45]):
+        offline_reporter(validators[0], SkippedProposal(step, step - i))
+
+    # only the intervals within the largest window are kept
+    assert [
+        offline_interval.step
+        for offline_interval in offline_reporter.recent_offline_intervals_by_validator[
+            validators[0]
+        ]
+    ] == [6, 12, 21, 27, 45]
+    # both windows use the same queue of intervals
+    assert [step for step, _, _ in offline_reporter.offline_interval_queue] == [
+        6,
+        12,
+        21,
+        27,
+        45,
+    ]
+    small_window_tracker, large_window_tracker = offline_reporter.window_trackers
+    assert small_window_tracker.first_offline_interval_index == 3
+    assert large_window_tracker.first_offline_interval_index == 0
+    assert small_window_tracker.offline_time_by_validator[validators[0]] == 2 * len(
+        validators
+    )
+    assert large_window_tracker.offline_time_by_validator[validators[0]] == 5 * len(
+        validators
+    )
+
+
+def test_reported_validators_per_window_after_restart(validators, primary_oracle):
+    offline_windows = [
+        OfflineWindow(OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE),
+        OfflineWindow(4 * OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE),
+    ]
+    offline_reporter = OfflineReporter.from_fresh_state(
+        primary_oracle=primary_oracle, offline_windows=offline_windows
+    )
+    offline_validator = validators[0]
+    for i, step in enumerate([0, 3, 6, 9]):
+        offline_reporter(offline_validator, SkippedProposal(step, step - i))
+
+    restarted_offline_reporter = OfflineReporter(
+        state=offline_reporter.state,
+        primary_oracle=primary_oracle,
+        offline_windows=offline_windows,
+    )
+    small_window_callback = Mock()
+    large_window_callback = Mock()
+    restarted_offline_reporter.register_report_callback(
+        small_window_callback, window_size=OFFLINE_WINDOW_SIZE
+    )
+    restarted_offline_reporter.register_report_callback(
+        large_window_callback, window_size=4 * OFFLINE_WINDOW_SIZE
+    )
+
+    steps = list(range(12, 90, 3))
+    for i, step in enumerate(steps):
+        restarted_offline_reporter(offline_validator, SkippedProposal(step, step - i))
+
+    small_window_callback.assert_not_called()
+    large_window_callback.assert_called_once()
+
+
+def test_offline_window_sizes_must_be_distinct(primary_oracle):
+    with pytest.raises(ValueError):
+        OfflineReporter.from_fresh_state(
+            primary_oracle=primary_oracle,
+            offline_windows=[
+                OfflineWindow(OFFLINE_WINDOW_SIZE, ALLOWED_SKIP_RATE),
+                OfflineWindow(OFFLINE_WINDOW_SIZE, 2 * ALLOWED_SKIP_RATE),
+            ],
+        )
+
+
+def test_upgrade_v2_to_v3(validators):
+    v2 = OfflineReporterStateV2(
+        reported_validators={validators[0]},
+        recent_offline_intervals_by_validator={
+            validators[1]: [OfflineInterval(3, 4), OfflineInterval(7, 4)]
+        },
+        offline_time_by_validator={validators[0]: 12, validators[1]: 8},
+    )
+
+    v3 = upgrade_v2_to_v3(v2, OFFLINE_WINDOW_SIZE)
+
+    assert v3.recent_offline_intervals_by_validator == {
+        validators[1]: [OfflineInterval(3, 4), OfflineInterval(7, 4)]
+    }
+    assert v3.reported_validators_by_window_size == {
+        OFFLINE_WINDOW_SIZE: {validators[0]}
+    }
@@ -99,3 +99,31 @@ def test_get_too_far_ahead():
     primary_oracle.max_height = 5
     with pytest.raises(ValueError):
         primary_oracle.get_primary(height=6, step=0)
+
+
+def test_lookup_after_adding_epoch_within_last_hit():
+    primary_oracle = PrimaryOracle()
+    primary_oracle.add_epoch(Epoch(0, [VALIDATOR1], 0))
+    primary_oracle.max_height = 10
+    assert primary_oracle.get_primary(height=8, step=0) == VALIDATOR1
+
+    primary_oracle.add_epoch(Epoch(5, [VALIDATOR2], 0))
+    assert primary_oracle.get_primary(height=8, step=0) == VALIDATOR2
+    assert primary_oracle.get_primary(height=4, step=0) == VALIDATOR1
+
+
+def test_lookup_alternating_between_epochs():
+    primary_oracle = PrimaryOracle()
+    primary_oracle.add_epoch(Epoch(0, [VALIDATOR1], 0))
+    primary_oracle.add_epoch(Epoch(5, [VALIDATOR2], 0))
+    primary_oracle.add_epoch(Epoch(10, [VALIDATOR3], 0))
+    primary_oracle.max_height = 20
+    for height, validator in [
+        (20, VALIDATOR3),
+        (5, VALIDATOR2),
+        (9, VALIDATOR2),
+        (10, VALIDATOR3),
+        (4, VALIDATOR1),
+        (0, VALIDATOR1),
+    ]:
+        assert primary_oracle.get_primary(height=height, step=0) == validator
@@ -0,0 +1,84 @@
+import pytest
+from click.testing import CliRunner
+from eth_utils import encode_hex
+from sqlalchemy import create_engine
+from structlog.testing import capture_logs
+
+from monitor.db import BlockDB
+from monitor.main import DB_FILE_NAME, format_skip, query_skips
+
+
+@pytest.fixture
+def skips(validators):
+    return [(validators[0], 10), (validators[1], 20), (validators[0], 30)]
+
+
+@pytest.fixture
+def db_dir(tmp_path, skips):
+    block_db = BlockDB(create_engine(f"sqlite:////{tmp_path / DB_FILE_NAME}"))
+    for validator, step in skips:
+        block_db.insert_skip(validator, step)
+    return tmp_path
+
+
+def run_query_skips(*args):
+    # keep log messages of background threads left by other tests out of the output
+    with capture_logs():
+        return CliRunner().invoke(query_skips, args)
+
+
+def test_query_all_skips(db_dir, skips):
+    result = run_query_skips("--db-dir", str(db_dir))
+
+    assert result.exit_code == 0
+    assert result.output == "".join(format_skip(*skip) for skip in skips)
+
+
+def test_query_skips_of_validator(db_dir, skips, validators):
+    result = run_query_skips(
+        "--db-dir", str(db_dir), "--validator", encode_hex(validators[0])
+    )
+
+    assert result.exit_code == 0
+    assert result.output == format_skip(*skips[0]) + format_skip(*skips[2])
+
+
+def test_query_skips_in_date_range(db_dir, skips):
+    # the steps are 5 seconds long, step 20 starts at 00:01:40
+    result = run_query_skips(
+        "--db-dir",
+        str(db_dir),
+        "--since",
+        "1970-01-01T00:01:40",
+        "--until",
+        "1970-01-01T00:02:30",
+    )
+
+    assert result.exit_code == 0
+    assert result.output == format_skip(*skips[1])
+
+
+def test_query_skips_without_db(tmp_path):
+    result = run_query_skips("--db-dir", str(tmp_path))
+
+    assert result.exit_code == 1
+    assert "No database found" in result.output
+    assert not (tmp_path / DB_FILE_NAME).exists()
+
+
+def test_query_skips_does_not_upgrade_db(tmp_path):
+    db_path = tmp_path / DB_FILE_NAME
+    with create_engine(f"sqlite:////{db_path}").begin() as connection:
+        connection.execute(
+            "CREATE TABLE skips (validator VARCHAR(20) NOT NULL, step INTEGER NOT NULL, "
+            "PRIMARY KEY (validator, step))"
+        )
+
+    result = run_query_skips("--db-dir", str(tmp_path))
+
+    assert result.exit_code == 0
+    assert result.output == ""
+    with create_engine(f"sqlite:////{db_path}").connect() as connection:
+        assert connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ).fetchall() == [("skips",)]
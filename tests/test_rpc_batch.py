@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from eth_utils import to_bytes, to_hex
+from web3 import HTTPProvider, Web3
+
+from monitor import rpc_batch
+from monitor.rpc_batch import get_blocks, make_batch_request
+
+
+def raw_block(number):
+    block_hash = to_hex(number.to_bytes(32, "big"))
+    parent_hash = to_hex(max(number - 1, 0).to_bytes(32, "big"))
+    return {
+        "number": hex(number),
+        "hash": block_hash,
+        "parentHash": parent_hash,
+        "timestamp": hex(1000 + number),
+        "gasLimit": "0x0",
+        "gasUsed": "0x0",
+        "difficulty": "0x1",
+        "transactions": [],
+        "step": str(200 + number),
+        "sealFields": ["0x", "0x"],
+    }
+
+
+def answer(request):
+    if request["method"] != "eth_getBlockByNumber":
+        return {
+            "jsonrpc": "2.0",
+            "id": request["id"],
+            "error": {"code": -32601, "message": "Method not found"},
+        }
+    number = int(request["params"][0], 16)
+    result = raw_block(number) if number < 10 else None
+    return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+
+@pytest.fixture
+def posted_data():
+    return []
+
+
+@pytest.fixture
+def http_w3(monkeypatch, posted_data):
+    """web3 connected via HTTP to a fake node that knows blocks 0 to 9"""
+
+    def fake_make_post_request(endpoint_uri, data, **kwargs):
+        posted_data.append(json.loads(data))
+        request = json.loads(data)
+        if isinstance(request, list):
+            # answer in reverse order to check that responses are matched by id
+            response = [answer(single_request) for single_request in reversed(request)]
+        else:
+            response = answer(request)
+        return to_bytes(text=json.dumps(response))
+
+    monkeypatch.setattr("web3.providers.rpc.make_post_request", fake_make_post_request)
+    monkeypatch.setattr(rpc_batch, "make_post_request", fake_make_post_request)
+
+    return Web3(HTTPProvider("http://localhost:8540"))
+
+
+def test_get_blocks_equals_get_block(w3, eth_tester):
+    eth_tester.mine_blocks(5)
+    assert get_blocks(w3, range(6)) == [w3.eth.getBlock(number) for number in range(6)]
+
+
+def test_get_blocks_by_hash(w3, eth_tester):
+    block_hashes = eth_tester.mine_blocks(3)
+    assert get_blocks(w3, block_hashes) == [
+        w3.eth.getBlock(block_hash) for block_hash in block_hashes
+    ]
+
+
+def test_http_single_batch(http_w3, posted_data):
+    blocks = get_blocks(http_w3, range(5))
+
+    assert len(posted_data) == 1
+    assert [request["params"] for request in posted_data[0]] == [
+        [hex(number), False] for number in range(5)
+    ]
+    assert blocks == [http_w3.eth.getBlock(number) for number in range(5)]
+
+
+def test_http_missing_block(http_w3):
+    assert get_blocks(http_w3, [9, 10]) == [http_w3.eth.getBlock(9), None]
+
+
+def test_http_batch_error(http_w3):
+    with pytest.raises(ValueError):
+        make_batch_request(http_w3, [("eth_blockNumber", [])])
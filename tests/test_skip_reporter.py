@@ -3,7 +3,14 @@ from unittest.mock import Mock, call
 
 from web3.datastructures import AttributeDict
 
-from monitor.skip_reporter import SkipReporter, SkippedProposal
+from monitor.skip_reporter import (
+    SkipReporter,
+    SkipReporterStateV2,
+    SkipReporterStateV3,
+    SkippedProposal,
+    SkippedStepRange,
+    upgrade_v2_to_v3,
+)
 
 
 @pytest.fixture
@@ -183,3 +190,111 @@ def test_no_repeated_report_after_restart(primary_oracle, report_callback):
     for step in range(28, 100):
         restarted_skip_reporter(mock_block(step, number=step - 1))
     report_callback.assert_not_called()
+
+
+def test_skips_filled_by_fork_are_not_reported(primary_oracle, report_callback):
+    skip_reporter = SkipReporter(
+        state=SkipReporter.get_fresh_state(),
+        primary_oracle=primary_oracle,
+        grace_period=10,
+    )
+    skip_reporter.register_report_callback(report_callback)
+
+    skip_reporter(mock_block(1, number=1))
+    # steps 2 to 9 are skipped
+    skip_reporter(mock_block(10, number=2))
+    # a block on a fork is found for step 5
+    skip_reporter(mock_block(5, number=2))
+    assert {proposal.step for proposal in skip_reporter.open_skipped_proposals} == {
+        2,
+        3,
+        4,
+        6,
+        7,
+        8,
+        9,
+    }
+
+    for step in range(11, 21):
+        skip_reporter(mock_block(step, number=step - 8))
+
+    assert [args[0][1].step for args in report_callback.call_args_list] == [
+        2,
+        3,
+        4,
+        6,
+        7,
+        8,
+        9,
+    ]
+    assert skip_reporter.open_skipped_proposals == set()
+
+
+def test_state_keeps_open_skipped_proposals(primary_oracle):
+    skip_reporter = SkipReporter(
+        state=SkipReporter.get_fresh_state(),
+        primary_oracle=primary_oracle,
+        grace_period=100,
+    )
+    skip_reporter(mock_block(1, number=1))
+    skip_reporter(mock_block(5, number=2))
+
+    state = skip_reporter.state
+    assert state == SkipReporterStateV3(
+        latest_step=5, open_skipped_step_ranges=[SkippedStepRange(2, 4, 2)]
+    )
+    restarted_skip_reporter = SkipReporter(
+        state=state, primary_oracle=primary_oracle, grace_period=100
+    )
+    assert restarted_skip_reporter.state == state
+
+
+def test_long_gap_is_stored_as_single_range(primary_oracle, report_callback):
+    skip_reporter = SkipReporter(
+        state=SkipReporter.get_fresh_state(),
+        primary_oracle=primary_oracle,
+        grace_period=10000,
+    )
+    skip_reporter.register_report_callback(report_callback)
+
+    skip_reporter(mock_block(1, number=1))
+    skip_reporter(mock_block(5000, number=2))
+    assert skip_reporter.state.open_skipped_step_ranges == [
+        SkippedStepRange(2, 4999, 2)
+    ]
+
+    # a block on a fork splits the range
+    skip_reporter(mock_block(100, number=2))
+    assert skip_reporter.state.open_skipped_step_ranges == [
+        SkippedStepRange(2, 99, 2),
+        SkippedStepRange(101, 4999, 2),
+    ]
+
+    # after the grace period, the skips before the block at step 5000 are reported
+    skip_reporter(mock_block(15000, number=3))
+    assert report_callback.call_count == 4998 - 1
+    assert skip_reporter.state.open_skipped_step_ranges == [
+        SkippedStepRange(5001, 14999, 3)
+    ]
+
+
+def test_upgrade_v2_to_v3():
+    v2 = SkipReporterStateV2(
+        latest_step=20,
+        open_skipped_proposals={
+            SkippedProposal(2, 1),
+            SkippedProposal(3, 1),
+            SkippedProposal(4, 1),
+            SkippedProposal(6, 1),
+            SkippedProposal(7, 2),
+            SkippedProposal(8, 2),
+        },
+    )
+    assert upgrade_v2_to_v3(v2) == SkipReporterStateV3(
+        latest_step=20,
+        open_skipped_step_ranges=[
+            SkippedStepRange(2, 4, 1),
+            SkippedStepRange(6, 6, 1),
+            SkippedStepRange(7, 8, 2),
+        ],
+    )